@@ -24,6 +24,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-w)7*@^iu6c(js3f4s71=qe!gkt$sx(s^_8==x=-%60ipor^ysb'
 
+# Keys the order ID permutation in store.order_ids. Never change this once
+# orders exist, or new order IDs may collide with ones already issued.
+ORDER_ID_SECRET = config('ORDER_ID_SECRET', default='scribi-order-id-v1')
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 
@@ -48,7 +52,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',     # if using tokens
+        'store.authentication.CachedTokenAuthentication',     # hashed ApiTokens, cached
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -57,11 +61,13 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'store.metrics.RequestMetricsMiddleware',  # first, so it times everything below
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.carts.GuestCartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_browser_reload.middleware.BrowserReloadMiddleware',
@@ -71,7 +77,7 @@ ROOT_URLCONF = 'stationary.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'store.backends.templates.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -98,6 +104,29 @@ DATABASES = {
     }
 }
 
+# Cart summaries and the versioned catalog cache live here. LocMem is per
+# process; use the file-based backend (or a shared cache) when running
+# several workers so invalidations are seen by all of them.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='scribi'),
+    }
+}
+
+# Delivery charge tiers for store.pricing: (minimum subtotal, charge). The
+# highest minimum the cart subtotal reaches applies.
+DELIVERY_RULES = [
+    (1000, 0),
+    (0, 100),
+]
+
+# Request metrics (store.metrics). The Prometheus endpoint sits next to the
+# admin; scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+SERVER_TIMING_HEADER = config('SERVER_TIMING_HEADER', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -162,7 +191,14 @@ AWS_S3_USE_SSL = True
 AWS_QUERYSTRING_AUTH = False  # So URLs don't require token
 AWS_S3_SIGNATURE_VERSION = 's3v4'  # Required for eu-north-1 region
 
-# S3 Object Parameters
+# Connection pool and upload concurrency shared by the media/static storages
+AWS_S3_MAX_POOL_CONNECTIONS = config('AWS_S3_MAX_POOL_CONNECTIONS', default=10, cast=int)
+AWS_S3_MAX_CONCURRENCY = config('AWS_S3_MAX_CONCURRENCY', default=4, cast=int)  # threads per upload
+AWS_S3_MULTIPART_THRESHOLD = config('AWS_S3_MULTIPART_THRESHOLD', default=8 * 1024 * 1024, cast=int)
+AWS_S3_MULTIPART_CHUNKSIZE = config('AWS_S3_MULTIPART_CHUNKSIZE', default=8 * 1024 * 1024, cast=int)
+AWS_S3_STATIC_UPLOAD_WORKERS = config('AWS_S3_STATIC_UPLOAD_WORKERS', default=8, cast=int)  # collectstatic
+
+# S3 Object Parameters (content-hashed static files get a year, immutable)
 AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400',
 }
@@ -19,9 +19,11 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from store import views as store_views
+from store.metrics import metrics_view
 from django.conf.urls import handler404
 
 urlpatterns = [
+    path('scribi-secure-admin-panel-9051/metrics/', metrics_view, name='metrics'),
     path('scribi-secure-admin-panel-9051/', admin.site.urls),
 
     # Authentication at the root
@@ -0,0 +1,135 @@
+# store/accounts.py
+"""
+Account creation with one write per table.
+
+``create_account`` is the signup path. The user, their profile and,
+optionally, their API token are each inserted exactly once in one
+transaction; a new token's key is left on the user as ``api_key``. The
+filled-in profile rides along on the user as ``_new_profile``, and the
+``create_user_profile`` receiver saves that profile instead of an empty one
+that would be updated straight after. The password is hashed before the
+transaction opens, so no locks are held while PBKDF2 runs.
+
+``provision_accounts`` creates accounts in bulk from customer lists, such as
+``manage.py provision_accounts``. Each batch costs one query for existing
+usernames and one multi-row INSERT per table. Passwords are hashed on a
+thread pool, which runs in parallel because ``hashlib`` releases the GIL
+while it hashes.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from .authentication import hash_key, new_key
+from .models import ApiToken, Profile
+
+PROFILE_FIELDS = ('phone_number', 'address_line1', 'address_line2', 'city', 'postal_code', 'country')
+DEFAULT_BATCH_SIZE = 500
+
+
+def new_user(username, email, password, first_name='', last_name=''):
+    """
+    An unsaved user, normalized and hashed the way ``create_user`` does it.
+    A ``None`` password makes it unusable.
+    """
+    return User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        first_name=first_name or '',
+        last_name=last_name or '',
+        password=make_password(password),
+    )
+
+
+def create_account(username, email, password, first_name='', last_name='', token=False, **profile):
+    """
+    Creates a user with their ``Profile`` (from the ``PROFILE_FIELDS`` in
+    ``profile``) and, with ``token=True``, an API token.
+    """
+    user = new_user(username, email, password, first_name, last_name)
+    user._new_profile = Profile(**profile)
+    with transaction.atomic():
+        user.save()
+        if token:
+            user.api_key = new_key()
+            ApiToken.objects.create(user=user, digest=hash_key(user.api_key))
+    return user
+
+
+def provision_accounts(rows, batch_size=DEFAULT_BATCH_SIZE, workers=None, tokens=None):
+    """
+    Creates an account for each dict in ``rows`` (``username``, ``email``,
+    optional ``password``, ``first_name``, ``last_name`` and
+    ``PROFILE_FIELDS``), committing every ``batch_size`` rows. Rows
+    without a password get an unusable one. Usernames that exist already,
+    or repeat, are skipped.
+
+    With ``tokens``, every new account also gets an API token and
+    ``tokens(username, key)`` is called with its key after the batch
+    commits, as the keys are not stored.
+
+    Returns ``(created, skipped)``: a count and the skipped usernames.
+    """
+    rows = iter(rows)
+    created, skipped = 0, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return created, skipped
+            count, duplicates = _provision_batch(batch, pool, tokens)
+            created += count
+            skipped += duplicates
+
+
+def _provision_batch(batch, pool, tokens):
+    new, skipped = {}, []
+    for row in batch:
+        username = User.normalize_username(row['username'])
+        if username in new:
+            skipped.append(username)
+        else:
+            new[username] = row
+    for username in User.objects.filter(username__in=new).values_list('username', flat=True):
+        skipped.append(username)
+        del new[username]
+    if not new:
+        return 0, skipped
+
+    passwords = pool.map(make_password, [row.get('password') or None for row in new.values()])
+    users = [
+        User(
+            username=username,
+            email=User.objects.normalize_email(row.get('email') or ''),
+            first_name=row.get('first_name') or '',
+            last_name=row.get('last_name') or '',
+            password=password,
+        )
+        for (username, row), password in zip(new.items(), passwords)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # MySQL reports no ids for a multi-row INSERT.
+            ids = dict(User.objects.filter(username__in=new).values_list('username', 'pk'))
+            for user in users:
+                user.pk = ids[user.username]
+        # bulk_create sends no post_save, so create_user_profile stays out
+        # of the way.
+        Profile.objects.bulk_create([
+            Profile(user=user, **{field: new[user.username][field] for field in PROFILE_FIELDS
+                                  if new[user.username].get(field) is not None})
+            for user in users
+        ])
+        if tokens:
+            keys = {user.username: new_key() for user in users}
+            ApiToken.objects.bulk_create([
+                ApiToken(user=user, digest=hash_key(keys[user.username])) for user in users
+            ])
+    if tokens:
+        for username, key in keys.items():
+            tokens(username, key)
+    return len(users), skipped
@@ -1,24 +1,76 @@
 # File: store/admin.py
 from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.urls import reverse
+from django.utils import timezone
+from .cart_summary import bump_price_version
+from .catalog_cache import bump_catalog_version
+from .exports import streaming_export
+from .pagination import EstimatedCountPaginator
+from .search import filter_by_search
 from .models import (
     Category, Product,
     Cart, CartItem,
     Order, OrderItem,
     Profile, ProductImage,
-    Announcement
+    Announcement, OutboundEmail, ImageVariantSet, ApiToken
 )
 
+# ——— CHANGELIST DEFAULTS ———————————————————————————————————————————
+
+class FastChangeListMixin:
+    """
+    Changelist defaults that stay fast on large tables: no exact COUNT(*)
+    of the whole table (``EstimatedCountPaginator``, no full result count)
+    and every foreign key in ``list_display`` joined instead of fetched
+    once per row. Set ``list_select_related`` to override the joins.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_list_select_related(self, request):
+        if self.list_select_related is not False:
+            return self.list_select_related
+        related = []
+        for name in self.list_display:
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.many_to_one or field.one_to_one:
+                related.append(name)
+        return related
+
+
+class ModelAdmin(FastChangeListMixin, admin.ModelAdmin):
+    pass
+
+
+def update_action(name, description, message, **values):
+    """
+    An admin action that applies ``values`` to the selection in one UPDATE.
+    Callable values (e.g. ``timezone.now``) are evaluated per run.
+    """
+    def action(modeladmin, request, queryset):
+        updated = queryset.update(**{
+            field: value() if callable(value) else value for field, value in values.items()
+        })
+        modeladmin.message_user(request, message.format(count=updated))
+    action.__name__ = name
+    action.short_description = description
+    return action
+
 # ——— CATEGORY & PRODUCT —————————————————————————————————————————
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(ModelAdmin):
     list_display   = ('name', 'slug')
     prepopulated_fields = {'slug': ('name',)}
     search_fields  = ('name',)
 
 @admin.register(Announcement)
-class AnnouncementAdmin(admin.ModelAdmin):
+class AnnouncementAdmin(ModelAdmin):
     list_display = ('message', 'active')  # shows both fields in list view
     list_filter = ('active',)
     search_fields = ('message',)
@@ -29,13 +81,40 @@ class ProductImageInline(admin.TabularInline):
     extra = 1
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ModelAdmin):
     inlines = [ProductImageInline]
     list_display   = ('name', 'category', 'price', 'stock', 'available','discount_percentage', 'created_at')
     list_filter    = ('available', 'category', 'created_at')
     list_editable = ('price', 'stock','discount_percentage', 'available')
     prepopulated_fields = {'slug': ('name',)}
     search_fields  = ('name', 'description')
+    autocomplete_fields = ('category',)
+    actions        = ['make_available', 'make_unavailable']
+
+    @admin.action(description="Mark selected products as available")
+    def make_available(self, request, queryset):
+        self.set_available(request, queryset, True)
+
+    @admin.action(description="Mark selected products as unavailable")
+    def make_unavailable(self, request, queryset):
+        self.set_available(request, queryset, False)
+
+    def set_available(self, request, queryset, available):
+        updated = queryset.update(available=available, updated_at=timezone.now())
+        # update() sends no post_save, so cached catalog pages and cart
+        # subtotals are dropped here.
+        bump_catalog_version()
+        bump_price_version()
+        self.message_user(request, f"{updated} product(s) updated.")
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the product search index instead of icontains scans.
+        # Autocomplete widgets search as the admin types, so a partial last
+        # word has to match too.
+        if not search_term:
+            return queryset, False
+        prefix = request.path == reverse('admin:autocomplete')
+        return filter_by_search(queryset, search_term, prefix=prefix), False
 
 # ——— CART & CART ITEM ————————————————————————————————————————————
 
@@ -43,27 +122,95 @@ class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 1
     readonly_fields = ('added_at',)
+    autocomplete_fields = ('product',)
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(ModelAdmin):
     list_display   = ('user', 'created_at')
     inlines        = [CartItemInline]
     search_fields  = ('user__username',)
+    autocomplete_fields = ('user',)
 
 # ——— ORDER & ORDER ITEM —————————————————————————————————————————
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1
-    readonly_fields = ()
+    readonly_fields = ('product_name', 'product_slug', 'product_image')
+    autocomplete_fields = ('product',)
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ModelAdmin):
     list_display   = ('id', 'full_name', 'status', 'total_price', 'created_at')
     list_filter    = ('status', 'created_at')
     search_fields  = ('full_name', 'email', 'phone_number')
     inlines        = [OrderItemInline]
+    autocomplete_fields = ('user',)
+    actions        = [
+        update_action(
+            f'mark_{status}',
+            f"Mark selected orders as {label.lower()}",
+            f"{{count}} order(s) marked as {label.lower()}.",
+            status=status, updated_at=timezone.now,
+        )
+        for status, label in Order.STATUS_CHOICES
+    ] + ['export_csv', 'export_jsonl']
+
+    @admin.action(description="Export selected orders as CSV", permissions=['view'])
+    def export_csv(self, request, queryset):
+        return streaming_export(queryset, 'csv')
+
+    @admin.action(description="Export selected orders as JSON lines", permissions=['view'])
+    def export_jsonl(self, request, queryset):
+        return streaming_export(queryset, 'jsonl')
+
+# ——— EMAIL OUTBOX ——————————————————————————————————————————————
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(ModelAdmin):
+    list_display   = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter    = ('status',)
+    search_fields  = ('subject',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions        = ['requeue']
+
+    @admin.action(description="Requeue selected emails")
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} email(s) requeued.")
+
+
+@admin.register(ImageVariantSet)
+class ImageVariantSetAdmin(ModelAdmin):
+    list_display   = ('source', 'status', 'attempts', 'processed_at')
+    list_filter    = ('status',)
+    search_fields  = ('source',)
+    readonly_fields = ('variants', 'created_at', 'processed_at', 'last_error')
+    actions        = ['requeue']
+
+    @admin.action(description="Regenerate selected variants")
+    def requeue(self, request, queryset):
+        updated = queryset.update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} image(s) requeued.")
+
+# ——— API TOKENS ————————————————————————————————————————————————
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(ModelAdmin):
+    """
+    Only the key's hash is stored, so tokens are issued by logging in, not
+    here. Deleting one revokes it at once.
+    """
+    list_display   = ('user', 'created')
+    search_fields  = ('user__username', 'user__email')
+    readonly_fields = ('user', 'created')
+    date_hierarchy = 'created'
+
+    def has_add_permission(self, request):
+        return False
 
 # ——— PROFILE ————————————————————————————————————————————————
 
@@ -95,7 +242,7 @@ from django.contrib.auth.admin import UserAdmin as DefaultUserAdmin
 admin.site.unregister(User)
 
 @admin.register(User)
-class UserAdmin(DefaultUserAdmin):
+class UserAdmin(FastChangeListMixin, DefaultUserAdmin):
     inlines = [ProfileInline]
 
 
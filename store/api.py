@@ -0,0 +1,128 @@
+# store/api.py
+"""
+Read-only catalog API for the mobile client.
+
+Lists use cursor pagination, every endpoint accepts ``?fields=`` for sparse
+fieldsets, and responses carry ``ETag``/``Last-Modified`` validators. A
+conditional GET whose validators still match is answered with 304 before
+any page is loaded or serialised. The aggregate behind the validators is
+cached per catalog version and path, so it runs once per catalog change
+rather than on every request.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Prefetch
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import viewsets
+from rest_framework.pagination import CursorPagination
+
+from .catalog_cache import cached_catalog, get_catalog_version
+from .models import Announcement, Category, Product, ProductImage
+from .serializers import AnnouncementSerializer, CategorySerializer, ProductSerializer, requested_fields
+
+
+class CatalogCursorPagination(CursorPagination):
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class IdCursorPagination(CatalogCursorPagination):
+    ordering = ('id',)
+
+
+class ConditionalGetMixin:
+    """
+    Adds ``ETag`` and ``Last-Modified`` to list and detail responses and
+    short-circuits to 304 when the client's copy is current.
+
+    The validators come from the catalog version (bumped on every catalog
+    save/delete), the newest ``updated_at`` and the row count of the
+    filtered queryset, and the full request path (cursor, fields, filters).
+    The count and newest ``updated_at`` scan the whole filtered queryset, so
+    they are cached under the catalog version and path. Checkout bumps the
+    version too (``checkout.reserve_stock``), so ``stock`` is never served
+    stale under an old ETag.
+    """
+    updated_field = None
+
+    def get_stats(self, queryset):
+        aggregates = {'count': Count('pk')}
+        if self.updated_field:
+            aggregates['last_modified'] = Max(self.updated_field)
+        return queryset.order_by().aggregate(**aggregates)
+
+    def get_validators(self, queryset):
+        version = get_catalog_version()
+        path = self.request.get_full_path()
+        stats = cached_catalog(
+            f"api-stats:{hashlib.md5(path.encode()).hexdigest()}",
+            lambda: self.get_stats(queryset), version,
+        )
+        last_modified = stats.get('last_modified')
+        raw = ':'.join(str(part) for part in (
+            version, stats['count'],
+            last_modified.isoformat() if last_modified else '', path,
+        ))
+        etag = f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+        return etag, last_modified.timestamp() if last_modified else None
+
+    def conditional(self, queryset, respond):
+        etag, last_modified = self.get_validators(queryset)
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = respond()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional(queryset, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        queryset = self.filter_queryset(self.get_queryset()).filter(**lookup)
+        return self.conditional(queryset, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+
+class CategoryViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+    pagination_class = IdCursorPagination
+    lookup_field = 'slug'
+
+
+class ProductViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Available products, optionally filtered with ``?category=<slug>``.
+    """
+    serializer_class = ProductSerializer
+    pagination_class = CatalogCursorPagination
+    lookup_field = 'slug'
+    updated_field = 'updated_at'
+
+    def get_queryset(self):
+        queryset = Product.objects.filter(available=True).select_related('category')
+        fields = requested_fields(self.request)
+        if fields is None or 'images' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=ProductImage.objects.order_by('id'))
+            )
+        return queryset
+
+    def filter_queryset(self, queryset):
+        category = self.request.query_params.get('category')
+        if category:
+            queryset = queryset.filter(category__slug=category)
+        return queryset
+
+
+class AnnouncementViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Announcement.objects.filter(active=True)
+    serializer_class = AnnouncementSerializer
+    pagination_class = IdCursorPagination
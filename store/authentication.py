@@ -0,0 +1,201 @@
+# store/authentication.py
+"""
+Hashed, cached token authentication for the API.
+
+Clients send ``Authorization: Token <key>``. Only the SHA-256 of a key is
+stored (``ApiToken.digest``), so a leaked row or database dump cannot be
+replayed. ``issue_token`` hands out keys at login and signup; the key is
+shown once.
+
+Resolving a key normally costs no query. Each process keeps an LRU of
+recently used keys (``LOCAL_SIZE`` entries, ``LOCAL_TTL`` seconds) in front
+of the shared cache, which keeps the user's fields for ``CACHE_TIMEOUT``.
+Every entry records the user's token version at the time it was filled.
+A request is served from an entry only if the version still matches,
+which costs one small cache read.
+
+``invalidate_user_tokens`` bumps that version once the surrounding
+transaction commits. The receivers in ``store.signals`` call it when a
+token is deleted, or when its user is saved or deleted. So a deleted token
+or a deactivated user is refused on the next request, in every process.
+Code that changes users with ``QuerySet.update()`` must call it directly.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .metrics import cache_hit, cache_miss
+from .models import ApiToken
+
+LOCAL_SIZE = 10_000
+LOCAL_TTL = 60
+CACHE_TIMEOUT = 60 * 60
+# Logins issue a new key each time; older ones beyond this are revoked.
+MAX_TOKENS_PER_USER = 5
+# What authentication and permission checks read. The password hash is
+# deliberately left out of both caches; other columns load on access.
+# Kept in model field order, which User.from_db expects.
+USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {'id', 'username', 'is_active', 'is_staff', 'is_superuser', 'email', 'first_name', 'last_name'}
+]
+
+
+def new_key():
+    return secrets.token_hex(20)
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_token(user):
+    """
+    Creates a token for ``user``, revokes all but their newest
+    ``MAX_TOKENS_PER_USER``, and returns the key.
+    """
+    key = new_key()
+    ApiToken.objects.create(user=user, digest=hash_key(key))
+    stale = list(
+        ApiToken.objects.filter(user=user).order_by('-created', '-pk')
+        .values_list('pk', flat=True)[MAX_TOKENS_PER_USER:]
+    )
+    if stale:
+        ApiToken.objects.filter(pk__in=stale).delete()
+    return key
+
+
+class LocalCache:
+    """
+    A thread-safe LRU whose entries expire ``ttl`` seconds after being set.
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LocalCache(LOCAL_SIZE, LOCAL_TTL)
+
+
+def _version_key(user_id):
+    return f"api-token-version:{user_id}"
+
+
+def _entry_key(digest):
+    # Renamed when USER_FIELDS dropped the password, so no entry from
+    # before is read.
+    return f"api-user:{digest}"
+
+
+def token_version(user_id):
+    """
+    Returns the user's token version, starting a new one if it was evicted.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Always ahead of versions issued before the key was lost (see
+        # catalog_cache.get_catalog_version).
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(user_id):
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        token_version(user_id)
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Makes every cached entry for ``user_id``'s tokens stale once the
+    current transaction commits, so the next request re-reads them.
+    """
+    transaction.on_commit(partial(_bump, user_id))
+
+
+def _user(values):
+    return User.from_db('default', USER_FIELDS, values)
+
+
+def authenticate_key(key):
+    """
+    Returns a fresh ``User`` for ``key``, or ``None`` if it is not a valid key.
+    Columns outside ``USER_FIELDS`` are deferred.
+    """
+    digest = hash_key(key)
+    entry = _local.get(digest)
+    if entry is not None and cache.get(_version_key(entry[0])) == entry[1]:
+        cache_hit()
+        return _user(entry[2])
+
+    entry = cache.get(_entry_key(digest))
+    if entry is not None and cache.get(_version_key(entry[0])) == entry[1]:
+        cache_hit()
+        _local.set(digest, entry)
+        return _user(entry[2])
+
+    cache_miss()
+    user_id = ApiToken.objects.filter(digest=digest).values_list('user_id', flat=True).first()
+    if user_id is None:
+        return None
+    # Read before the user, so a change committed in between leaves this
+    # entry under an old version.
+    version = token_version(user_id)
+    values = User.objects.filter(pk=user_id).values_list(*USER_FIELDS).first()
+    if values is None:
+        return None
+    entry = (user_id, version, values)
+    cache.set(_entry_key(digest), entry, CACHE_TIMEOUT)
+    _local.set(digest, entry)
+    return _user(values)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    DRF's ``TokenAuthentication`` header handling over ``ApiToken`` and the
+    caches above. ``request.auth`` is ``None``.
+    """
+    def authenticate_credentials(self, key):
+        user = authenticate_key(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, None
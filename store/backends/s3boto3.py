@@ -1,8 +1,135 @@
 # File: store/backends/s3boto3.py
-from storages.backends.s3boto3 import S3Boto3Storage
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import unquote, urlsplit
+
+import botocore
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+logger = logging.getLogger(__name__)
+
+URL_CACHE_SIZE = 8192
+# Names produced by ManifestFilesMixin.hashed_name(): "app.3f2a9c1b7d4e.css".
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DELETE_BATCH_SIZE = 1000
+
+_session_lock = threading.Lock()
+_sessions = {}
+_resources = threading.local()
+
 
-class MediaStorage(S3Boto3Storage):
+class SharedConnectionS3Storage(S3Boto3Storage):
+    """
+    S3 storage whose instances share their boto3 session and connections.
+
+    The stock backend builds a new boto3 session and resource (and with it a
+    new HTTP connection pool) for every storage instance in every thread.
+    Here one session per set of credentials is created per process, and
+    each thread keeps one resource per endpoint that every storage instance
+    reuses. Public URLs (``querystring_auth=False``) are a pure function of
+    the key, so they are memoised per instance.
+    """
+    max_pool_connections = getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 10)
+    max_concurrency = getattr(settings, 'AWS_S3_MAX_CONCURRENCY', 4)
+    multipart_threshold = getattr(settings, 'AWS_S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)
+    multipart_chunksize = getattr(settings, 'AWS_S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client_config = self.client_config.merge(
+            Config(max_pool_connections=max(self.max_pool_connections, self.max_concurrency))
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+            use_threads=self.max_concurrency > 1,
+        )
+        self._public_url = lru_cache(maxsize=URL_CACHE_SIZE)(super().url)
+        logger.debug(
+            "%s using bucket %s, location %r, custom domain %s",
+            type(self).__name__, self.bucket_name, self.location, self.custom_domain,
+        )
+
+    def _create_session(self):
+        if self.session_profile:
+            key = ('profile', self.session_profile)
+        else:
+            key = (self.access_key, self.secret_key, self.security_token)
+        with _session_lock:
+            if key not in _sessions:
+                _sessions[key] = super()._create_session()
+            return _sessions[key]
+
+    def _shared_resource(self, signed):
+        key = (
+            signed, self.session_profile, self.access_key, self.secret_key, self.security_token,
+            self.region_name, self.endpoint_url, self.use_ssl, self.verify,
+            self.signature_version, self.addressing_style, self.max_pool_connections,
+        )
+        resources = getattr(_resources, 'resources', None)
+        if resources is None:
+            resources = _resources.resources = {}
+        if key not in resources:
+            config = self.client_config
+            if not signed:
+                config = config.merge(Config(signature_version=botocore.UNSIGNED))
+            session = self._create_session()
+            # boto3 sessions are not safe to build clients from concurrently.
+            with _session_lock:
+                resources[key] = session.resource(
+                    's3',
+                    region_name=self.region_name,
+                    use_ssl=self.use_ssl,
+                    endpoint_url=self.endpoint_url,
+                    config=config,
+                    verify=self.verify,
+                )
+        return resources[key]
+
+    @property
+    def connection(self):
+        return self._shared_resource(signed=True)
+
+    @property
+    def bucket(self):
+        # Resources are per thread, so the Bucket must come from this
+        # thread's resource rather than being cached on the instance.
+        return self.connection.Bucket(self.bucket_name)
+
+    @property
+    def unsigned_connection(self):
+        return self._shared_resource(signed=False)
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if self.querystring_auth or parameters or http_method:
+            return super().url(name, parameters, expire, http_method)
+        return self._public_url(name)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_public_url', None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._public_url = lru_cache(maxsize=URL_CACHE_SIZE)(super().url)
+
+
+class MediaStorage(SharedConnectionS3Storage):
     """
     Custom S3 storage class for media files (user uploads)
     """
@@ -11,37 +138,170 @@ class MediaStorage(S3Boto3Storage):
     access_key = settings.AWS_ACCESS_KEY_ID
     secret_key = settings.AWS_SECRET_ACCESS_KEY
     custom_domain = settings.AWS_S3_CUSTOM_DOMAIN
-    
+
     # Media files configuration
     location = 'media'  # This creates a 'media' folder in your S3 bucket
     default_acl = None
     file_overwrite = False  # Don't overwrite files with same name
     querystring_auth = False
-    
+
+
+class IncrementalUploadMixin:
+    """
+    Makes repeated ``collectstatic`` runs upload only what changed.
+
+    The bucket prefix is listed once, and ``exists()`` and
+    ``get_modified_time()`` are answered from that listing instead of one
+    HEAD request per file. A file whose MD5 matches the remote ETag is not
+    uploaded again; changed files are uploaded from a thread pool. Deletes
+    are deferred, so the delete-then-save collectstatic does for every
+    copied file costs nothing when the content is unchanged. ``flush()``
+    waits for pending uploads and applies the remaining deletes in batches.
+    """
+    upload_workers = getattr(settings, 'AWS_S3_STATIC_UPLOAD_WORKERS', 8)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        print(f"MediaStorage initialized with bucket: {self.bucket_name}")
-        print(f"Location: {self.location}")
-        print(f"Custom domain: {self.custom_domain}")
+        self._remote_files = None
+        self._deleted = {}
+        self._pending = {}
+        self._executor = None
+
+    def list_remote(self):
+        """
+        Yields ``(name, etag, last_modified)`` for every object under the
+        storage location.
+        """
+        prefix = f"{self.location}/" if self.location else ''
+        for obj in self.bucket.objects.filter(Prefix=prefix):
+            yield obj.key[len(prefix):], obj.e_tag.strip('"'), obj.last_modified
+
+    def upload(self, name, content):
+        return super()._save(name, content)
+
+    def delete_remote(self, names):
+        for start in range(0, len(names), DELETE_BATCH_SIZE):
+            self.bucket.delete_objects(Delete={
+                'Objects': [
+                    {'Key': self._normalize_name(name)}
+                    for name in names[start:start + DELETE_BATCH_SIZE]
+                ],
+                'Quiet': True,
+            })
+
+    @property
+    def remote_files(self):
+        if self._remote_files is None:
+            self._remote_files = {
+                name: (etag, last_modified) for name, etag, last_modified in self.list_remote()
+            }
+        return self._remote_files
+
+    def wait(self, name):
+        future = self._pending.pop(name, None)
+        if future is not None:
+            future.result()
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        try:
+            for future in pending.values():
+                future.result()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        if self._deleted:
+            self.delete_remote(sorted(self._deleted))
+            self._deleted = {}
+
+    def exists(self, name):
+        return clean_name(name) in self.remote_files
+
+    def get_modified_time(self, name):
+        try:
+            last_modified = self.remote_files[clean_name(name)][1]
+        except KeyError:
+            raise FileNotFoundError(f"File does not exist: {name}")
+        return last_modified if settings.USE_TZ else timezone.make_naive(last_modified)
 
-class StaticStorage(S3Boto3Storage):
+    def delete(self, name):
+        name = clean_name(name)
+        self.wait(name)
+        entry = self.remote_files.pop(name, None)
+        if entry is not None:
+            self._deleted[name] = entry
+
+    def _open(self, name, mode='rb'):
+        self.wait(clean_name(name))
+        return super()._open(name, mode)
+
+    def _save(self, name, content):
+        name = clean_name(name)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        data = content.read()
+        if isinstance(data, str):
+            data = data.encode()
+        digest = hashlib.md5(data).hexdigest()
+
+        previous = self.remote_files.get(name) or self._deleted.get(name)
+        self._deleted.pop(name, None)
+        if previous is not None and previous[0] == digest:
+            self.remote_files[name] = previous
+            return name
+
+        self.wait(name)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.upload_workers, thread_name_prefix='s3-upload')
+        self.remote_files[name] = (digest, timezone.now())
+        self._pending[name] = self._executor.submit(self.upload, name, ContentFile(data))
+        return name
+
+
+class StaticStorage(ManifestFilesMixin, IncrementalUploadMixin, SharedConnectionS3Storage):
     """
     Custom S3 storage class for static files (CSS, JS, Admin files)
+
+    ``collectstatic`` also writes content-hashed copies, which are served
+    with year-long immutable cache headers. The manifest mapping names to
+    hashed names is kept on local disk in STATIC_ROOT so web processes read
+    it without an S3 request; without it, URLs fall back to the unhashed
+    names.
     """
     bucket_name = settings.AWS_STORAGE_BUCKET_NAME
     region_name = settings.AWS_S3_REGION_NAME
     access_key = settings.AWS_ACCESS_KEY_ID
     secret_key = settings.AWS_SECRET_ACCESS_KEY
     custom_domain = settings.AWS_S3_CUSTOM_DOMAIN
-    
+
     # Static files configuration
     location = 'static'  # This creates a 'static' folder in your S3 bucket
     default_acl = None
     file_overwrite = True  # Allow overwriting for static files (good for updates)
     querystring_auth = False
-    
+    manifest_strict = False
+
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault('manifest_storage', FileSystemStorage(location=settings.STATIC_ROOT))
         super().__init__(*args, **kwargs)
-        print(f"StaticStorage initialized with bucket: {self.bucket_name}")
-        print(f"Location: {self.location}")
-        print(f"Custom domain: {self.custom_domain}")
\ No newline at end of file
+
+    def stored_name(self, name):
+        # With no manifest entry the stock fallback downloads the file to
+        # hash it; serve the unhashed copy instead.
+        path = urlsplit(unquote(name)).path.strip()
+        if self.hash_key(self.clean_name(path)) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        if HASHED_NAME_RE.search(name):
+            params['CacheControl'] = IMMUTABLE_CACHE_CONTROL
+        return params
+
+    def post_process(self, *args, **kwargs):
+        # Hashing re-reads copied files, so the copies must have landed.
+        self.flush()
+        yield from super().post_process(*args, **kwargs)
+        self.flush()
@@ -0,0 +1,22 @@
+# File: store/backends/templates.py
+from django.template.backends.django import DjangoTemplates, Template
+
+from store.metrics import timed_render
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed_render():
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The stock Django template backend, with render time recorded in the
+    current request's metrics (see ``store.metrics``).
+    """
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,162 @@
+# store/cart_summary.py
+"""
+Cached per-user cart summary (item count and subtotal).
+
+The summary is computed at most once per request, memoised on the request,
+and kept in the cache between requests under the cart's id. A second cache
+entry maps the user to their cart id, so a warm page view costs no queries
+and a cold one costs a single aggregate query.
+
+Summaries are invalidated by ``invalidate_cart_summary``, which the ``Cart``
+and ``CartItem`` signal receivers in ``store.signals`` call on every save and
+delete. Code that changes cart lines with ``QuerySet.update()`` or other
+signal-free paths must call it (or ``invalidate_user_cart_summary``) directly.
+The summary key also carries a price version, which ``bump_price_version``
+advances when a product's ``PRICE_FIELDS`` change (the
+``product_prices_changed`` receiver, and bulk paths that use ``update()``),
+retiring every cached subtotal. Other catalog edits leave summaries alone.
+"""
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .metrics import cache_hit, cache_miss
+from .models import Cart
+from .pricing import CENT, MONEY, line_total
+
+CACHE_TIMEOUT = 60 * 60
+PRICE_VERSION_KEY = 'cart-summary:price-version'
+PRICE_FIELDS = {'price', 'discount_percentage', 'available'}
+EMPTY_SUMMARY = {'count': 0, 'subtotal': Decimal('0.00')}
+# Cached in place of a cart id for users who have no cart yet.
+NO_CART = 0
+
+
+def _cart_id_key(user_id):
+    return f"cart-id:{user_id}"
+
+
+def get_price_version():
+    """
+    Returns the current price version, starting a new one if it was evicted
+    (see ``catalog_cache.get_catalog_version``).
+    """
+    version = cache.get(PRICE_VERSION_KEY)
+    if version is None:
+        cache.add(PRICE_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(PRICE_VERSION_KEY)
+    return version
+
+
+def bump_price_version():
+    """
+    Invalidates every cached cart summary after product prices changed.
+    """
+    try:
+        cache.incr(PRICE_VERSION_KEY)
+    except ValueError:
+        get_price_version()
+
+
+def _summary_key(cart_id):
+    return f"cart-summary:{get_price_version()}:{cart_id}"
+
+
+def summarize_items(cart_items):
+    """
+    Builds a summary from cart items already priced by ``pricing.priced_lines``.
+    """
+    return {
+        'count': sum(item.quantity for item in cart_items),
+        'subtotal': sum((item.line_total for item in cart_items), Decimal('0.00')).quantize(CENT),
+    }
+
+
+def compute_cart_summary(user_id):
+    """
+    Returns ``(cart_id, summary)`` for ``user_id`` using one aggregate query.
+    ``cart_id`` is ``None`` if the user has no cart yet.
+    """
+    row = (
+        Cart.objects
+        .filter(user_id=user_id)
+        .values('id')
+        .annotate(
+            count=Sum('items__quantity'),
+            subtotal=Sum(line_total('items__'), output_field=MONEY),
+        )
+        .first()
+    )
+    if row is None:
+        return None, dict(EMPTY_SUMMARY)
+    return row['id'], {
+        'count': row['count'] or 0,
+        'subtotal': Decimal(row['subtotal'] or 0).quantize(CENT),
+    }
+
+
+def get_cart_summary(request, cart_items=None):
+    """
+    Returns the cart summary for ``request.user``, or for the guest cart of
+    an anonymous visitor (not cached; those pages skip the page cache).
+
+    ``cart_items``, when a view has already loaded the full cart, is used to
+    fill a cache miss without querying again.
+    """
+    if hasattr(request, '_cart_summary'):
+        return request._cart_summary
+    if not request.user.is_authenticated:
+        from .carts import get_guest_cart
+
+        guest_cart = get_guest_cart(request)
+        request._cart_summary = summarize_items(guest_cart.items()) if guest_cart else dict(EMPTY_SUMMARY)
+        return request._cart_summary
+
+    user_id = request.user.pk
+    cart_id = cache.get(_cart_id_key(user_id))
+    if cart_id == NO_CART:
+        summary = dict(EMPTY_SUMMARY)
+    elif cart_id is not None:
+        summary = cache.get(_summary_key(cart_id))
+    else:
+        summary = None
+
+    if summary is None:
+        cache_miss()
+        if cart_items:
+            cart_id, summary = cart_items[0].cart_id, summarize_items(cart_items)
+        else:
+            cart_id, summary = compute_cart_summary(user_id)
+        if cart_id is None:
+            cache.set(_cart_id_key(user_id), NO_CART, CACHE_TIMEOUT)
+        else:
+            cache.set_many({
+                _cart_id_key(user_id): cart_id,
+                _summary_key(cart_id): summary,
+            }, CACHE_TIMEOUT)
+
+    else:
+        cache_hit()
+    request._cart_summary = summary
+    return summary
+
+
+def invalidate_cart_summary(cart_id, user_id=None):
+    """
+    Drops the cached summary for ``cart_id`` (and the user's cart id mapping,
+    when a cart is created or deleted).
+    """
+    keys = [_summary_key(cart_id)]
+    if user_id is not None:
+        keys.append(_cart_id_key(user_id))
+    cache.delete_many(keys)
+
+
+def invalidate_user_cart_summary(user_id):
+    """
+    Drops the user's cart id mapping, so their next summary is recomputed.
+    For ``QuerySet.update()`` callers that do not know the cart id.
+    """
+    cache.delete(_cart_id_key(user_id))
@@ -0,0 +1,268 @@
+# store/carts.py
+"""
+One cart API for signed-in users and guests.
+
+A signed-in user's cart is the ``Cart`` row, created lazily by the first
+mutation; reading a cart never writes. A guest's cart lives only in a signed
+cookie holding ``product_id:quantity`` pairs, so browsing and filling a cart
+anonymously costs no database writes at all. ``GuestCartMiddleware`` writes
+the cookie back when a view changed it.
+
+When a guest logs in (the ``user_logged_in`` receiver in ``store.signals``,
+or ``LoginSerializer``), ``merge_guest_cart`` folds the cookie into the
+user's cart with one bulk upsert and clears it.
+"""
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .cart_summary import invalidate_cart_summary, invalidate_user_cart_summary
+from .checkout import get_cart_lines as get_user_cart_lines
+from .models import Cart, CartItem, Product
+from .pricing import with_final_price
+
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'store.carts'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+# Keeps the cookie well under the 4 KB browsers accept.
+MAX_GUEST_LINES = 50
+
+
+class CartFull(Exception):
+    pass
+
+
+class GuestCart:
+    """
+    ``{product_id: quantity}`` kept in a signed cookie, in insertion order.
+    """
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.modified = False
+        self._items = None
+
+    @classmethod
+    def from_request(cls, request):
+        value = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        if not value:
+            return cls()
+        try:
+            lines = {
+                int(product_id): int(quantity)
+                for product_id, quantity in (pair.split(':') for pair in value.split(','))
+            }
+        except ValueError:
+            return cls()
+        return cls({pk: qty for pk, qty in lines.items() if qty > 0})
+
+    def serialize(self):
+        return ','.join(f"{product_id}:{quantity}" for product_id, quantity in self.lines.items())
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _changed(self):
+        self.modified = True
+        self._items = None
+
+    def add(self, product_id, quantity=1):
+        if product_id not in self.lines and len(self.lines) >= MAX_GUEST_LINES:
+            raise CartFull()
+        self.lines[product_id] = self.lines.get(product_id, 0) + quantity
+        self._changed()
+
+    def set(self, product_id, quantity):
+        if product_id not in self.lines:
+            return False
+        self.lines[product_id] = quantity
+        self._changed()
+        return True
+
+    def remove(self, product_id):
+        if self.lines.pop(product_id, None) is None:
+            return False
+        self._changed()
+        return True
+
+    def clear(self):
+        if self.lines:
+            self.lines = {}
+            self._changed()
+
+    def items(self):
+        """
+        Unsaved ``CartItem`` objects for the lines, with their products and
+        the same ``unit_price`` and ``line_total`` as ``priced_lines``, in
+        one query. Products that no longer exist are skipped.
+        """
+        if self._items is None:
+            products = with_final_price(Product.objects.all()).in_bulk(self.lines)
+            self._items = []
+            for product_id, quantity in self.lines.items():
+                if product_id in products:
+                    product = products[product_id]
+                    item = CartItem(product=product, quantity=quantity)
+                    item.unit_price = product.final_price
+                    item.line_total = product.final_price * quantity
+                    self._items.append(item)
+        return self._items
+
+
+def get_guest_cart(request):
+    # Kept on the HttpRequest, not a DRF Request wrapping it, so the
+    # middleware sees changes made by API code.
+    request = getattr(request, '_request', request)
+    if not hasattr(request, '_guest_cart'):
+        request._guest_cart = GuestCart.from_request(request)
+    return request._guest_cart
+
+
+def get_cart_lines(request):
+    """
+    Returns the current cart's items with their products.
+    """
+    if request.user.is_authenticated:
+        return get_user_cart_lines(request.user)
+    return get_guest_cart(request).items()
+
+
+def add_item(request, product, quantity=1):
+    """
+    Adds ``quantity`` of ``product``; returns ``True`` if it was a new line.
+    Raises ``CartFull`` when a guest cart has no room for another line.
+
+    An existing line is bumped with one ``UPDATE ... SET quantity = quantity
+    + n``, so concurrent adds never lose an update. A new line is inserted
+    under a lock on the cart row, the one ``merge_guest_cart`` holds, so a
+    login merging into the same cart cannot overwrite it.
+    """
+    if not request.user.is_authenticated:
+        guest_cart = get_guest_cart(request)
+        created = product.pk not in guest_cart.lines
+        guest_cart.add(product.pk, quantity)
+        return created
+
+    user = request.user
+    lines = CartItem.objects.filter(cart__user=user, product=product)
+    if lines.update(quantity=F('quantity') + quantity):
+        invalidate_user_cart_summary(user.pk)
+        return False
+
+    try:
+        with transaction.atomic():
+            cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    except IntegrityError:
+        # A concurrent request inserted the line first.
+        lines.update(quantity=F('quantity') + quantity)
+        invalidate_user_cart_summary(user.pk)
+        return False
+    return True
+
+
+def set_quantity(request, product, quantity):
+    """
+    Sets the quantity of an existing line in one UPDATE; returns ``False``
+    if there is none.
+    """
+    if not request.user.is_authenticated:
+        return get_guest_cart(request).set(product.pk, quantity)
+
+    if not CartItem.objects.filter(cart__user=request.user, product=product).update(quantity=quantity):
+        return False
+    invalidate_user_cart_summary(request.user.pk)
+    return True
+
+
+def remove_item(request, product):
+    """
+    Removes a line; returns ``False`` if it was not in the cart.
+    """
+    if not request.user.is_authenticated:
+        return get_guest_cart(request).remove(product.pk)
+
+    deleted, _ = CartItem.objects.filter(cart__user=request.user, product=product).delete()
+    return bool(deleted)
+
+
+def line_quantity(request, product):
+    """
+    Returns the quantity of ``product`` in the cart, 0 if it is not there.
+    """
+    if not request.user.is_authenticated:
+        return get_guest_cart(request).lines.get(product.pk, 0)
+    return (
+        CartItem.objects
+        .filter(cart__user=request.user, product=product)
+        .values_list('quantity', flat=True)
+        .first()
+    ) or 0
+
+
+def merge_guest_cart(request, user):
+    """
+    Adds the guest cart's lines to ``user``'s cart and empties the guest cart.
+
+    Quantities of products already in the user's cart are summed. All lines
+    are written with one upsert (``ON CONFLICT DO UPDATE``, or ``ON DUPLICATE
+    KEY UPDATE`` on MySQL), under a lock on the cart row so concurrent
+    logins, and ``add_item`` inserting a new line, wait their turn. The
+    existing lines are read ``FOR UPDATE`` too, so an ``add_item`` bumping
+    one of them either lands before the read or waits for the merge.
+    """
+    guest_cart = get_guest_cart(request)
+    if not guest_cart:
+        return
+    lines = dict(guest_cart.lines)
+    guest_cart.clear()
+    product_ids = set(Product.objects.filter(pk__in=lines).values_list('pk', flat=True))
+    if not product_ids:
+        return
+
+    conflict_target = {}
+    if connection.features.supports_update_conflicts_with_target:
+        # MySQL takes no target; any unique key conflict updates.
+        conflict_target['unique_fields'] = ['cart', 'product']
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        cart = Cart.objects.select_for_update().get(pk=cart.pk)
+        existing = dict(
+            CartItem.objects
+            .select_for_update()
+            .filter(cart=cart, product_id__in=product_ids)
+            .values_list('product_id', 'quantity')
+        )
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=cart, product_id=product_id, quantity=existing.get(product_id, 0) + quantity)
+                for product_id, quantity in lines.items()
+                if product_id in product_ids
+            ],
+            update_conflicts=True,
+            update_fields=['quantity'],
+            **conflict_target,
+        )
+    # bulk_create sends no post_save signals.
+    invalidate_cart_summary(cart.pk)
+
+
+class GuestCartMiddleware:
+    """
+    Writes the guest cart cookie back when the request changed it.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        guest_cart = getattr(request, '_guest_cart', None)
+        if guest_cart is not None and guest_cart.modified:
+            if guest_cart:
+                response.set_signed_cookie(
+                    COOKIE_NAME, guest_cart.serialize(), salt=COOKIE_SALT,
+                    max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+                    secure=settings.SESSION_COOKIE_SECURE,
+                )
+            else:
+                response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        return response
@@ -0,0 +1,136 @@
+# store/catalog_cache.py
+"""
+Versioned read cache for catalog pages.
+
+Every cache entry for catalog data carries the current catalog version in
+its key. Saving or deleting a ``Product``, ``Category``, ``ProductImage`` or
+``Announcement`` bumps the version (see ``store.signals``), which makes every
+older entry unreachable at once; the stale entries simply expire.
+
+Two layers sit on top of the version:
+
+* ``cached_catalog`` caches catalog objects the views need up front, and the
+  templates wrap their catalog markup in ``{% cache %}`` fragments keyed by
+  ``catalog_version``. Authenticated users get those fragments while the
+  per-user cart badge in ``base.html`` is rendered fresh.
+* ``catalog_page_cache`` caches whole responses for anonymous visitors,
+  keyed on the path and the query parameters the view declares.
+
+Only the portable cache API (``get``/``set``/``add``/``incr``) is used, so
+both the LocMem and file-based backends work.
+"""
+import time
+from functools import partial, wraps
+from urllib.parse import urlencode
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .carts import COOKIE_NAME as GUEST_CART_COOKIE
+from .metrics import cache_hit, cache_miss
+
+VERSION_KEY = 'catalog:version'
+CATALOG_TIMEOUT = 60 * 60 * 24
+_MISSING = object()
+
+
+def get_catalog_version():
+    """
+    Returns the current catalog version, starting a new one if it was evicted.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A millisecond timestamp is always ahead of any version issued before
+        # the key was lost, so old entries can never be mistaken for current.
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidates every cached catalog entry.
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def catalog_key(version, *parts):
+    return ':'.join(['catalog', str(version), *map(str, parts)])
+
+
+def cached_catalog(name, builder, version=None):
+    """
+    Returns ``builder()`` cached under ``name`` for the current catalog version.
+    ``None`` results are cached too, so missing slugs do not hit the database.
+    """
+    key = catalog_key(version or get_catalog_version(), name)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        cache_miss()
+        value = builder()
+        cache.set(key, value, CATALOG_TIMEOUT)
+    else:
+        cache_hit()
+    return value
+
+
+def catalog_page_cache(view=None, *, params=None):
+    """
+    Serves whole cached pages to anonymous GET requests.
+
+    ``params`` maps each query parameter the view reads to a function that
+    normalizes its value, returning ``None`` for the view's default. Pages
+    are keyed on the path and those normalized values, so equivalent URLs
+    share one entry, and requests carrying any other parameter bypass the
+    cache rather than filling it with copies.
+
+    Requests with pending flash messages or a guest cart cookie bypass the
+    cache too, and only plain 200 responses that set no cookies are stored.
+    """
+    if view is None:
+        return partial(catalog_page_cache, params=params)
+    params = params or {}
+
+    def page_key(request):
+        query = {}
+        for name in request.GET:
+            if name not in params:
+                return None
+            value = params[name](request.GET.get(name))
+            if value is not None:
+                query[name] = value
+        return catalog_key(get_catalog_version(), 'page', request.path, urlencode(sorted(query.items())))
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            request.method != 'GET'
+            or request.user.is_authenticated
+            or GUEST_CART_COOKIE in request.COOKIES
+            or len(get_messages(request))
+        ):
+            return view(request, *args, **kwargs)
+
+        key = page_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            cache_hit()
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        cache_miss()
+
+        response = view(request, *args, **kwargs)
+        if (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+        ):
+            cache.set(key, (response.content, response['Content-Type']), CATALOG_TIMEOUT)
+        return response
+    return wrapper
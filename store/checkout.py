@@ -0,0 +1,196 @@
+# store/checkout.py
+"""
+Order placement service.
+
+``place_order`` turns a user's cart into an ``Order`` inside one transaction
+with a fixed number of queries, whatever the size of the cart: one read of
+the cart lines, one conditional stock decrement for every product, one order
+insert, one bulk insert of order items, one cart delete and the queued
+confirmation emails.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.db.models.functions import Now
+
+from .models import CartItem, Order, OrderItem, Product
+from .outbox import enqueue_email
+from .pricing import delivery_charge_for, priced_lines
+
+WHATSAPP_NUMBER = "+92 300 1234567"  # ✅ Replace with your real number
+
+
+class EmptyCart(Exception):
+    pass
+
+
+class OutOfStock(Exception):
+    """
+    Raised when one or more cart lines ask for more than is in stock.
+
+    ``lines`` is a list of ``(product, requested, available)`` tuples.
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        super().__init__(", ".join(
+            f"{product.name}: requested {requested}, {available} left"
+            for product, requested, available in lines
+        ))
+
+
+def get_cart_lines(user):
+    """
+    Returns the user's cart items with their products, priced by
+    ``pricing.priced_lines``, in a single query.
+    """
+    return list(
+        priced_lines(CartItem.objects.filter(cart__user=user))
+        .select_related('product')
+        .order_by('id')
+    )
+
+
+def calculate_totals(cart_items):
+    """
+    Returns ``(subtotal, delivery_charge, total)`` for priced cart items.
+    """
+    subtotal = cart_items[0].subtotal if cart_items else Decimal('0.00')
+    delivery_charge = delivery_charge_for(subtotal)
+    return subtotal, delivery_charge, subtotal + delivery_charge
+
+
+def reserve_stock(quantities):
+    """
+    Decrements stock for ``{product_id: quantity}`` in one UPDATE statement.
+
+    Each product is only decremented when it is available and has enough
+    stock, so concurrent checkouts can never oversell or lose an update.
+    Raises ``OutOfStock`` (and leaves stock untouched once the caller's
+    transaction rolls back) if any line could not be reserved.
+
+    ``update()`` skips ``auto_now`` and ``post_save``, so ``updated_at`` is
+    set here and the catalog version is bumped once the sale commits.
+    """
+    # Deferred: catalog_cache imports carts, which imports this module.
+    from .catalog_cache import bump_catalog_version
+
+    if not quantities:
+        return
+    enough_stock = Q()
+    for product_id, quantity in quantities.items():
+        enough_stock |= Q(pk=product_id, stock__gte=quantity)
+
+    updated = Product.objects.filter(enough_stock, available=True).update(
+        stock=Case(
+            *[When(pk=product_id, then=F('stock') - quantity)
+              for product_id, quantity in quantities.items()],
+            output_field=PositiveIntegerField(),
+        ),
+        updated_at=Now(),
+    )
+    if updated:
+        transaction.on_commit(bump_catalog_version)
+    if updated != len(quantities):
+        products = Product.objects.filter(pk__in=quantities)
+        raise OutOfStock([
+            (product, quantities[product.pk], product.stock if product.available else 0)
+            for product in products
+            if not product.available or product.stock < quantities[product.pk]
+        ])
+
+
+def queue_order_emails(order, host):
+    """
+    Queues the customer confirmation and the admin notification for ``order``.
+    """
+    subject_user = f"🧾 Order Confirmation – Order #{order.order_id}"
+
+    message_user = (
+        f"Hello {order.full_name},\n\n"
+        f"Thank you for shopping with Stationery Store!\n\n"
+        f"We’re excited to let you know that we’ve received your order.\n\n"
+        f"🛒 Order Summary:\n"
+        f"Total Amount: Rs {order.total_price:.2f}\n"
+        f"Email: {order.email}\n"
+        f"Phone: {order.phone_number}\n\n"
+        f"📦 Shipping Address:\n"
+        f"{order.complete_address}\n"
+        f"{order.city} – {order.postal_code}\n"
+        f"{order.country}\n\n"
+        f"You will receive another email once your items are shipped.\n"
+        f"If you have any questions, feel free to contact us:\n"
+        f"📧 Email: {settings.DEFAULT_FROM_EMAIL}\n"
+        f"📱 WhatsApp: {WHATSAPP_NUMBER}\n\n"
+        f"Best regards,\n"
+        f"Stationery Store Team\n"
+        f"{host}"
+    )
+
+    subject_admin = f"📥 New Order Received – #{order.order_id}"
+
+    message_admin = (
+        f"A new order has been placed!\n\n"
+        f"Order ID: {order.order_id}\n"
+        f"Customer: {order.full_name}\n"
+        f"Email: {order.email}\n"
+        f"Phone: {order.phone_number}\n"
+        f"Total: Rs {order.total_price:.2f}\n\n"
+        f"Shipping Address:\n"
+        f"{order.complete_address}\n"
+        f"{order.city} – {order.postal_code}\n"
+        f"{order.country}\n\n"
+        f"WhatsApp Customer for Confirmation: {WHATSAPP_NUMBER}"
+    )
+
+    # Delivered by `manage.py send_outbox`
+    enqueue_email(subject_user, message_user, [order.email],
+                  from_email=settings.DEFAULT_FROM_EMAIL)
+    enqueue_email(subject_admin, message_admin, [settings.ADMIN_EMAIL],
+                  from_email=settings.DEFAULT_FROM_EMAIL)
+
+
+@transaction.atomic
+def place_order(user, shipping, host=''):
+    """
+    Creates an order from ``user``'s cart and empties the cart.
+
+    ``shipping`` is the cleaned data of a ``ShippingForm``. Raises
+    ``EmptyCart`` or ``OutOfStock``; in both cases nothing is written.
+    """
+    cart_items = get_cart_lines(user)
+    if not cart_items:
+        raise EmptyCart()
+
+    reserve_stock({item.product_id: item.quantity for item in cart_items})
+
+    _, delivery_charge, total = calculate_totals(cart_items)
+    order = Order.objects.create(
+        user=user,
+        full_name=shipping['full_name'],
+        email=shipping['email'],
+        phone_number=shipping['phone_number'],
+        complete_address=shipping['complete_address'],
+        city=shipping['city'],
+        postal_code=shipping['postal_code'],
+        country=shipping['country'],
+        delivery_charge=delivery_charge,
+        total_price=total,
+    )
+
+    OrderItem.objects.bulk_create([
+        OrderItem.snapshot(
+            item.product,
+            order=order,
+            quantity=item.quantity,
+            price=item.product.price,
+            discount_price=item.unit_price if item.product.discount_percentage > 0 else None,
+        )
+        for item in cart_items
+    ])
+
+    CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+
+    queue_order_emails(order, host)
+    return order
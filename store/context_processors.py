@@ -1,15 +1,8 @@
-from .models import Cart, Announcement
-from django.db import models  # <-- Add this line
+from .models import Announcement
+from .cart_summary import get_cart_summary
 
 def cart_count(request):
-    count = 0
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            count = cart.items.aggregate(total=models.Sum('quantity'))['total'] or 0
-        except Cart.DoesNotExist:
-            count = 0
-    return {'cart_count': count}
+    return {'cart_count': get_cart_summary(request)['count']}
 
 def active_announcement(request):
     return {
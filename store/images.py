@@ -0,0 +1,205 @@
+# store/images.py
+"""
+Resized image variants for responsive ``srcset`` markup.
+
+Saving a model with an uploaded image queues an ``ImageVariantSet`` row for
+the file. The ``process_image_variants`` worker decodes each queued image
+once, writes WebP and JPEG copies at ``VARIANT_WIDTHS`` (never upscaling)
+through the default storage, and records their names on the row. Templates
+render them with the ``{% picture %}`` tag from ``store_images``.
+
+Variant lookups are served from the cache, so rendering a grid of images
+costs no queries once warm.
+"""
+import hashlib
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .metrics import cache_hit, cache_miss
+from .models import ImageVariantSet
+from .outbox import backoff_delay
+
+VARIANT_WIDTHS = (160, 320, 640, 1024)
+# format -> (Pillow format, extension, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_ATTEMPTS = 3
+CACHE_TIMEOUT = 24 * 60 * 60
+# Images still waiting for the worker. Kept short because the worker's own
+# cache update only reaches other processes through a shared cache.
+PENDING_CACHE_TIMEOUT = 60
+# How long a claimed row is left to one worker before others may retry it.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_image_variants(*names):
+    """
+    Queues each image name for processing unless it already has a row.
+    """
+    ImageVariantSet.objects.bulk_create(
+        [ImageVariantSet(source=name) for name in names if name],
+        batch_size=500, ignore_conflicts=True,
+    )
+
+
+def variant_name(source, width, extension):
+    root, _ = os.path.splitext(source)
+    return f"variants/{root}-{width}w.{extension}"
+
+
+def _flatten(image):
+    """
+    JPEG has no alpha channel, so transparency is composited onto white.
+    """
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_variants(source, storage=None, widths=VARIANT_WIDTHS):
+    """
+    Writes every variant of ``source`` and returns the ``variants`` mapping.
+    """
+    storage = storage or default_storage
+    with storage.open(source, 'rb') as fh:
+        image = Image.open(fh)
+        widths = sorted((w for w in widths if w < max(image.size)), reverse=True)
+        if widths:
+            # Lets the JPEG decoder scale down by up to 8x while decoding.
+            image.draft('RGB', (widths[0], widths[0]))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    # Resampling filters only apply to RGB(A); palette images would fall
+    # back to nearest-neighbour.
+    image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+    variants = {fmt: [] for fmt in VARIANT_FORMATS}
+    widths = [w for w in widths if w < image.width]
+    # Largest first, each step resized from the previous one.
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+        for fmt, (pil_format, extension, options) in VARIANT_FORMATS.items():
+            converted = _flatten(image) if pil_format == 'JPEG' else image
+            buffer = BytesIO()
+            converted.save(buffer, pil_format, **options)
+            name = storage.save(variant_name(source, width, extension), ContentFile(buffer.getvalue()))
+            variants[fmt].append([width, name])
+    for entries in variants.values():
+        entries.reverse()
+    return variants
+
+
+def _cache_key(source):
+    return f"image-variants:{hashlib.md5(source.encode()).hexdigest()}"
+
+
+def get_variants(source):
+    """
+    Returns the ``variants`` mapping for ``source``, or ``{}`` until the
+    worker has processed it.
+    """
+    if not source:
+        return {}
+    key = _cache_key(source)
+    variants = cache.get(key)
+    if variants is not None:
+        cache_hit()
+    else:
+        cache_miss()
+        variants = (
+            ImageVariantSet.objects
+            .filter(source=source, status='ready')
+            .values_list('variants', flat=True)
+            .first()
+        ) or {}
+        cache.set(key, variants, CACHE_TIMEOUT if variants else PENDING_CACHE_TIMEOUT)
+    return variants
+
+
+def build_srcset(entries, storage=None):
+    storage = storage or default_storage
+    return ', '.join(f"{storage.url(name)} {width}w" for width, name in entries or ())
+
+
+def _claim_batch(batch_size):
+    """
+    Leases up to ``batch_size`` due rows to this worker and returns them.
+
+    The lease is just ``next_attempt_at`` pushed past ``CLAIM_TIMEOUT``, so
+    other workers skip the rows while they render, and rows left behind by
+    a worker that died become due again on their own.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            ImageVariantSet.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        ImageVariantSet.objects.filter(pk__in=[row.pk for row in batch]).update(
+            attempts=F('attempts') + 1, next_attempt_at=now + CLAIM_TIMEOUT,
+        )
+    for row in batch:
+        row.attempts += 1
+    return batch
+
+
+def process_image_variants(batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS, storage=None):
+    """
+    Renders one batch of queued images and returns ``(done, failed)`` counts.
+
+    Rows are claimed in one short transaction and their results recorded in
+    another; decoding and uploading happen in between, outside any
+    transaction. A failure is retried with backoff and marked failed after
+    ``max_attempts``. Finished rows replace their cached lookup. Callers
+    bump the catalog version once any rows are done, so cached pages pick
+    up the new ``srcset``.
+    """
+    done = failed = 0
+    batch = _claim_batch(batch_size)
+    for row in batch:
+        try:
+            row.variants = render_variants(row.source, storage=storage)
+        except Exception as e:
+            failed += 1
+            row.last_error = f"{type(e).__name__}: {e}"
+            if row.attempts >= max_attempts:
+                row.status = 'failed'
+            else:
+                row.next_attempt_at = timezone.now() + backoff_delay(row.attempts)
+        else:
+            done += 1
+            row.status = 'ready'
+            row.processed_at = timezone.now()
+            row.last_error = ''
+
+    with transaction.atomic():
+        for row in batch:
+            # A row whose lease ran out may have been claimed again since;
+            # the newer attempt owns it.
+            recorded = ImageVariantSet.objects.filter(pk=row.pk, attempts=row.attempts).update(
+                status=row.status, variants=row.variants, next_attempt_at=row.next_attempt_at,
+                last_error=row.last_error, processed_at=row.processed_at,
+            )
+            if recorded and row.status == 'ready':
+                transaction.on_commit(
+                    lambda key=_cache_key(row.source), variants=row.variants:
+                        cache.set(key, variants, CACHE_TIMEOUT)
+                )
+    return done, failed
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from store.models import OrderItem, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies product name, slug and image into order items created before "
+        "line items were snapshotted. Lines whose product was deleted are named "
+        "'Deleted Product'. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        product = Product.objects.filter(pk=OuterRef('product_id'))
+        pending = OrderItem.objects.filter(product_name='').order_by('pk')
+        total = 0
+        while True:
+            # One UPDATE ... SET col = (SELECT ...) per batch of pks.
+            pks = list(pending.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            total += OrderItem.objects.filter(pk__in=pks).update(
+                product_name=Coalesce(
+                    Subquery(product.values('name')[:1]), Value('Deleted Product'),
+                ),
+                product_slug=Coalesce(Subquery(product.values('slug')[:1]), Value('')),
+                product_image=Coalesce(Subquery(product.values('image')[:1]), Value('')),
+            )
+            self.stdout.write(f"{total} order item(s) snapshotted")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} order item(s)"))
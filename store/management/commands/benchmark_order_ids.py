@@ -0,0 +1,58 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Order
+
+ORDER_FIELDS = {
+    'full_name': 'Benchmark',
+    'email': 'bench@example.com',
+    'phone_number': '0',
+    'city': 'Lahore',
+    'postal_code': '0',
+    'country': 'Pakistan',
+    'total_price': 0,
+}
+
+
+def generate_random_order_id():
+    """
+    The pre-permutation generator: random IDs probed against the table.
+    """
+    chars = string.ascii_uppercase + string.digits
+    while True:
+        order_id = ''.join(random.choices(chars, k=8))
+        if not Order.objects.filter(order_id=order_id).exists():
+            return order_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares order inserts/sec of the random probing ID generator and the "
+        "pk-derived one. All rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+
+    def run(self, label, count, create):
+        with transaction.atomic():
+            start = time.perf_counter()
+            for _ in range(count):
+                create()
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        self.stdout.write(f"{label:<12} {count / elapsed:10.0f} inserts/sec")
+        return count / elapsed
+
+    def handle(self, *args, **options):
+        count = options['orders']
+        legacy = self.run(
+            'random+probe', count,
+            lambda: Order.objects.create(order_id=generate_random_order_id(), **ORDER_FIELDS),
+        )
+        derived = self.run('pk-derived', count, lambda: Order.objects.create(**ORDER_FIELDS))
+        self.stdout.write(self.style.SUCCESS(f"pk-derived is {derived / legacy:.2f}x the random generator"))
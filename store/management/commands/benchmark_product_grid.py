@@ -0,0 +1,96 @@
+import statistics
+import tempfile
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db.models.fields.files import FieldFile
+from django.template.loader import get_template
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from store.backends.s3boto3 import MediaStorage
+from store.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders the product grid partial with the stock S3 backend, the shared "
+        "MediaStorage and a local filesystem double, and compares render time and "
+        "connection setup. Nothing is sent to S3: public URLs are computed locally "
+        "and connections are only constructed, never used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=48)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument(
+            '--instances', type=int, default=10,
+            help="Storage instances whose connection is set up in the connection test.",
+        )
+
+    def storages(self, media_root):
+        options = settings.STORAGES['default'].get('OPTIONS', {})
+        return {
+            'stock S3': lambda: S3Boto3Storage(**options, location=MediaStorage.location),
+            'shared S3': lambda: MediaStorage(**options),
+            'filesystem': lambda: FileSystemStorage(location=media_root, base_url=settings.MEDIA_URL),
+        }
+
+    def grid(self, storage, count):
+        category = Category(name='Benchmark', slug='benchmark')
+        field = Product._meta.get_field('image')
+        products = []
+        for i in range(count):
+            product = Product(
+                category=category, name=f"Benchmark pen {i}", slug=f"benchmark-pen-{i}",
+                price=Decimal('120.00'), description="A smooth gel pen for everyday notes.",
+            )
+            image = FieldFile(product, field, f"products/benchmark-pen-{i}.jpg")
+            image.storage = storage
+            product.image = image
+            products.append(product)
+        return products
+
+    def time_renders(self, products, iterations):
+        template = get_template('store/partials/product_cards.html')
+        context = {'products': products}
+        template.render(context)  # warm template and variant caches
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            template.render(context)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def time_urls(self, products, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for product in products:
+                product.image.url
+        return (time.perf_counter() - start) * 1e6 / (iterations * len(products))
+
+    def time_connections(self, factory, instances):
+        start = time.perf_counter()
+        for _ in range(instances):
+            factory().connection
+        return (time.perf_counter() - start) * 1000
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as media_root:
+            self.stdout.write(
+                f"{'storage':<12} {'mean ms':>9} {'p95 ms':>9} {'url us':>8} {'connect ms':>11}"
+            )
+            for label, factory in self.storages(media_root).items():
+                products = self.grid(factory(), options['products'])
+                timings = sorted(self.time_renders(products, options['iterations']))
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                url = self.time_urls(products, options['iterations'])
+                connect = (
+                    self.time_connections(factory, options['instances'])
+                    if label != 'filesystem' else 0
+                )
+                self.stdout.write(
+                    f"{label:<12} {statistics.mean(timings):9.2f} {p95:9.2f} {url:8.2f} {connect:11.1f}"
+                )
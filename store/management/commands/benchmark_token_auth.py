@@ -0,0 +1,97 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.views import APIView
+
+from store.authentication import CachedTokenAuthentication, issue_token
+from store.management.commands.benchmark_views import percentile
+
+SCHEMES = {
+    'plaintext': TokenAuthentication,
+    'cached': CachedTokenAuthentication,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares rest_framework's TokenAuthentication with the hashed, cached "
+        "ApiToken authentication on an authenticated API request that is "
+        "answered with 304, so authentication dominates. Reports latency and "
+        "queries per request as JSON. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--schemes', nargs='+', choices=SCHEMES, default=list(SCHEMES))
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+
+        url = reverse('store:api-category-list')
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            user = User.objects.create_user('benchmark-api-client', password=None)
+            keys = {
+                'plaintext': Token.objects.create(user=user).key,
+                'cached': issue_token(user),
+            }
+            etag = Client().get(url)['ETag']
+            results = {}
+            for scheme in options['schemes']:
+                client = Client(HTTP_AUTHORIZATION=f"Token {keys[scheme]}", HTTP_IF_NONE_MATCH=etag)
+                results[scheme] = self.measure(client, url, SCHEMES[scheme], options)
+            transaction.set_rollback(True)
+
+        report = {
+            'database': connection.vendor,
+            'cache': type(caches['default']).__name__,
+            'iterations': options['iterations'],
+            'schemes': results,
+        }
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+
+    def request(self, client, url):
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 304:
+            raise CommandError(f"{url} returned {response.status_code}")
+        return elapsed * 1000
+
+    def measure(self, client, url, authentication_class, options):
+        # The views read authentication_classes from APIView at request time.
+        original = APIView.authentication_classes
+        APIView.authentication_classes = [authentication_class]
+        try:
+            for _ in range(options['warmup']):
+                self.request(client, url)
+            start = time.perf_counter()
+            timings = sorted(self.request(client, url) for _ in range(options['iterations']))
+            elapsed = time.perf_counter() - start
+            with CaptureQueriesContext(connection) as queries:
+                self.request(client, url)
+        finally:
+            APIView.authentication_classes = original
+        return {
+            'requests_per_s': round(options['iterations'] / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'queries': len(queries),
+        }
@@ -0,0 +1,225 @@
+import json
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from store.models import Cart, CartItem, Category, Order, OrderItem, Product
+
+SHIPPING = {
+    'full_name': 'Benchmark Shopper',
+    'email': 'bench@example.com',
+    'phone_number': '03000000000',
+    'complete_address': 'House 1, Street 2',
+    'city': 'Lahore',
+    'postal_code': '54000',
+    'country': 'Pakistan',
+}
+VIEWS = (
+    'home', 'category_detail', 'product_detail', 'cart', 'checkout',
+    'checkout_post', 'order_history', 'order_confirmation',
+)
+
+
+def fill_ids(objs, field):
+    """
+    Sets the pks of bulk-created ``objs`` by looking them up on the unique
+    ``field``; MySQL reports no ids for a multi-row INSERT.
+    """
+    if objs and not connection.features.can_return_rows_from_bulk_insert:
+        model = type(objs[0])
+        ids = dict(
+            model.objects.filter(**{f'{field}__in': [getattr(obj, field) for obj in objs]})
+            .values_list(field, 'pk')
+        )
+        for obj in objs:
+            obj.pk = ids[getattr(obj, field)]
+    return objs
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a dataset of the requested size, drives each storefront view "
+        "through the test client and reports p50/p95/p99 latency, query count "
+        "and response size as JSON. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=200, help="Orders in the shopper's history.")
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--cart-lines', type=int, default=5)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1, help="Random seed for the generated data.")
+        parser.add_argument('--views', nargs='+', choices=VIEWS, default=list(VIEWS))
+        parser.add_argument(
+            '--cold-cache', action='store_true',
+            help="Run with a dummy cache so every request misses.",
+        )
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+        parser.add_argument(
+            '--compare', metavar='REPORT',
+            help="A previous JSON report; prints the p95 change per view.",
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1")
+
+        settings_overrides = {'ALLOWED_HOSTS': ['*']}
+        if options['cold_cache']:
+            settings_overrides['CACHES'] = {
+                'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            }
+
+        with override_settings(**settings_overrides), transaction.atomic():
+            user, urls = self.seed(options)
+            client = Client()
+            client.force_login(user)
+            results = {
+                view: self.measure(client, view, urls[view], options)
+                for view in options['views']
+            }
+            transaction.set_rollback(True)
+
+        report = {
+            'database': connection.vendor,
+            'dataset': {
+                key: options[key] for key in (
+                    'categories', 'products', 'orders', 'items_per_order', 'cart_lines', 'seed',
+                )
+            },
+            'iterations': options['iterations'],
+            'cold_cache': options['cold_cache'],
+            'views': results,
+        }
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def seed(self, options):
+        """
+        Bulk-inserts the dataset (no model signals fire) and returns the
+        shopper plus the URL of every view.
+        """
+        rng = random.Random(options['seed'])
+        categories = fill_ids(Category.objects.bulk_create([
+            Category(name=f"Bench category {i}", slug=f"bench-category-{i}")
+            for i in range(max(options['categories'], 1))
+        ]), 'slug')
+        products = fill_ids(Product.objects.bulk_create([
+            Product(
+                category=categories[i % len(categories)],
+                name=f"Bench product {i}", slug=f"bench-product-{i}",
+                description="Benchmark product " * rng.randint(5, 40),
+                price=Decimal(rng.randint(50, 5000)), discount_percentage=rng.choice((0, 0, 10, 25)),
+                stock=10 ** 6,
+            )
+            for i in range(max(options['products'], 1))
+        ], batch_size=1000), 'slug')
+
+        user = User.objects.create_user('benchmark-shopper', password=None)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=rng.randint(1, 3))
+            for product in rng.sample(products, min(options['cart_lines'], len(products)))
+        ])
+        orders = fill_ids(Order.objects.bulk_create([
+            Order(
+                user=user, order_id=f"BV{i:06d}", total_price=Decimal(rng.randint(100, 20000)),
+                **{k: v for k, v in SHIPPING.items() if k != 'complete_address'},
+            )
+            for i in range(options['orders'])
+        ], batch_size=1000), 'order_id')
+        OrderItem.objects.bulk_create([
+            OrderItem.snapshot(product, order=order, quantity=1, price=product.price)
+            for order in orders
+            for product in rng.sample(products, min(options['items_per_order'], len(products)))
+        ], batch_size=1000)
+
+        # One order placed the normal way, for the confirmation page.
+        order = Order.objects.create(user=user, total_price=products[0].price, **SHIPPING)
+        OrderItem.snapshot(products[0], order=order, quantity=1, price=products[0].price).save()
+
+        product = products[len(products) // 2]
+        checkout = reverse('store:checkout')
+        return user, {
+            'home': reverse('store:home'),
+            'category_detail': reverse('store:category_detail', args=[product.category.slug]),
+            'product_detail': reverse('store:product_detail', args=[product.slug]),
+            'cart': reverse('store:cart'),
+            'checkout': checkout,
+            'checkout_post': checkout,
+            'order_history': reverse('store:order_history'),
+            'order_confirmation': reverse('store:order_confirmation', args=[order.order_id]),
+        }
+
+    def request(self, client, view, url):
+        if view == 'checkout_post':
+            # Each order is rolled back so the cart is full for the next one.
+            sid = transaction.savepoint()
+            start = time.perf_counter()
+            response = client.post(url, SHIPPING)
+            elapsed = time.perf_counter() - start
+            transaction.savepoint_rollback(sid)
+        else:
+            start = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise CommandError(f"{view} returned {response.status_code}")
+        return response, elapsed * 1000
+
+    def measure(self, client, view, url, options):
+        for _ in range(options['warmup']):
+            self.request(client, view, url)
+        timings = sorted(
+            self.request(client, view, url)[1] for _ in range(options['iterations'])
+        )
+        # Counted on a separate request: capturing queries slows the timed ones.
+        with CaptureQueriesContext(connection) as queries:
+            response, _ = self.request(client, view, url)
+        return {
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'queries': len(queries),
+            'bytes': len(response.content),
+        }
+
+    def compare(self, path, results):
+        with open(path) as fh:
+            baseline = json.load(fh)['views']
+        self.stderr.write(f"{'view':<20} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'queries':>9}")
+        for view, result in results.items():
+            before = baseline.get(view)
+            if before is None:
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            self.stderr.write(
+                f"{view:<20} {before['p95_ms']:11.2f} {result['p95_ms']:10.2f} {change:+7.1f}% "
+                f"{before['queries']:>4}->{result['queries']:<4}"
+            )
@@ -0,0 +1,154 @@
+import re
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from store.models import Cart, CartItem, Category, Order, OrderItem, Product
+
+ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the storefront views, runs EXPLAIN on every SELECT they issue "
+        "and fails if any of them full-scans a large table. All writes, "
+        "including --seed data, are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help="Tables with at least this many rows count as large.",
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Insert this many extra products and orders before checking.",
+        )
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f"Unsupported database backend: {connection.vendor}")
+
+        self.min_rows = options['min_rows']
+        self.verbose_plans = options['verbose_plans']
+        failures = []
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+                failures = self.check_views()
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            for view, table, sql in failures:
+                self.stderr.write(f"{view}: full scan of {table}\n    {sql}")
+            raise CommandError(f"{len(failures)} quer(y/ies) full-scan a large table")
+        self.stdout.write(self.style.SUCCESS("No view query full-scans a large table"))
+
+    def seed(self, count):
+        category = Category.objects.create(name='Plan check', slug='plan-check')
+        Product.objects.bulk_create([
+            Product(category=category, name=f"Plan check {i}", slug=f"plan-check-{i}",
+                    price=Decimal('10.00'), stock=100)
+            for i in range(count)
+        ], batch_size=1000)
+        user = User.objects.create_user('plan-check')
+        Order.objects.bulk_create([
+            Order(user=user, order_id=f"PC{i:06d}", full_name='Plan check', email='plan@example.com',
+                  phone_number='0', city='-', postal_code='0', country='-', total_price=0)
+            for i in range(count)
+        ], batch_size=1000)
+
+    def fixtures(self):
+        """
+        Returns a user with a cart line and an order, plus a product, all
+        created inside the rolled-back transaction.
+        """
+        product = Product.objects.filter(available=True).select_related('category').first()
+        if product is None:
+            raise CommandError("No available products; pass --seed N or load data first.")
+        user = User.objects.create_user('plan-check-shopper')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=product, quantity=1)
+        order = Order.objects.create(
+            user=user, full_name='Plan check', email='plan@example.com', phone_number='0',
+            city='-', postal_code='0', country='-', total_price=product.price,
+        )
+        OrderItem.snapshot(product, order=order, quantity=1, price=product.price).save()
+        return user, product, order
+
+    def check_views(self):
+        user, product, order = self.fixtures()
+        urls = {
+            'home': reverse('store:home'),
+            'category_detail': reverse('store:category_detail', args=[product.category.slug]),
+            'product_detail': reverse('store:product_detail', args=[product.slug]),
+            'cart': reverse('store:cart'),
+            'checkout': reverse('store:checkout'),
+            'order_history': reverse('store:order_history'),
+            'order_confirmation': reverse('store:order_confirmation', args=[order.order_id]),
+            'search': f"{reverse('store:search')}?q={product.name.split()[0]}",
+        }
+        sizes = self.table_sizes()
+        failures = []
+
+        client = Client()
+        client.force_login(user)
+        dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(ALLOWED_HOSTS=['*'], CACHES=dummy_cache):
+            for view, url in urls.items():
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+                if response.status_code >= 400:
+                    raise CommandError(f"{view} returned {response.status_code}")
+                for query in queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    for table in self.full_scans(sql):
+                        if sizes.get(table, 0) >= self.min_rows:
+                            failures.append((view, table, sql))
+        return failures
+
+    def table_sizes(self):
+        sizes = {}
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+                sizes[table] = cursor.fetchone()[0]
+        return sizes
+
+    def full_scans(self, sql):
+        """
+        Returns the tables that the plan for ``sql`` reads in full.
+        """
+        aliases = {alias: table for table, alias in ALIAS_RE.findall(sql)}
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                details = [row[-1] for row in cursor.fetchall()]
+                scanned = [
+                    detail.split()[1] for detail in details
+                    if detail.startswith('SCAN ') and len(detail.split()) > 1
+                ]
+            else:
+                cursor.execute(f"EXPLAIN {sql}")
+                columns = [col[0] for col in cursor.description]
+                details = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                scanned = [row['table'] for row in details if row['type'] == 'ALL']
+
+        if self.verbose_plans:
+            self.stdout.write(f"{sql}\n    {details}")
+        return [aliases.get(table, table) for table in scanned]
@@ -0,0 +1,57 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from store.exports import CHUNK_SIZE, FORMATS, export_rows, filter_orders
+from store.models import Order
+
+
+def parse_moment(value):
+    """
+    Accepts an ISO date (midnight, local time) or datetime.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams orders and their lines as CSV (one row per line) or JSON "
+        "lines (one object per order) in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument(
+            '--status', action='append', choices=[status for status, _ in Order.STATUS_CHOICES],
+            help="Only orders with this status; repeatable.",
+        )
+        parser.add_argument('--since', help="Orders created at or after this date/datetime.")
+        parser.add_argument('--until', help="Orders created before this date/datetime.")
+        parser.add_argument('--output', '-o', help="File to write; defaults to stdout.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = options['since'] and parse_moment(options['since'])
+            until = options['until'] and parse_moment(options['until'])
+        except ValueError as exc:
+            raise CommandError(f"Not a date or datetime: {exc}")
+
+        orders = filter_orders(Order.objects.all(), options['status'], since, until)
+        chunks = FORMATS[options['format']](export_rows(orders, options['chunk_size']))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+                out.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
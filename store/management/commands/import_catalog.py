@@ -0,0 +1,382 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from botocore.exceptions import BotoCoreError, ClientError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from store.cart_summary import bump_price_version
+from store.catalog_cache import bump_catalog_version
+from store.images import queue_image_variants
+from store.models import Category, Product, ProductImage
+from store.search import index_products
+
+# Written by the upsert; compared against the database to skip unchanged rows.
+PRODUCT_FIELDS = ('category', 'name', 'description', 'price', 'discount_percentage', 'stock', 'available')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off'}
+GALLERY_SEPARATOR = '|'
+# Local files and the S3 media storage.
+STORAGE_ERRORS = (OSError, BotoCoreError, ClientError)
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, format):
+    """
+    Yields ``(line number, row)``; CSV rows are dicts, JSONL rows are the
+    undecoded line.
+    """
+    with open(path, encoding='utf-8', newline='') as source:
+        if format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(source, 1):
+                if line.strip():
+                    yield number, line
+
+
+def _text(row, key, default=''):
+    value = row.get(key)
+    return default if value is None else str(value).strip()
+
+
+def _integer(row, key, default, maximum=None):
+    value = _text(row, key)
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise RowError(f"{key} is not a whole number: {value!r}")
+    if number < 0 or (maximum is not None and number > maximum):
+        raise RowError(f"{key} is out of range: {number}")
+    return number
+
+
+def parse_row(raw):
+    """
+    Normalizes one input row. ``name``, ``category`` and ``price`` are
+    required; slugs default to the slugified names. ``gallery`` is ``None``
+    when the row has no gallery column, which leaves the gallery alone.
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as exc:
+            raise RowError(f"invalid JSON: {exc}")
+        if not isinstance(raw, dict):
+            raise RowError("expected a JSON object")
+
+    name, category_name = _text(raw, 'name'), _text(raw, 'category')
+    if not name or not category_name:
+        raise RowError("name and category are required")
+    try:
+        price = Decimal(_text(raw, 'price')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError(f"price is not a number: {raw.get('price')!r}")
+    if price < 0:
+        raise RowError(f"price is negative: {price}")
+    available = _text(raw, 'available', 'true').lower()
+    if available not in TRUE_VALUES | FALSE_VALUES:
+        raise RowError(f"available is not a boolean: {available!r}")
+
+    gallery = raw.get('gallery')
+    if isinstance(gallery, str):
+        gallery = [name.strip() for name in gallery.split(GALLERY_SEPARATOR) if name.strip()]
+
+    row = {
+        'slug': _text(raw, 'slug') or slugify(name),
+        'category_slug': _text(raw, 'category_slug') or slugify(category_name),
+        'category_name': category_name,
+        'name': name,
+        'description': _text(raw, 'description'),
+        'price': price,
+        'discount_percentage': _integer(raw, 'discount_percentage', 0, maximum=100),
+        'stock': _integer(raw, 'stock', 0),
+        'available': available in TRUE_VALUES,
+        'image': _text(raw, 'image'),
+        'gallery': gallery,
+    }
+    if not row['slug'] or not row['category_slug']:
+        raise RowError("name and category must contain letters or digits")
+    return row
+
+
+def store_image(path, upload_to, slug, known):
+    """
+    Writes the file at ``path`` to the default storage as
+    ``<upload_to><slug>-<content hash><ext>`` and returns ``(name, bytes
+    written)``. Names in ``known``, or already in the storage, are not
+    written again. Runs in the worker threads, so it must not touch the
+    database.
+    """
+    with open(path, 'rb') as source:
+        data = source.read()
+    extension = os.path.splitext(path)[1].lower()
+    name = f"{upload_to}{slug}-{hashlib.sha256(data).hexdigest()[:16]}{extension}"
+    if name in known or default_storage.exists(name):
+        return name, 0
+    return default_storage.save(name, ContentFile(data)), len(data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates or updates categories, products and product images from a "
+        "CSV or JSON-lines file, matched by slug. Columns: name, category, "
+        "price (required); slug, category_slug, description, "
+        "discount_percentage, stock, available, image, gallery (CSV: names "
+        "separated by '|'). Image names are files in --images. Rows are "
+        "upserted in batches and only changed rows are written, so "
+        "re-importing an unchanged file writes nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Default: from the file extension.")
+        parser.add_argument('--images', help="Directory of image files (default: the input file's directory).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=8,
+                            help="Threads uploading images to the storage.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f"No such file: {path}")
+        format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.images = options['images'] or os.path.dirname(os.path.abspath(path))
+        self.stats = Counter()
+        # slug -> (pk, name), kept across batches; catalogs have few categories.
+        self.categories = {}
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target.
+        self.conflict_target = (
+            {'unique_fields': ['slug']} if connection.features.supports_update_conflicts_with_target else {}
+        )
+        start = time.perf_counter()
+
+        rows = read_rows(path, format)
+        with ThreadPoolExecutor(max_workers=options['workers']) as self.pool:
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch)
+                rate = self.stats['rows'] / max(time.perf_counter() - start, 1e-9)
+                self.stdout.write(f"rows: {self.stats['rows']} ({rate:,.0f}/s)", ending='\r')
+                self.stdout.flush()
+        self.stdout.write('')
+
+        if self.stats['changed']:
+            # bulk writes send no signals.
+            bump_catalog_version()
+        if self.stats['products updated']:
+            # Updated rows may carry new prices for products in carts.
+            bump_price_version()
+        self.report(time.perf_counter() - start)
+
+    def import_batch(self, batch):
+        rows = {}
+        for number, raw in batch:
+            try:
+                row = parse_row(raw)
+            except RowError as exc:
+                self.stats['errors'] += 1
+                self.stderr.write(f"line {number}: {exc}")
+                continue
+            # A slug repeated within a batch would hit the same row twice in
+            # one upsert; the last occurrence wins.
+            rows[row['slug']] = row
+        self.stats['rows'] += len(batch)
+        if not rows:
+            return
+
+        with transaction.atomic():
+            clashes = self.upsert_categories(rows.values())
+            for slug in [slug for slug, row in rows.items() if row['category_slug'] in clashes]:
+                del rows[slug]
+                self.stats['skipped'] += 1
+            products = self.upsert_products(rows)
+        self.attach_images(rows, products)
+
+    def upsert_categories(self, rows):
+        """
+        Creates or renames the batch's categories and returns the slugs of
+        those that were skipped because another category has their name.
+        """
+        wanted = {row['category_slug']: row['category_name'] for row in rows}
+        unknown = [slug for slug in wanted if slug not in self.categories]
+        for slug, pk, name in Category.objects.filter(slug__in=unknown).values_list('slug', 'pk', 'name'):
+            self.categories[slug] = (pk, name)
+
+        changed = {
+            slug: name for slug, name in wanted.items()
+            if self.categories.get(slug, (None, None))[1] != name
+        }
+        # Category.name is unique too, but the upsert only resolves slug
+        # conflicts (and on MySQL would quietly update the other category).
+        owners = dict(Category.objects.filter(name__in=changed.values()).values_list('name', 'slug'))
+        clashes = set()
+        for slug, name in changed.items():
+            owner = owners.setdefault(name, slug)
+            if owner != slug:
+                clashes.add(slug)
+                self.stderr.write(
+                    f"category {slug}: the name {name!r} belongs to category {owner}; its rows are skipped"
+                )
+        changed = [Category(slug=slug, name=name) for slug, name in changed.items() if slug not in clashes]
+        if not changed:
+            return clashes
+        Category.objects.bulk_create(
+            changed, update_conflicts=True, update_fields=['name'], **self.conflict_target,
+        )
+        for category in changed:
+            self.stats['categories updated' if category.slug in self.categories else 'categories created'] += 1
+        slugs = [category.slug for category in changed]
+        for slug, pk, name in Category.objects.filter(slug__in=slugs).values_list('slug', 'pk', 'name'):
+            self.categories[slug] = (pk, name)
+        self.stats['changed'] += len(changed)
+        return clashes
+
+    def upsert_products(self, rows):
+        """
+        Writes the rows that differ from the database in one upsert and
+        returns ``{slug: (pk, image name)}`` for every row.
+        """
+        existing = {
+            product['slug']: product
+            for product in Product.objects.filter(slug__in=rows).values('slug', 'pk', 'image', *PRODUCT_FIELDS)
+        }
+        changed = []
+        for slug, row in rows.items():
+            values = {field: row[field] for field in PRODUCT_FIELDS if field != 'category'}
+            values['category'] = self.categories[row['category_slug']][0]
+            current = existing.get(slug)
+            if current is not None and all(current[field] == values[field] for field in PRODUCT_FIELDS):
+                continue
+            values['category_id'] = values.pop('category')
+            changed.append(Product(slug=slug, **values))
+
+        self.stats['products unchanged'] += len(rows) - len(changed)
+        if changed:
+            Product.objects.bulk_create(
+                changed, update_conflicts=True, update_fields=[*PRODUCT_FIELDS, 'updated_at'],
+                **self.conflict_target,
+            )
+            slugs = [product.slug for product in changed]
+            written = list(Product.objects.filter(slug__in=slugs).select_related('category'))
+            index_products(written)
+            for product in written:
+                if product.slug not in existing:
+                    self.stats['products created'] += 1
+                    existing[product.slug] = {'pk': product.pk, 'image': product.image.name}
+                else:
+                    self.stats['products updated'] += 1
+            self.stats['changed'] += len(changed)
+        return {slug: (product['pk'], product['image'] or '') for slug, product in existing.items()}
+
+    def attach_images(self, rows, products):
+        """
+        Uploads the batch's images on the thread pool, then points products
+        at their main image and makes each listed gallery match its row.
+        """
+        gallery_rows = {slug: row for slug, row in rows.items() if row['gallery'] is not None}
+        galleries = {}
+        for product_id, pk, name in (
+            ProductImage.objects
+            .filter(product_id__in=[products[slug][0] for slug in gallery_rows])
+            .values_list('product_id', 'pk', 'image')
+        ):
+            galleries.setdefault(product_id, {})[name] = pk
+
+        jobs = []
+        for slug, row in rows.items():
+            pk, image = products[slug]
+            if row['image']:
+                jobs.append((slug, None, self.submit(row['image'], 'products/', slug, {image})))
+            for position, name in enumerate(row['gallery'] or ()):
+                known = galleries.get(pk, {}).keys()
+                jobs.append((slug, position, self.submit(name, 'products/gallery/', slug, known)))
+
+        images, gallery, failed = {}, {}, set()
+        for slug, position, future in jobs:
+            try:
+                name, written = future.result()
+            except STORAGE_ERRORS as exc:
+                self.stats['image errors'] += 1
+                self.stderr.write(f"{slug}: {exc}")
+                failed.add(slug)
+                continue
+            if written:
+                self.stats['images uploaded'] += 1
+                self.stats['bytes uploaded'] += written
+            if position is None:
+                images[slug] = name
+            else:
+                gallery.setdefault(slug, []).append(name)
+
+        now = timezone.now()
+        changed = [
+            Product(pk=products[slug][0], image=name, updated_at=now)
+            for slug, name in images.items() if name != products[slug][1]
+        ]
+        self.stats['images unchanged'] += len(images) - len(changed)
+        new_gallery, stale_gallery = [], []
+        for slug, row in gallery_rows.items():
+            if slug in failed:
+                # Leave the gallery as it is rather than drop a missing image.
+                continue
+            pk = products[slug][0]
+            current = galleries.get(pk, {})
+            names = dict.fromkeys(gallery.get(slug, ()))
+            self.stats['images unchanged'] += sum(name in current for name in names)
+            new_gallery += [
+                ProductImage(product_id=pk, image=name, alt_text=row['name'])
+                for name in names if name not in current
+            ]
+            stale_gallery += [image_pk for name, image_pk in current.items() if name not in names]
+
+        with transaction.atomic():
+            Product.objects.bulk_update(changed, ['image', 'updated_at'])
+            ProductImage.objects.bulk_create(new_gallery)
+            ProductImage.objects.filter(pk__in=stale_gallery).delete()
+        queue_image_variants(
+            *[product.image.name for product in changed], *[image.image.name for image in new_gallery],
+        )
+        self.stats['changed'] += len(changed) + len(new_gallery) + len(stale_gallery)
+
+    def submit(self, name, upload_to, slug, known):
+        return self.pool.submit(store_image, os.path.join(self.images, name), upload_to, slug, set(known))
+
+    def report(self, elapsed):
+        stats = self.stats
+        megabytes = stats['bytes uploaded'] / 1e6
+        self.stdout.write(
+            f"products: {stats['products created']} created, {stats['products updated']} updated, "
+            f"{stats['products unchanged']} unchanged\n"
+            f"categories: {stats['categories created']} created, {stats['categories updated']} updated\n"
+            f"images: {stats['images uploaded']} uploaded ({megabytes:.1f} MB, "
+            f"{megabytes / max(elapsed, 1e-9):.1f} MB/s), {stats['images unchanged']} unchanged, "
+            f"{stats['image errors']} failed"
+        )
+        style = self.style.WARNING if stats['errors'] or stats['skipped'] or stats['image errors'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Imported {stats['rows']} rows in {elapsed:.1f}s "
+            f"({stats['rows'] / max(elapsed, 1e-9):,.0f} rows/s), {stats['errors']} rejected, "
+            f"{stats['skipped']} skipped"
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from store.authentication import hash_key
+from store.management.commands.seed_store import explicit_timestamps
+from store.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Stores the hash of every plaintext rest_framework authtoken key as an "
+        "ApiToken, so clients holding those keys keep working. With --delete "
+        "the plaintext rows are removed afterwards. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--delete', action='store_true',
+                            help="Delete the plaintext tokens once they are hashed.")
+
+    def handle(self, *args, **options):
+        copied = 0
+        # Keep each token's own creation time.
+        with transaction.atomic(), explicit_timestamps(ApiToken):
+            tokens = Token.objects.values_list('key', 'user_id', 'created')
+            batch = []
+            for key, user_id, created in tokens.iterator(chunk_size=options['batch_size']):
+                batch.append(ApiToken(digest=hash_key(key), user_id=user_id, created=created))
+                if len(batch) == options['batch_size']:
+                    copied += self.flush(batch)
+                    batch = []
+            copied += self.flush(batch)
+            if options['delete']:
+                Token.objects.all().delete()
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {copied} token(s)"))
+
+    def flush(self, batch):
+        ApiToken.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
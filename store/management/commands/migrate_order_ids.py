@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Order
+from store.order_ids import encode_order_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves random order IDs issued before pk-derived IDs into legacy_order_id "
+        "and gives those orders their pk-derived ID. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        stale = [
+            order for order in
+            Order.objects.filter(legacy_order_id__isnull=True).only('pk', 'order_id').iterator()
+            if order.order_id != encode_order_id(order.pk)
+        ]
+        self.stdout.write(f"{len(stale)} order(s) have a legacy random ID")
+        if options['dry_run'] or not stale:
+            return
+
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            # Free every legacy value first so no pk-derived ID can clash with
+            # a legacy ID that has not been moved yet.
+            for order in stale:
+                order.legacy_order_id, order.order_id = order.order_id, None
+            Order.objects.bulk_update(stale, ['legacy_order_id', 'order_id'], batch_size=batch_size)
+
+            for order in stale:
+                order.order_id = encode_order_id(order.pk)
+            Order.objects.bulk_update(stale, ['order_id'], batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f"Migrated {len(stale)} order ID(s)"))
@@ -0,0 +1,68 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from store.catalog_cache import bump_catalog_version
+from store.images import (
+    DEFAULT_BATCH_SIZE, DEFAULT_MAX_ATTEMPTS, process_image_variants, queue_image_variants,
+)
+from store.models import Category, Product, ProductImage
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = "Generates resized WebP/JPEG variants for uploaded product and category images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help="Queue every existing image that has no variants yet before processing.",
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep polling the queue instead of exiting once it is empty.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help="Seconds to sleep between polls when the queue is empty (with --loop).",
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            for model in (Category, Product, ProductImage):
+                names = (
+                    model.objects.exclude(image='').exclude(image=None)
+                    .values_list('image', flat=True).iterator(chunk_size=BACKFILL_CHUNK_SIZE)
+                )
+                for chunk in iter(lambda: list(islice(names, BACKFILL_CHUNK_SIZE)), []):
+                    queue_image_variants(*chunk)
+
+        total_done = total_failed = 0
+        unpublished = 0
+        while True:
+            done, failed = process_image_variants(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+            )
+            total_done += done
+            total_failed += failed
+            unpublished += done
+            if done or failed:
+                self.stdout.write(f"Processed {done}, failed {failed}")
+                continue
+            # One bump per drained queue rather than per batch, so cached
+            # pages are rebuilt once with every new srcset.
+            if unpublished:
+                bump_catalog_version()
+                unpublished = 0
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Image variants done: {total_done} processed, {total_failed} failed"
+        ))
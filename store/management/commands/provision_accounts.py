@@ -0,0 +1,72 @@
+import csv
+import os
+import time
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+
+from store.accounts import DEFAULT_BATCH_SIZE, PROFILE_FIELDS, provision_accounts
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates customer accounts from a CSV file with username and email "
+        "columns, plus optional password, first_name, last_name and profile "
+        f"columns ({', '.join(PROFILE_FIELDS)}). Rows without a password get "
+        "an unusable one (customers set theirs through password reset). "
+        "Existing usernames are skipped, so a list can be re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Threads hashing passwords.")
+        parser.add_argument('--tokens', metavar='CSV',
+                            help="Also issue an API token for every new account and write "
+                                 "username,token rows to this file (keys are not stored).")
+
+    def handle(self, *args, **options):
+        if not os.path.isfile(options['path']):
+            raise CommandError(f"No such file: {options['path']}")
+        self.rejected = 0
+        start = time.perf_counter()
+        with open(options['path'], encoding='utf-8', newline='') as source:
+            reader = csv.DictReader(source)
+            missing = {'username', 'email'} - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f"Missing column(s): {', '.join(sorted(missing))}")
+            with ExitStack() as stack:
+                tokens = None
+                if options['tokens']:
+                    out = stack.enter_context(open(options['tokens'], 'w', encoding='utf-8', newline=''))
+                    writer = csv.writer(out)
+                    writer.writerow(['username', 'token'])
+                    tokens = lambda username, key: writer.writerow([username, key])
+                created, skipped = provision_accounts(
+                    self.valid_rows(reader),
+                    batch_size=options['batch_size'], workers=options['workers'], tokens=tokens,
+                )
+
+        elapsed = time.perf_counter() - start
+        if skipped:
+            self.stdout.write(f"Skipped existing username(s): {', '.join(skipped[:20])}"
+                              + (f" and {len(skipped) - 20} more" if len(skipped) > 20 else ''))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} account(s) in {elapsed:.1f}s ({created / max(elapsed, 1e-9):,.0f}/s); "
+            f"{len(skipped)} skipped, {self.rejected} rejected"
+        ))
+
+    def valid_rows(self, reader):
+        for row in reader:
+            try:
+                User.username_validator(row['username'] or '')
+                validate_email(row['email'] or '')
+            except ValidationError as exc:
+                self.rejected += 1
+                self.stderr.write(f"line {reader.line_num}: {'; '.join(exc.messages)}")
+                continue
+            yield row
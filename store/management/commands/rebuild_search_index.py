@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Product, ProductSearchTerm
+from store.search import build_postings
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the product search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+        indexed = postings = 0
+
+        with transaction.atomic():
+            ProductSearchTerm.objects.all().delete()
+            batch = []
+            products = Product.objects.select_related('category').order_by('pk')
+            for product in products.iterator(chunk_size=batch_size):
+                batch.append(product)
+                if len(batch) == batch_size:
+                    postings += self.flush(batch, batch_size)
+                    indexed += len(batch)
+                    batch = []
+                    self.stdout.write(f"Indexed {indexed} products", ending='\r')
+            postings += self.flush(batch, batch_size)
+            indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} products ({postings} postings) "
+            f"in {time.perf_counter() - start:.1f}s"
+        ))
+
+    def flush(self, products, batch_size):
+        rows = build_postings(products)
+        ProductSearchTerm.objects.bulk_create(rows, batch_size=batch_size)
+        return len(rows)
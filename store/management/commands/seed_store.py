@@ -0,0 +1,395 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import accumulate
+from math import gcd
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from django.utils.text import slugify
+
+from store.catalog_cache import bump_catalog_version
+from store.pricing import delivery_charge_for
+from store.models import (
+    Cart, CartItem, Category, Order, OrderItem, Product, ProductImage, ProductSearchTerm, Profile,
+)
+from store.order_ids import encode_order_id
+from store.search import build_postings
+
+CATEGORY_NAMES = [
+    'Pens', 'Pencils', 'Notebooks', 'Diaries', 'Markers', 'Highlighters', 'Erasers',
+    'Files & Folders', 'Art Supplies', 'Sticky Notes', 'Calculators', 'Geometry Sets',
+]
+ADJECTIVES = ['Classic', 'Premium', 'Pastel', 'Matte', 'Eco', 'Pocket', 'Deluxe', 'Slim', 'Neon', 'Vintage']
+NOUNS = ['Gel Pen', 'Ballpoint', 'Pencil Set', 'Notebook', 'Journal', 'Marker', 'Planner', 'Sketchbook', 'Binder', 'Ruler']
+FIRST_NAMES = ['Ali', 'Ayesha', 'Hamza', 'Fatima', 'Usman', 'Zainab', 'Bilal', 'Hira', 'Omar', 'Sana']
+LAST_NAMES = ['Khan', 'Ahmed', 'Malik', 'Hussain', 'Butt', 'Sheikh', 'Qureshi', 'Raza', 'Iqbal', 'Chaudhry']
+# (city, postal code, share of customers)
+CITIES = [
+    ('Karachi', '74000', 30), ('Lahore', '54000', 28), ('Islamabad', '44000', 12),
+    ('Rawalpindi', '46000', 9), ('Faisalabad', '38000', 8), ('Multan', '60000', 6),
+    ('Peshawar', '25000', 4), ('Quetta', '87300', 3),
+]
+# Zipf exponents: a few best sellers and a long tail; repeat customers
+# are spread more evenly.
+PRODUCT_SKEW = 0.9
+CUSTOMER_SKEW = 0.7
+# pks looked up per query by PkSampler.
+LOOKUP_CHUNK = 900
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Lets generated rows keep their own ``created_at``/``updated_at`` instead
+    of having ``auto_now``/``auto_now_add`` stamp them all with the same time.
+    """
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def zipf_cum_weights(count, rng, skew=PRODUCT_SKEW):
+    """
+    Cumulative Zipf weights over ``count`` items in a shuffled rank order.
+    """
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(accumulate(1 / rank ** skew for rank in ranks))
+
+
+class PkSampler:
+    """
+    Draws rows of ``queryset`` with Zipf-skewed popularity without loading
+    them all. A rank is drawn from the continuous power law over the pk
+    range and scattered across it by a fixed permutation, then the drawn
+    pks are looked up in chunks. Gaps in the pk range, and rows the
+    queryset excludes, are redrawn.
+    """
+    max_rounds = 50
+
+    def __init__(self, queryset, rng, skew, fields=()):
+        self.queryset = queryset.values_list('pk', *fields)
+        self.rng = rng
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        self.low = bounds['low']
+        self.size = 0 if self.low is None else bounds['high'] - self.low + 1
+        self.exponent = 1 - skew
+        # An odd multiplier coprime with the range makes rank -> pk a
+        # permutation, so popularity is not tied to pk order.
+        self.step = rng.randrange(1, max(self.size, 2)) | 1
+        while self.size and gcd(self.step, self.size) != 1:
+            self.step += 2
+        self.offset = rng.randrange(max(self.size, 1))
+
+    def __bool__(self):
+        return self.size > 0
+
+    def draw(self):
+        u = self.rng.random()
+        if self.exponent:
+            rank = (1 + u * ((self.size + 1) ** self.exponent - 1)) ** (1 / self.exponent)
+        else:
+            rank = (self.size + 1) ** u
+        rank = min(int(rank) - 1, self.size - 1)
+        return self.low + (rank * self.step + self.offset) % self.size
+
+    def sample(self, k):
+        """
+        Returns ``k`` rows (``pk`` first, then ``fields``) in draw order.
+        """
+        rows = []
+        for _ in range(self.max_rounds):
+            wanted = [self.draw() for _ in range(k - len(rows))]
+            found = {}
+            unique = sorted(set(wanted))
+            for i in range(0, len(unique), LOOKUP_CHUNK):
+                for row in self.queryset.filter(pk__in=unique[i:i + LOOKUP_CHUNK]):
+                    found[row[0]] = row
+            rows += [found[pk] for pk in wanted if pk in found]
+            if len(rows) == k:
+                return rows
+        raise CommandError(f"Too few {self.queryset.model._meta.verbose_name_plural} in the pk range to sample.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic catalog, customer, cart and order data for scale "
+        "testing. Rows are written with batched bulk_create, so no model "
+        "signals run; profiles, order IDs and the catalog cache version are "
+        "handled here instead. The same --seed on the same database produces "
+        "the same rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--images-per-product', type=float, default=2.0,
+                            help="Average gallery images per product.")
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--cart-fraction', type=float, default=0.2,
+                            help="Share of new users who get a non-empty cart.")
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--items-per-order', type=float, default=2.5,
+                            help="Average distinct products per order.")
+        parser.add_argument('--days', type=int, default=365,
+                            help="Spread creation times over this many past days.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--password', default=None,
+                            help="Password for every generated user (default: unusable).")
+        parser.add_argument('--search-index', action='store_true',
+                            help="Also index the generated products for search.")
+
+    def handle(self, *args, **options):
+        if options['orders'] and not (options['users'] or User.objects.exists()):
+            raise CommandError("Orders need users; pass --users.")
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Midnight today keeps timestamps reproducible for a given seed.
+        self.until = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.span = timedelta(days=options['days'])
+        start = time.perf_counter()
+
+        with explicit_timestamps(Product, Cart, CartItem, Order):
+            if options['categories']:
+                self.seed_categories(options['categories'])
+            if options['products']:
+                self.seed_products(options['products'], options['images_per_product'])
+            if options['users']:
+                self.seed_users(options['users'], options['password'], options['cart_fraction'])
+            if options['orders']:
+                self.seed_orders(options['orders'], options['items_per_order'])
+
+        self.reset_sequences()
+        if options['search_index'] and options['products']:
+            self.index_new_products()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - start:.1f}s"))
+
+    # ——— helpers ——————————————————————————————————————————————————
+
+    def moment(self, index, total):
+        """
+        A creation time that advances with ``index``, so pk order roughly
+        follows time order as it does in production.
+        """
+        fraction = (index + self.rng.random()) / max(total, 1)
+        return self.until - self.span * (1 - fraction)
+
+    def batches(self, label, total, first_pk):
+        """
+        Yields ``(first_pk, count)`` per batch, each inside its own
+        transaction, and streams progress.
+        """
+        start = time.perf_counter()
+        done = 0
+        while done < total:
+            count = min(self.batch_size, total - done)
+            with transaction.atomic():
+                yield first_pk + done, count
+            done += count
+            rate = done / max(time.perf_counter() - start, 1e-9)
+            self.stdout.write(f"{label}: {done}/{total} ({rate:,.0f}/s)", ending='\r')
+            self.stdout.flush()
+        self.stdout.write('')
+
+    def reset_sequences(self):
+        models = [Category, Product, ProductImage, User, Profile, Cart, CartItem, Order, OrderItem]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    # ——— phases ———————————————————————————————————————————————————
+
+    def seed_categories(self, total):
+        first = next_pk(Category)
+        Category.objects.bulk_create([
+            Category(
+                pk=pk, name=f"{CATEGORY_NAMES[i % len(CATEGORY_NAMES)]} {pk}",
+                slug=f"{slugify(CATEGORY_NAMES[i % len(CATEGORY_NAMES)])}-{pk}",
+                description="Generated category.",
+            )
+            for i, pk in enumerate(range(first, first + total))
+        ])
+        self.stdout.write(f"categories: {total}")
+
+    def seed_products(self, total, images_per_product):
+        category_ids = list(Category.objects.values_list('pk', flat=True))
+        if not category_ids:
+            raise CommandError("Products need categories; pass --categories.")
+        category_weights = zipf_cum_weights(len(category_ids), self.rng)
+        rng = self.rng
+        image_pk = next_pk(ProductImage)
+        first_product = next_pk(Product)
+
+        for first, count in self.batches('products', total, first_product):
+            products, images = [], []
+            for pk in range(first, first + count):
+                name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {pk}"
+                created = self.moment(pk - first_product, total)
+                # Log-normal prices: most items are cheap, a long tail is not.
+                price = Decimal(max(20, round(rng.lognormvariate(5.7, 0.8)))).quantize(Decimal('1.00'))
+                products.append(Product(
+                    pk=pk,
+                    category_id=rng.choices(category_ids, cum_weights=category_weights)[0],
+                    name=name, slug=slugify(name),
+                    description=f"{name} for school, office and home. " * rng.randint(1, 6),
+                    image=f"products/seed-{pk}.jpg" if rng.random() < 0.9 else None,
+                    price=price,
+                    discount_percentage=0 if rng.random() < 0.75 else rng.choice((5, 10, 15, 20, 25, 40)),
+                    stock=rng.randint(0, 500),
+                    available=rng.random() < 0.95,
+                    created_at=created, updated_at=created,
+                ))
+                for _ in range(min(int(rng.expovariate(1 / images_per_product)), 8) if images_per_product else 0):
+                    images.append(ProductImage(
+                        pk=image_pk, product_id=pk, image=f"products/gallery/seed-{image_pk}.jpg",
+                        alt_text=name,
+                    ))
+                    image_pk += 1
+            Product.objects.bulk_create(products)
+            ProductImage.objects.bulk_create(images)
+
+    def seed_users(self, total, password, cart_fraction):
+        rng = self.rng
+        password = make_password(password)
+        first_user = next_pk(User)
+        products = PkSampler(Product.objects.filter(available=True), rng, PRODUCT_SKEW)
+        city_weights = list(accumulate(share for _, _, share in CITIES))
+        profile_pk, cart_pk, item_pk = next_pk(Profile), next_pk(Cart), next_pk(CartItem)
+
+        for first, count in self.batches('users', total, first_user):
+            users, profiles, carts, items = [], [], [], []
+            for pk in range(first, first + count):
+                first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                joined = self.moment(pk - first_user, total)
+                users.append(User(
+                    pk=pk, username=f"shopper{pk}", email=f"shopper{pk}@example.com",
+                    first_name=first_name, last_name=last_name, password=password,
+                    date_joined=joined,
+                ))
+                city, postal_code, _ = rng.choices(CITIES, cum_weights=city_weights)[0]
+                profiles.append(Profile(
+                    pk=profile_pk, user_id=pk, phone_number=f"03{rng.randint(0, 999999999):09d}",
+                    address_line1=f"House {rng.randint(1, 999)}, Street {rng.randint(1, 80)}",
+                    city=city, postal_code=postal_code,
+                ))
+                profile_pk += 1
+                if products and rng.random() < cart_fraction:
+                    added = self.until - (self.until - joined) * rng.random()
+                    carts.append((Cart(pk=cart_pk, user_id=pk, created_at=added), rng.randint(1, 6)))
+                    cart_pk += 1
+            # One sample (a few queries) for every cart in the batch.
+            picks = iter(products.sample(sum(lines for _, lines in carts)) if carts else ())
+            for cart, lines in carts:
+                for product_id, in dict.fromkeys(next(picks) for _ in range(lines)):
+                    items.append(CartItem(
+                        pk=item_pk, cart_id=cart.pk, product_id=product_id,
+                        quantity=rng.choice((1, 1, 1, 2, 2, 3)), added_at=cart.created_at,
+                    ))
+                    item_pk += 1
+            carts = [cart for cart, _ in carts]
+            User.objects.bulk_create(users)
+            Profile.objects.bulk_create(profiles)
+            Cart.objects.bulk_create(carts)
+            CartItem.objects.bulk_create(items)
+
+    def seed_orders(self, total, items_per_order):
+        rng = self.rng
+        users = PkSampler(
+            User.objects.filter(profile__isnull=False), rng, CUSTOMER_SKEW,
+            fields=('first_name', 'last_name', 'email', 'profile__phone_number', 'profile__address_line1',
+                    'profile__city', 'profile__postal_code', 'profile__country'),
+        )
+        if not users:
+            raise CommandError("Orders need users with profiles; pass --users.")
+        products = PkSampler(
+            Product.objects.all(), rng, PRODUCT_SKEW,
+            fields=('price', 'discount_percentage', 'name', 'slug', 'image'),
+        )
+        if not products:
+            raise CommandError("Orders need products; pass --products.")
+        extra_items = max(items_per_order - 1, 0)
+        item_pk = next_pk(OrderItem)
+        first_order = next_pk(Order)
+
+        for first, count in self.batches('orders', total, first_order):
+            orders, items = [], []
+            buyers = users.sample(count)
+            line_counts = [
+                1 + (min(int(rng.expovariate(1 / extra_items)), 9) if extra_items else 0)
+                for _ in range(count)
+            ]
+            picks = iter(products.sample(sum(line_counts)))
+            for pk, user, lines in zip(range(first, first + count), buyers, line_counts):
+                created = self.moment(pk - first_order, total)
+                age = self.until - created
+                subtotal = Decimal('0.00')
+                for product_id, price, discount, name, slug, image in {
+                    p[0]: p for p in (next(picks) for _ in range(lines))
+                }.values():
+                    quantity = rng.choice((1, 1, 1, 2, 2, 3, 5))
+                    final = (price * (100 - discount) / 100).quantize(Decimal('0.01'), ROUND_HALF_UP)
+                    subtotal += final * quantity
+                    items.append(OrderItem(
+                        pk=item_pk, order_id=pk, product_id=product_id, quantity=quantity,
+                        product_name=name, product_slug=slug, product_image=image or '',
+                        price=price, discount_price=final if discount else None,
+                    ))
+                    item_pk += 1
+                delivery = delivery_charge_for(subtotal)
+                if rng.random() < 0.05:
+                    status = 'canceled'
+                elif age > timedelta(days=7):
+                    status = 'completed'
+                else:
+                    status = rng.choice(('pending', 'processing', 'completed'))
+                orders.append(Order(
+                    pk=pk, order_id=encode_order_id(pk), user_id=user[0],
+                    full_name=f"{user[1]} {user[2]}", email=user[3], phone_number=user[4],
+                    complete_address=user[5], city=user[6], postal_code=user[7], country=user[8],
+                    status=status, delivery_charge=delivery, total_price=subtotal + delivery,
+                    created_at=created, updated_at=created,
+                ))
+            Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create(items)
+
+    def index_new_products(self):
+        """
+        Indexes products without postings, in pk order, a batch at a time.
+        """
+        products = (
+            Product.objects.select_related('category')
+            .filter(~Exists(ProductSearchTerm.objects.filter(product=OuterRef('pk'))))
+            .order_by('pk')
+        )
+        last = 0
+        while True:
+            batch = list(products.filter(pk__gt=last)[:self.batch_size])
+            if not batch:
+                break
+            ProductSearchTerm.objects.bulk_create(build_postings(batch), batch_size=self.batch_size)
+            last = batch[-1].pk
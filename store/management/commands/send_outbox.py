@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.outbox import DEFAULT_BATCH_SIZE, DEFAULT_MAX_ATTEMPTS, drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Delivers queued emails from the outbox in batches over one mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep polling the outbox instead of exiting once it is drained.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help="Seconds to sleep between polls when the outbox is empty (with --loop).",
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = drain_outbox(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+            )
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox drained: {total_sent} sent, {total_failed} failed"
+        ))
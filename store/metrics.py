@@ -0,0 +1,280 @@
+# store/metrics.py
+"""
+Low-overhead request instrumentation.
+
+``RequestMetricsMiddleware`` opens a ``RequestMetrics`` record for every
+request. While it is open, SQL statements are counted and timed through
+``connection.execute_wrapper``, top-level template renders are timed by the
+``InstrumentedDjangoTemplates`` backend, and the catalog, cart-summary and
+image-variant caches report hits and misses through ``cache_hit`` and
+``cache_miss``. When the response leaves, the numbers go out in a
+``Server-Timing`` header and are folded into per-view histograms that
+``metrics_view`` exposes in the Prometheus text format.
+
+Histograms are kept per process; Prometheus sums them across workers.
+Recording a request takes a handful of ``perf_counter`` calls and one short
+lock, so the middleware can stay on in production.
+"""
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+# Upper bounds in seconds; Prometheus adds +Inf.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+UNRESOLVED_VIEW = '<unresolved>'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('sql_count', 'sql_time', 'template_time', 'template_depth', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper().
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.sql_count += 1
+
+
+def current_metrics():
+    """
+    Returns the ``RequestMetrics`` being recorded, or ``None`` outside a
+    request.
+    """
+    return _current.get()
+
+
+def cache_hit():
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += 1
+
+
+def cache_miss():
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_misses += 1
+
+
+class timed_render:
+    """
+    Adds the time spent in a template render to the current request. Nested
+    renders (a template tag rendering another template) are only counted
+    once, as part of the outer render.
+    """
+    __slots__ = ('metrics', 'start')
+
+    def __enter__(self):
+        self.metrics = metrics = _current.get()
+        if metrics is not None:
+            metrics.template_depth += 1
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - self.start
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewStats:
+    __slots__ = ('duration', 'sql_duration', 'sql_queries', 'template_duration', 'responses', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.sql_duration = Histogram(DURATION_BUCKETS)
+        self.sql_queries = Histogram(QUERY_BUCKETS)
+        self.template_duration = Histogram(DURATION_BUCKETS)
+        self.responses = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class Registry:
+    """
+    Per-view aggregates for this process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, status, duration, metrics):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats()
+            stats.duration.observe(duration)
+            stats.sql_duration.observe(metrics.sql_time)
+            stats.sql_queries.observe(metrics.sql_count)
+            stats.template_duration.observe(metrics.template_time)
+            status_class = f"{status // 100}xx"
+            stats.responses[status_class] = stats.responses.get(status_class, 0) + 1
+            stats.cache_hits += metrics.cache_hits
+            stats.cache_misses += metrics.cache_misses
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+            self._histogram(
+                lines, views, 'scribi_request_duration_seconds', 'duration',
+                "Wall time from the first middleware to the response.",
+            )
+            self._histogram(
+                lines, views, 'scribi_request_db_duration_seconds', 'sql_duration',
+                "Time spent executing SQL per request.",
+            )
+            self._histogram(
+                lines, views, 'scribi_request_db_queries', 'sql_queries',
+                "SQL statements executed per request.",
+            )
+            self._histogram(
+                lines, views, 'scribi_request_template_duration_seconds', 'template_duration',
+                "Time spent rendering templates per request, including lazy queries.",
+            )
+            lines.append('# HELP scribi_responses_total Responses by view and status class.')
+            lines.append('# TYPE scribi_responses_total counter')
+            for view, stats in views:
+                for status_class, count in sorted(stats.responses.items()):
+                    lines.append(
+                        f'scribi_responses_total{{view="{_escape(view)}",status="{status_class}"}} {count}'
+                    )
+            for name, attr, help_text in (
+                ('scribi_cache_hits_total', 'cache_hits', "Application cache hits."),
+                ('scribi_cache_misses_total', 'cache_misses', "Application cache misses."),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for view, stats in views:
+                    lines.append(f'{name}{{view="{_escape(view)}"}} {getattr(stats, attr)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram(lines, views, name, attr, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for view, stats in views:
+            histogram = getattr(stats, attr)
+            label = f'view="{_escape(view)}"'
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label}}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{{label}}} {histogram.count}')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def server_timing(duration, metrics):
+    return (
+        f'app;dur={duration * 1000:.1f}, '
+        f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.sql_count} queries", '
+        f'tpl;dur={metrics.template_time * 1000:.1f}, '
+        f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"'
+    )
+
+
+class RequestMetricsMiddleware:
+    """
+    Records every request; listed first in MIDDLEWARE so the other
+    middleware's queries are included.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.header = getattr(settings, 'SERVER_TIMING_HEADER', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = (match.view_name if match else None) or UNRESOLVED_VIEW
+        registry.record(view, response.status_code, duration, metrics)
+        if self.header:
+            response['Server-Timing'] = server_timing(duration, metrics)
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, for staff sessions or a bearer token equal
+    to ``METRICS_TOKEN``.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    authorized = (
+        (token and constant_time_compare(authorization, f'Bearer {token}'))
+        or (request.user.is_active and request.user.is_staff)
+    )
+    if not authorized:
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
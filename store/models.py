@@ -1,18 +1,46 @@
 # File: store/models.py
-from django.db import models
-from django.conf import settings
-import string
-import random
-
-def generate_unique_order_id():
-    chars = string.ascii_uppercase + string.digits
-    while True:
-        order_id = ''.join(random.choices(chars, k=8))
-        if not Order.objects.filter(order_id=order_id).exists():
-            return order_id
+from decimal import ROUND_HALF_UP, Decimal
 
-
-class Category(models.Model):
+from django.db import models, router, transaction
+from django.conf import settings
+from django.utils import timezone
+from .order_ids import encode_order_id
+
+
+class StoredValuesMixin:
+    """
+    Remembers the values of ``stored_fields`` loaded from the database, so
+    signal receivers can tell which of them a save changed (the
+    ``image_uploaded`` and ``product_prices_changed`` receivers).
+    """
+    stored_fields = ('image',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Raw values, without building FieldFiles; deferred ones are absent.
+        instance._stored = {
+            name: instance.__dict__[name] for name in cls.stored_fields if name in instance.__dict__
+        }
+        return instance
+
+    def changed_stored_fields(self, names):
+        """
+        Returns which of ``names`` differ from their stored values (unknown
+        ones count as changed) and stores the current values.
+        """
+        stored = self.__dict__.setdefault('_stored', {})
+        changed = set()
+        for name in names:
+            field = self._meta.get_field(name)
+            value = field.get_prep_value(field.value_from_object(self))
+            if name not in stored or stored[name] != value:
+                changed.add(name)
+            stored[name] = value
+        return changed
+
+
+class Category(StoredValuesMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -25,7 +53,7 @@ class Category(models.Model):
         return self.name
 
 
-class Product(models.Model):
+class Product(StoredValuesMixin, models.Model):
     category = models.ForeignKey(
         Category,
         related_name="products",
@@ -45,9 +73,20 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # What cart subtotals depend on, besides the image.
+    stored_fields = ('image', 'price', 'discount_percentage', 'available')
+
     class Meta:
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['id', 'slug'])]
+        # `available=True` is emitted as a bare boolean predicate, which the
+        # planners cannot match as an index equality, so it is left as a
+        # residual filter and the indexes serve the ordering instead.
+        indexes = [
+            # category_detail: filter(category, available), keyset on (created_at, id)
+            models.Index(fields=['category', 'created_at', 'id']),
+            # home featured products: filter(available) newest first
+            models.Index(fields=['created_at', 'id']),
+        ]
 
     def __str__(self):
         return self.name
@@ -56,7 +95,14 @@ class Product(models.Model):
         return (self.price * self.discount_percentage) / 100
 
     def get_final_price(self):
-        return self.price - self.get_discount_amount()
+        """
+        The discounted unit price, rounded to the cent like
+        ``store.pricing.unit_price`` rounds it in SQL.
+        """
+        final_price = getattr(self, 'final_price', None)  # from pricing.with_final_price()
+        if final_price is not None:
+            return final_price
+        return (self.price - self.get_discount_amount()).quantize(Decimal('0.01'), ROUND_HALF_UP)
 
 
 
@@ -108,7 +154,11 @@ class Order(models.Model):
         related_name='orders'
     )
 
-    order_id = models.CharField(max_length=8, unique=True, editable=False)
+    # Derived from the pk after insert (see store.order_ids); NULL only inside
+    # the inserting transaction.
+    order_id = models.CharField(max_length=8, unique=True, null=True, editable=False)
+    # Random ID issued before pk-derived IDs; still resolvable by URL.
+    legacy_order_id = models.CharField(max_length=8, unique=True, null=True, blank=True, editable=False)
 
     full_name = models.CharField(max_length=200)
     email = models.EmailField()
@@ -128,10 +178,24 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # order_history: filter(user), keyset on (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id']),
+            # export_orders / admin exports: keyset on (created_at, id),
+            # optionally narrowed by status
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at', 'id']),
+        ]
+
     def save(self, *args, **kwargs):
-        if not self.order_id:
-            self.order_id = generate_unique_order_id()
-        super().save(*args, **kwargs)
+        if self.order_id or self.pk:
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(Order, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            self.order_id = encode_order_id(self.pk)
+            Order.objects.using(using).filter(pk=self.pk).update(order_id=self.order_id)
 
     def __str__(self):
         return f"Order {self.order_id} - {self.full_name}"
@@ -149,10 +213,37 @@ class OrderItem(models.Model):
         on_delete=models.SET_NULL,
         null=True
     )
+    # Snapshot of the product at purchase time, so order pages never need
+    # the product row (which may since have changed or been deleted).
+    product_name = models.CharField(max_length=200, blank=True)
+    product_slug = models.SlugField(max_length=200, blank=True)
+    product_image = models.CharField(max_length=100, blank=True)  # storage key
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Original price
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Price after discount (if any)
 
+    @classmethod
+    def snapshot(cls, product, **kwargs):
+        """
+        An unsaved line for ``product`` with its name, slug and image copied.
+        """
+        return cls(
+            product=product,
+            product_name=product.name,
+            product_slug=product.slug,
+            product_image=product.image.name or '',
+            **kwargs,
+        )
+
+    def save(self, *args, **kwargs):
+        # Lines added by hand (e.g. in the admin) are snapshotted on save.
+        if self.product_id and not self.product_name:
+            snapshot = OrderItem.snapshot(self.product)
+            self.product_name = snapshot.product_name
+            self.product_slug = snapshot.product_slug
+            self.product_image = snapshot.product_image
+        super().save(*args, **kwargs)
+
     def get_final_price(self):
         return self.discount_price if self.discount_price is not None else self.price
 
@@ -160,8 +251,7 @@ class OrderItem(models.Model):
         return self.get_final_price() * self.quantity
 
     def __str__(self):
-        product_name = self.product.name if self.product else "Deleted Product"
-        return f"{self.quantity} x {product_name}"
+        return f"{self.quantity} x {self.product_name or 'Deleted Product'}"
 
 
 
@@ -176,7 +266,44 @@ class Profile(models.Model):
 
     def __str__(self):
         return f"Profile for {self.user.username}"
-class ProductImage(models.Model):
+
+
+class ApiToken(models.Model):
+    """
+    An API key, stored as the SHA-256 hex digest of the key the client holds.
+    Issued and resolved by ``store.authentication``.
+    """
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='api_tokens', on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # issue_token: the user's newest tokens
+            models.Index(fields=['user', 'created']),
+        ]
+
+    def __str__(self):
+        return f"API token {self.digest[:8]}… for {self.user}"
+
+
+class ProductSearchTerm(models.Model):
+    """
+    One posting of the product search index: ``term`` occurs in ``product``
+    with the given ranking ``weight``. Maintained by ``store.search``.
+    """
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, related_name='search_terms', on_delete=models.CASCADE)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('term', 'product')
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id} ({self.weight})"
+
+
+class ProductImage(StoredValuesMixin, models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/gallery/')
     alt_text = models.CharField(max_length=255, blank=True)
@@ -190,12 +317,88 @@ from django.dispatch import receiver
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
+        # store.accounts.create_account attaches the filled-in profile so it
+        # is inserted once rather than created empty and saved again.
+        profile = getattr(instance, '_new_profile', None) or Profile()
+        profile.user = instance
+        profile.save()
 
 
 class Announcement(models.Model):
     message = models.CharField(max_length=255)
     active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['active'])]
+
     def __str__(self):
         return self.message
+
+
+class OutboundEmail(models.Model):
+    """
+    Email queued by a request and delivered later by the ``send_outbox`` worker.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead letter'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+
+class ImageVariantSet(models.Model):
+    """
+    Resized WebP/JPEG variants of one uploaded image, keyed by its storage
+    name. Rows are queued on upload and filled in by the
+    ``process_image_variants`` worker.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    source = models.CharField(max_length=255, unique=True)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    # {"webp": [[width, name], ...], "jpeg": [[width, name], ...]}
+    variants = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.source} ({self.status})"
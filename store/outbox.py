@@ -0,0 +1,119 @@
+# store/outbox.py
+"""
+Database-backed email outbox.
+
+Views call ``enqueue_email`` inside their transaction so a message is only
+queued when the surrounding write commits. The ``send_outbox`` management
+command calls ``drain_outbox`` to deliver queued rows over a single reused
+mail connection, retrying failures with exponential backoff until they are
+moved to the dead-letter state.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import BadHeaderError, EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+
+
+def enqueue_email(subject, message, recipient_list, from_email=None):
+    """
+    Queues an email for delivery by the outbox worker and returns the row.
+    """
+    if '\n' in subject or '\r' in subject:
+        raise BadHeaderError("Header values can't contain newlines")
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def backoff_delay(attempts):
+    """
+    Returns the wait before the next retry after ``attempts`` failed sends.
+    """
+    seconds = BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, BACKOFF_MAX_SECONDS))
+
+
+def _claim_batch(batch_size):
+    """
+    Locks the next due batch so concurrent workers never send the same row.
+    """
+    return list(
+        OutboundEmail.objects
+        .select_for_update(skip_locked=True)
+        .filter(status='pending', next_attempt_at__lte=timezone.now())
+        .order_by('next_attempt_at', 'id')[:batch_size]
+    )
+
+
+def _record_failure(email, error, max_attempts, now):
+    email.last_error = f"{type(error).__name__}: {error}"
+    if email.attempts >= max_attempts:
+        email.status = 'dead'
+    else:
+        email.next_attempt_at = now + backoff_delay(email.attempts)
+
+
+def drain_outbox(batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS, connection=None):
+    """
+    Sends one batch of due emails and returns ``(sent, failed)`` counts.
+
+    All messages in the batch share one open mail connection. A failed send
+    is rescheduled with backoff, or dead-lettered after ``max_attempts``. If
+    the connection cannot be opened, every message in the batch counts as
+    a failed send.
+    """
+    sent = failed = 0
+    update_fields = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    with transaction.atomic():
+        batch = _claim_batch(batch_size)
+        if not batch:
+            return sent, failed
+
+        connection = connection or get_connection(fail_silently=False)
+        try:
+            try:
+                connection.open()
+            except Exception as e:
+                now = timezone.now()
+                for email in batch:
+                    email.attempts += 1
+                    _record_failure(email, e, max_attempts, now)
+                OutboundEmail.objects.bulk_update(batch, update_fields)
+                return sent, len(batch)
+
+            for email in batch:
+                message = EmailMessage(
+                    subject=email.subject,
+                    body=email.body,
+                    from_email=email.from_email or settings.DEFAULT_FROM_EMAIL,
+                    to=email.recipients,
+                    connection=connection,
+                )
+                now = timezone.now()
+                email.attempts += 1
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    failed += 1
+                    _record_failure(email, e, max_attempts, now)
+                else:
+                    sent += 1
+                    email.status = 'sent'
+                    email.sent_at = now
+                    email.last_error = ''
+                email.save(update_fields=update_fields)
+        finally:
+            connection.close()
+    return sent, failed
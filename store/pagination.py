@@ -0,0 +1,146 @@
+# store/pagination.py
+"""
+Keyset (cursor) pagination, by default over ``(created_at, id)``, newest
+first.
+
+Instead of ``OFFSET`` each page asks for the rows that sort after the last
+row of the previous page, so page 500 costs the same index range scan as
+page one. The cursor handed to clients is an opaque url-safe token.
+
+``EstimatedCountPaginator`` is for the admin changelists, which cannot use
+keysets: it avoids the exact ``COUNT(*)`` over large tables.
+"""
+import base64
+import binascii
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import cached_property
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+
+PAGE_SIZE = 24
+# Below this many rows an exact count is cheap enough.
+ESTIMATE_THRESHOLD = 100_000
+# Filtered changelists count at most this many matches.
+COUNT_CAP = 10_000
+
+
+def encode_cursor(obj, field='created_at'):
+    value = getattr(obj, field)
+    value = value.isoformat() if isinstance(value, datetime) else str(value)
+    raw = f"{value}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, parse=datetime.fromisoformat):
+    """
+    Returns ``(value, pk)`` for a cursor, raising ``Http404`` if it is
+    malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.split('|')
+        return parse(value), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, InvalidOperation):
+        raise Http404("Invalid page cursor.")
+
+
+class KeysetPage:
+    """
+    One page of ``queryset`` after ``cursor``. Nothing is queried until the
+    page is iterated, so a template fragment cache hit costs no query.
+
+    ``key`` is the field (or annotation) to order by, with a ``-`` prefix
+    for descending order; ``pk`` breaks ties in the same direction.
+    ``parse`` turns the cursor's text back into a value of that field.
+    """
+    PARSERS = {'created_at': datetime.fromisoformat}
+
+    def __init__(self, queryset, cursor=None, page_size=None, key='-created_at', parse=None):
+        self.cursor = cursor
+        self.page_size = page_size or PAGE_SIZE
+        descending = key.startswith('-')
+        self.field = field = key.lstrip('-')
+        parse = parse or self.PARSERS.get(field, Decimal)
+        if descending:
+            queryset = queryset.order_by(f'-{field}', '-pk')
+        else:
+            queryset = queryset.order_by(field, 'pk')
+        if cursor:
+            value, pk = decode_cursor(cursor, parse)
+            after = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'pk__{after}': pk})
+            )
+        self.queryset = queryset
+
+    @cached_property
+    def _rows(self):
+        # One extra row tells us whether another page follows.
+        return list(self.queryset[:self.page_size + 1])
+
+    @cached_property
+    def items(self):
+        return self._rows[:self.page_size]
+
+    @cached_property
+    def next_cursor(self):
+        if len(self._rows) > self.page_size:
+            return encode_cursor(self.items[-1], self.field)
+        return None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def estimated_row_count(model, using='default'):
+    """
+    The planner's row estimate for ``model``'s table, or ``None`` where the
+    database keeps none (SQLite) or has not gathered statistics yet.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables"
+                " WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count never scans a large table.
+
+    An unfiltered queryset over a big table is counted from the planner's
+    statistics; a filtered one counts at most ``COUNT_CAP`` matches, so its
+    last page may lie beyond the pages offered. Small tables, and databases
+    without statistics, get the exact count.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+                return estimate
+            return queryset.count()
+        return queryset.order_by()[:COUNT_CAP].count()
@@ -0,0 +1,98 @@
+# store/pricing.py
+"""
+Prices computed by the database.
+
+The final unit price is ``price`` less ``discount_percentage``, rounded to
+the cent; a line total is that unit price times the quantity, and a
+subtotal is the sum of line totals. The same expressions annotate listing
+querysets (so they can filter and sort by final price), cart lines and the
+cart summary aggregate, so every page agrees to the cent.
+
+The delivery charge comes from the ``DELIVERY_RULES`` setting: a list of
+``(minimum subtotal, charge)`` tiers, where the highest minimum the
+subtotal reaches applies.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce, Round
+
+from .models import OrderItem
+
+CENT = Decimal('0.01')
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+# Free delivery from Rs 1000, otherwise a flat Rs 100.
+DEFAULT_DELIVERY_RULES = [(1000, 0), (0, 100)]
+
+
+def unit_price(prefix=''):
+    """
+    The final unit price of the product at ``prefix`` (e.g. ``'product__'``).
+    """
+    # Multiplying by 0.01 instead of dividing by 100 keeps SQLite from doing
+    # integer division on whole-number prices.
+    return Round(
+        F(f'{prefix}price') * (100 - F(f'{prefix}discount_percentage')) * Value(CENT, MONEY),
+        2, output_field=MONEY,
+    )
+
+
+def line_total(prefix=''):
+    """
+    The line total of the cart or order item at ``prefix``.
+    """
+    return F(f'{prefix}quantity') * unit_price(f'{prefix}product__')
+
+
+def with_final_price(queryset):
+    """
+    Annotates products with ``final_price``, usable in ``filter()`` and
+    ``order_by()``.
+    """
+    return queryset.annotate(final_price=unit_price())
+
+
+def priced_lines(queryset):
+    """
+    Annotates cart items with ``unit_price``, ``line_total`` and the
+    ``subtotal`` of their cart, all in the query that loads them.
+    """
+    return queryset.annotate(
+        unit_price=unit_price('product__'),
+        line_total=line_total(),
+        subtotal=Window(Sum(line_total(), output_field=MONEY), partition_by=F('cart_id')),
+    )
+
+
+def with_item_totals(orders):
+    """
+    Annotates orders with ``item_count`` (units) and ``items_total`` (sum of
+    line totals at the prices paid). Correlated subqueries rather than a
+    join and GROUP BY, so only the rows of the page being read are summed.
+    """
+    lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    return orders.annotate(
+        item_count=Coalesce(Subquery(lines.annotate(n=Sum('quantity')).values('n')), 0),
+        items_total=Coalesce(
+            Subquery(lines.annotate(total=Sum(
+                F('quantity') * Coalesce('discount_price', 'price'), output_field=MONEY,
+            )).values('total')),
+            Value(Decimal('0.00'), MONEY),
+        ),
+    )
+
+
+def delivery_rules():
+    rules = getattr(settings, 'DELIVERY_RULES', DEFAULT_DELIVERY_RULES)
+    return sorted(((Decimal(minimum), Decimal(charge)) for minimum, charge in rules), reverse=True)
+
+
+def delivery_charge_for(subtotal):
+    """
+    The charge of the highest ``DELIVERY_RULES`` tier ``subtotal`` reaches.
+    """
+    for minimum, charge in delivery_rules():
+        if subtotal >= minimum:
+            return charge.quantize(CENT)
+    return Decimal('0.00')
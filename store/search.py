@@ -0,0 +1,157 @@
+# store/search.py
+"""
+Product search over a dedicated inverted index.
+
+Each product is tokenised into terms from its name, description and category
+name, and every ``(term, product)`` pair is stored as a ``ProductSearchTerm``
+posting carrying a ranking weight. A query only touches the postings of its
+own terms through the ``(term, product)`` index, so its cost follows the
+number of matching products rather than the size of the catalog.
+
+The index is kept current by the ``Product`` and ``Category`` signal
+receivers in ``store.signals``; ``manage.py rebuild_search_index`` rebuilds
+it from scratch.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from .models import Product, ProductSearchTerm
+
+NAME_WEIGHT = 8
+CATEGORY_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+# Repeating a word in a long description should not outrank a title match.
+MAX_DESCRIPTION_WEIGHT = 4
+MAX_QUERY_TERMS = 8
+TERM_LENGTH = 64
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'this', 'to', 'with',
+}
+# Fields whose change requires reindexing a product.
+INDEXED_FIELDS = {'name', 'description', 'category', 'category_id'}
+
+
+def normalize(term):
+    """
+    Folds simple plurals so "pens" finds "pen" and "boxes" finds "box".
+    """
+    if len(term) > 4 and term.endswith('es') and term[-3] in 'sxz':
+        return term[:-2]
+    if len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+        return term[:-1]
+    return term
+
+
+def tokenize(text):
+    """
+    Returns the normalised search terms in ``text``, in order, with repeats.
+    """
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return [
+        normalize(token)[:TERM_LENGTH]
+        for token in TOKEN_RE.findall(text)
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+def product_terms(product):
+    """
+    Returns ``{term: weight}`` for one product (its category must be loaded
+    or loadable).
+    """
+    weights = Counter()
+    for term in set(tokenize(product.name)):
+        weights[term] += NAME_WEIGHT
+    for term in set(tokenize(product.category.name)):
+        weights[term] += CATEGORY_WEIGHT
+    for term, count in Counter(tokenize(product.description)).items():
+        weights[term] += min(count, MAX_DESCRIPTION_WEIGHT) * DESCRIPTION_WEIGHT
+    return weights
+
+
+def build_postings(products):
+    return [
+        ProductSearchTerm(term=term, product_id=product.pk, weight=weight)
+        for product in products
+        for term, weight in product_terms(product).items()
+    ]
+
+
+@transaction.atomic
+def index_products(products):
+    """
+    Replaces the postings of ``products`` with freshly computed ones.
+    """
+    products = list(products)
+    if not products:
+        return
+    ProductSearchTerm.objects.filter(product__in=[p.pk for p in products]).delete()
+    ProductSearchTerm.objects.bulk_create(build_postings(products), batch_size=1000)
+
+
+def query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def matching_postings(terms, require_all=False):
+    """
+    Returns ``product_id`` rows annotated with ``matched`` (query terms found)
+    and ``score`` (summed weights) for the given terms.
+    """
+    postings = (
+        ProductSearchTerm.objects
+        .filter(term__in=terms)
+        .values('product_id')
+        .annotate(matched=Count('term'), score=Sum('weight'))
+    )
+    if require_all:
+        postings = postings.filter(matched=len(terms))
+    return postings
+
+
+def search_products(query, limit=48, available_only=True):
+    """
+    Returns up to ``limit`` products for ``query``, best match first.
+
+    Products matching more of the query terms always rank above products
+    matching fewer; ties are broken by weight, then by newest.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    postings = matching_postings(terms)
+    if available_only:
+        postings = postings.filter(product__available=True)
+    ranked = postings.annotate(newest=Max('product__created_at')).order_by(
+        '-matched', '-score', '-newest', '-product_id'
+    )[:limit]
+    ids = [row['product_id'] for row in ranked]
+    products = Product.objects.select_related('category').in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+def filter_by_search(queryset, query, prefix=False):
+    """
+    Narrows a ``Product`` queryset to products matching every query term.
+    With ``prefix``, the last term also matches any term it begins, for
+    search-as-you-type ("pe" finds "pen" and "pencil").
+    """
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none()
+    if prefix:
+        *terms, partial = terms
+        # A range scan of the (term, product) index.
+        queryset = queryset.filter(
+            pk__in=ProductSearchTerm.objects.filter(term__startswith=partial).values('product_id')
+        )
+        if not terms:
+            return queryset
+    return queryset.filter(pk__in=matching_postings(terms, require_all=True).values('product_id'))
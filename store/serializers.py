@@ -1,8 +1,10 @@
 # File: store/serializers.py
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from rest_framework.authtoken.models import Token
-from .models import Profile
+from .accounts import create_account
+from .authentication import issue_token
+from .carts import merge_guest_cart
+from .models import Announcement, Category, Product, ProductImage
 
 class SignupSerializer(serializers.ModelSerializer):
     # Add first and last name
@@ -17,44 +19,29 @@ class SignupSerializer(serializers.ModelSerializer):
     postal_code   = serializers.CharField(write_only=True)
     country       = serializers.CharField(write_only=True)
 
+    # The new account's API key; only its hash is stored.
+    token         = serializers.CharField(source='api_key', read_only=True)
+
     class Meta:
         model = User
         fields = [
             'username', 'email', 'password', 'first_name', 'last_name',
             'phone_number', 'address_line1', 'address_line2',
-            'city', 'postal_code', 'country',
+            'city', 'postal_code', 'country', 'token',
         ]
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
-        # Pop profile data
-        prof_data = {
-            'phone_number':  validated_data.pop('phone_number'),
-            'address_line1': validated_data.pop('address_line1'),
-            'address_line2': validated_data.pop('address_line2', ''),
-            'city':          validated_data.pop('city'),
-            'postal_code':   validated_data.pop('postal_code'),
-            'country':       validated_data.pop('country'),
-        }
-
-        # Create user
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data.get('email'),
-            password=validated_data['password'],
-            first_name=validated_data.get('first_name'),
-            last_name=validated_data.get('last_name'),
+        return create_account(
+            validated_data.pop('username'),
+            validated_data.pop('email', ''),
+            validated_data.pop('password'),
+            first_name=validated_data.pop('first_name', ''),
+            last_name=validated_data.pop('last_name', ''),
+            token=True,
+            **validated_data,
         )
 
-        # Create or update profile
-        profile, created = Profile.objects.get_or_create(user=user)
-        for key, value in prof_data.items():
-            setattr(profile, key, value)
-        profile.save()
-
-        Token.objects.get_or_create(user=user)
-        return user
-
 
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
@@ -72,5 +59,71 @@ class LoginSerializer(serializers.Serializer):
         if not user.is_active:
             raise serializers.ValidationError("User account is disabled")
             
-        token, _ = Token.objects.get_or_create(user=user)
-        return {'username': user.username, 'token': token.key}
\ No newline at end of file
+        request = self.context.get('request')
+        if request is not None:
+            # Token logins skip django.contrib.auth.login(), which merges
+            # the guest cart through the user_logged_in signal.
+            merge_guest_cart(request, user)
+
+        return {'username': user.username, 'token': issue_token(user)}
+
+
+# ——— READ-ONLY CATALOG API ————————————————————————————————————————
+
+def requested_fields(request):
+    """
+    Returns the names in the request's ``?fields=``, or ``None`` for all.
+    """
+    requested = request.query_params.get('fields') if request else None
+    if not requested:
+        return None
+    return {name.strip() for name in requested.split(',')}
+
+
+class SparseFieldsetMixin:
+    """
+    Limits output to the comma-separated ``?fields=`` of the request, e.g.
+    ``?fields=slug,name,final_price``. Unknown names are ignored.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = requested_fields(self.context.get('request'))
+        if keep is not None:
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'slug', 'name', 'description', 'image']
+
+
+class ProductImageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductImage
+        fields = ['id', 'image', 'alt_text']
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    category = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+    final_price = serializers.DecimalField(
+        source='get_final_price', max_digits=10, decimal_places=2, read_only=True
+    )
+    images = ProductImageSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'slug', 'name', 'description', 'category',
+            'price', 'discount_percentage', 'final_price',
+            'image', 'images', 'stock', 'available',
+            'created_at', 'updated_at',
+        ]
+
+
+class AnnouncementSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Announcement
+        fields = ['id', 'message']
+
@@ -0,0 +1,91 @@
+# store/signals.py
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user_tokens
+from .cart_summary import PRICE_FIELDS, bump_price_version, invalidate_cart_summary
+from .carts import merge_guest_cart
+from .catalog_cache import bump_catalog_version
+from .images import queue_image_variants
+from .models import Announcement, ApiToken, Cart, CartItem, Category, Product, ProductImage
+from .search import INDEXED_FIELDS, index_products
+
+
+@receiver([post_save, post_delete], sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.cart_id)
+
+
+@receiver([post_save, post_delete], sender=Cart)
+def cart_changed(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.pk, user_id=instance.user_id)
+
+
+@receiver(user_logged_in)
+def guest_cart_login(sender, request, user, **kwargs):
+    if request is not None:
+        merge_guest_cart(request, user)
+
+
+@receiver(post_delete, sender=ApiToken)
+def api_token_deleted(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Every login saves last_login; nothing cached depends on it.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Announcement)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=ProductImage)
+def image_uploaded(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    if instance.changed_stored_fields(['image']):
+        queue_image_variants(instance.image.name)
+
+
+@receiver(post_save, sender=Product)
+def product_prices_changed(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # A new product is in no cart yet.
+    if raw or created:
+        return
+    fields = PRICE_FIELDS if update_fields is None else PRICE_FIELDS & set(update_fields)
+    if fields and instance.changed_stored_fields(fields):
+        bump_price_version()
+
+
+@receiver(post_save, sender=Product)
+def reindex_product(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and not INDEXED_FIELDS & set(update_fields)):
+        return
+    index_products([instance])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or created or (update_fields is not None and 'name' not in update_fields):
+        return
+    products = instance.products.select_related('category').iterator(chunk_size=500)
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) == 500:
+            index_products(batch)
+            batch = []
+    index_products(batch)
@@ -0,0 +1,190 @@
+# store/snapshots.py
+"""
+Portable database snapshots for ``dump_store`` and ``load_store``.
+
+A snapshot is a directory holding ``manifest.json`` and gzip-compressed
+JSON-lines shards named ``<table>-<n>.jsonl.gz``. Each line in a shard is
+one row, written as a JSON array in the column order the manifest lists.
+Rows are read in primary-key order, ``chunk_size`` at a time, and each
+chunk becomes one shard. Values are written as Django's JSON encoder
+renders them, except that times keep their microseconds, and are converted
+back by the model fields on load, so a dump taken from MySQL loads into
+SQLite or PostgreSQL.
+
+Only tables of installed models are included, with auto-created many-to-many
+tables among them. ``DEFAULT_EXCLUDE`` leaves out sessions and the admin
+log unless they are asked for by name.
+"""
+import datetime
+import gzip
+import json
+import os
+from collections import deque
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+DEFAULT_EXCLUDE = {'django_session', 'django_admin_log'}
+DEFAULT_CHUNK_SIZE = 50_000
+DEFAULT_BATCH_SIZE = 2000
+# Field types whose JSON form is not what the database adapter accepts.
+CONVERTED_TYPES = {
+    'DateField', 'DateTimeField', 'DecimalField', 'DurationField', 'JSONField', 'TimeField', 'UUIDField',
+}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotEncoder(DjangoJSONEncoder):
+    """
+    ``DjangoJSONEncoder`` without its rounding of times to milliseconds.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def snapshot_models(include=(), exclude=()):
+    """
+    Returns ``{table: model}`` for the installed models selected by table
+    name or app label. ``include`` (if given) picks tables, ``exclude``
+    drops them, and ``DEFAULT_EXCLUDE`` tables are dropped unless named in
+    ``include``.
+    """
+    include, exclude = set(include), set(exclude)
+    selected = {}
+    for model in apps.get_models(include_auto_created=True):
+        opts = model._meta
+        if opts.proxy or not opts.managed:
+            continue
+        names = {opts.db_table, opts.app_label}
+        if include and not names & include:
+            continue
+        if names & exclude or (opts.db_table in DEFAULT_EXCLUDE and opts.db_table not in include):
+            continue
+        selected[opts.db_table] = model
+    unknown = (include | exclude) - {
+        name for model in apps.get_models(include_auto_created=True)
+        for name in (model._meta.db_table, model._meta.app_label)
+    }
+    if unknown:
+        raise SnapshotError(f"Unknown table or app: {', '.join(sorted(unknown))}")
+    return selected
+
+
+def dependent_tables(models):
+    """
+    Returns the tables with a foreign key to any of ``models``. Replacing a
+    parent table can orphan their rows even when they are not loaded.
+    """
+    models = {model._meta.concrete_model for model in models}
+    return {
+        model._meta.db_table
+        for model in apps.get_models(include_auto_created=True)
+        if not model._meta.proxy and any(
+            field.is_relation and field.many_to_one and field.related_model in models
+            for field in model._meta.local_concrete_fields
+        )
+    }
+
+
+def shard_name(table, number):
+    return f"{table}-{number:05d}.jsonl.gz"
+
+
+def dump_table(model, directory, chunk_size=DEFAULT_CHUNK_SIZE, using='default'):
+    """
+    Writes ``model``'s rows to shards in ``directory`` and returns its
+    manifest entry.
+    """
+    opts = model._meta
+    fields = opts.concrete_fields
+    rows = model._base_manager.using(using).order_by('pk').values_list(*[field.attname for field in fields])
+    pk_index = [field.attname for field in fields].index(opts.pk.attname)
+    entry = {'model': opts.label, 'columns': [field.column for field in fields], 'shards': [], 'rows': 0}
+    encoder = SnapshotEncoder(separators=(',', ':'), ensure_ascii=False)
+    last = None
+    while True:
+        page = rows if last is None else rows.filter(pk__gt=last)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return entry
+        name = shard_name(opts.db_table, len(entry['shards']))
+        with gzip.open(os.path.join(directory, name), 'wt', encoding='utf-8', compresslevel=5) as shard:
+            shard.writelines(encoder.encode(row) + '\n' for row in chunk)
+        entry['shards'].append(name)
+        entry['rows'] += len(chunk)
+        last = chunk[-1][pk_index]
+
+
+def read_shard(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as shard:
+        return [json.loads(line) for line in shard]
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as source:
+            manifest = json.load(source)
+    except FileNotFoundError:
+        raise SnapshotError(f"No {MANIFEST} in {directory}")
+    if manifest.get('version') != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version: {manifest.get('version')}")
+    return manifest
+
+
+def row_loader(model, columns, connection):
+    """
+    Returns ``(insert SQL, convert)`` for loading rows written with
+    ``columns`` into ``model``'s table. Fields added since the dump are
+    filled with their defaults; columns the model no longer has are an
+    error.
+    """
+    fields = {field.column: field for field in model._meta.concrete_fields}
+    unknown = [column for column in columns if column not in fields]
+    if unknown:
+        raise SnapshotError(f"{model._meta.db_table} has no column(s) {', '.join(unknown)}")
+    missing = [field for column, field in fields.items() if column not in columns]
+    for field in missing:
+        if not field.has_default() and not field.null:
+            raise SnapshotError(f"{model._meta.db_table}.{field.column} is missing and has no default")
+
+    converters = [
+        (index, field) for index, field in enumerate(fields[column] for column in columns)
+        if field.get_internal_type() in CONVERTED_TYPES
+    ]
+    defaults = [field.get_db_prep_save(field.get_default(), connection) for field in missing]
+
+    def convert(row):
+        for index, field in converters:
+            row[index] = field.get_db_prep_save(field.to_python(row[index]), connection)
+        if defaults:
+            row.extend(defaults)
+        return row
+
+    qn = connection.ops.quote_name
+    names = [*columns, *(field.column for field in missing)]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(model._meta.db_table), ', '.join(map(qn, names)), ', '.join(['%s'] * len(names)),
+    )
+    return sql, convert
+
+
+def prefetched(executor, function, items, depth):
+    """
+    Like ``executor.map`` but with at most ``depth`` calls in flight, so
+    only that many decoded shards are held at once.
+    """
+    items = iter(items)
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
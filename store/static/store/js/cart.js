@@ -0,0 +1,67 @@
+// store/static/store/js/cart.js
+// Cart buttons post with fetch() and update the page from the JSON reply
+// instead of reloading it. Without JavaScript, or without a CSRF cookie
+// (anonymous pages can come from the page cache), the plain links and
+// forms still work.
+(function () {
+  function csrfToken() {
+    const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return match ? decodeURIComponent(match[1]) : null;
+  }
+
+  function money(value) {
+    return 'Rs ' + Number(value).toFixed(2);
+  }
+
+  function setText(selector, text) {
+    document.querySelectorAll(selector).forEach((el) => { el.textContent = text; });
+  }
+
+  function render(data) {
+    setText('[data-cart-count]', data.cart_count);
+    setText(`[data-line-total="${data.product_id}"]`, money(data.line_total));
+    setText('[data-cart-subtotal]', money(data.subtotal));
+    setText('[data-cart-delivery]', Number(data.delivery_charge) === 0 ? 'Free' : money(data.delivery_charge));
+    setText('[data-cart-grand-total]', money(data.grand_total));
+    if (data.quantity === 0) {
+      document.querySelectorAll(`[data-cart-line="${data.product_id}"]`).forEach((el) => el.remove());
+      if (data.cart_count === 0 && document.querySelector('[data-cart-page]')) {
+        window.location.reload();  // shows the empty-cart view
+      }
+    }
+  }
+
+  function send(url, body, token) {
+    return fetch(url, {
+      method: 'POST',
+      body: body,
+      credentials: 'same-origin',
+      headers: { 'Accept': 'application/json', 'X-CSRFToken': token },
+    }).then((response) => response.json().then((data) => {
+      render(data);
+      if (!response.ok && data.error) {
+        window.alert(data.error);
+      }
+    }));
+  }
+
+  document.addEventListener('click', (event) => {
+    const link = event.target.closest('[data-cart-add], [data-cart-remove]');
+    const token = csrfToken();
+    if (!link || event.defaultPrevented || !token) {
+      return;
+    }
+    event.preventDefault();
+    send(link.href, null, token).catch(() => { window.location.href = link.href; });
+  });
+
+  document.addEventListener('submit', (event) => {
+    const form = event.target.closest('[data-cart-update]');
+    if (!form) {
+      return;
+    }
+    const body = new FormData(form);
+    event.preventDefault();
+    send(form.action, body, body.get('csrfmiddlewaretoken')).catch(() => form.submit());
+  });
+})();
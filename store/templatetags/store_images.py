@@ -0,0 +1,38 @@
+# store/templatetags/store_images.py
+from django import template
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from store.images import build_srcset, get_variants
+
+register = template.Library()
+
+
+def _attrs(attrs):
+    # Rendered once per image in every grid; much cheaper than flatatt().
+    return ''.join(f' {key}="{escape(value)}"' for key, value in attrs.items())
+
+
+@register.simple_tag
+def picture(image, sizes='100vw', **attrs):
+    """
+    Renders ``image`` as a ``<picture>`` with WebP and JPEG ``srcset``s once
+    its variants exist, or as a plain ``<img>`` until then. Extra keyword
+    arguments become attributes of the ``<img>``::
+
+        {% picture p.image sizes="(min-width: 1024px) 25vw, 50vw" alt=p.name class="w-full" %}
+    """
+    if not image:
+        return ''
+    variants = get_variants(image.name)
+    attrs = {'src': image.url, **attrs}
+    if variants.get('jpeg'):
+        attrs.update(srcset=build_srcset(variants['jpeg'], image.storage), sizes=sizes)
+    img = mark_safe(f'<img{_attrs(attrs)}>')
+    if not variants.get('webp'):
+        return img
+    # display: contents keeps the <img> laid out as if <picture> were absent.
+    return format_html(
+        '<picture style="display: contents"><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        build_srcset(variants['webp'], image.storage), sizes, img,
+    )
@@ -1,4 +1,1948 @@
-# File: store/tests.py
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F, QuerySet
+import tempfile
+
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from . import authentication, images
+from .accounts import provision_accounts
+from .backends.s3boto3 import MediaStorage, StaticStorage
+from .cart_summary import bump_price_version, compute_cart_summary, get_cart_summary, get_price_version
+from .checkout import OutOfStock, place_order
+from .catalog_cache import get_catalog_version
+from .images import PENDING_CACHE_TIMEOUT, get_variants, process_image_variants
+from .management.commands.seed_store import PRODUCT_SKEW, PkSampler
+from .metrics import registry
+from .models import (
+    Announcement, ApiToken, Cart, CartItem, Category, ImageVariantSet, Order, OrderItem, OutboundEmail,
+    Product, ProductImage, ProductSearchTerm, Profile,
+)
+from .order_ids import ALPHABET, decode_order_id, encode_order_id
+from .pagination import KeysetPage
+from .pricing import delivery_charge_for, with_final_price
+from .search import filter_by_search, search_products, tokenize
+from .serializers import LoginSerializer, SignupSerializer
+from .outbox import drain_outbox, enqueue_email
+
+
+SHIPPING = {
+    'full_name': 'Ali Khan',
+    'email': 'ali@example.com',
+    'phone_number': '03001234567',
+    'complete_address': 'House 1, Street 2',
+    'city': 'Lahore',
+    'postal_code': '54000',
+    'country': 'Pakistan',
+}
+
+
+class FailingBackend:
+    """
+    Mail connection that refuses every message.
+    """
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise ConnectionError("SMTP unavailable")
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        category = Category.objects.create(name='Pens', slug='pens')
+        self.product = Product.objects.create(
+            category=category, name='Blue Pen', slug='blue-pen',
+            price=Decimal('50.00'), stock=10,
+        )
+
+    def test_checkout_queues_emails_without_sending(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('store:checkout'), SHIPPING)
+
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('store:order_confirmation', args=[order.order_id]))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(status='pending').count(), 2)
+
+        call_command('send_outbox', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn(order.order_id, mail.outbox[0].subject)
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+
+    def test_contact_queues_email(self):
+        self.client.post(reverse('store:contact'), {
+            'name': 'Sara', 'email': 'sara@example.com', 'message': 'Hello',
+        })
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().subject, 'New Contact Form Message')
+
+    def test_drain_reuses_one_connection_per_batch(self):
+        for i in range(3):
+            enqueue_email(f"Message {i}", "Body", ['to@example.com'])
+
+        self.assertEqual(drain_outbox(batch_size=2), (2, 0))
+        self.assertEqual(drain_outbox(batch_size=2), (1, 0))
+        self.assertEqual(drain_outbox(batch_size=2), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_send_backs_off_then_dead_letters(self):
+        email = enqueue_email("Retry me", "Body", ['to@example.com'])
+
+        self.assertEqual(drain_outbox(max_attempts=2, connection=FailingBackend()), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn('SMTP unavailable', email.last_error)
+
+        # Not due yet, so nothing is claimed.
+        self.assertEqual(drain_outbox(max_attempts=2, connection=FailingBackend()), (0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        drain_outbox(max_attempts=2, connection=FailingBackend())
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'dead')
+        self.assertEqual(email.attempts, 2)
+
+
+    def test_unreachable_server_backs_off_the_batch(self):
+        for i in range(2):
+            enqueue_email(f"Message {i}", "Body", ['to@example.com'])
+        backend = mock.Mock(**{'open.side_effect': ConnectionRefusedError('Connection refused')})
+
+        self.assertEqual(drain_outbox(connection=backend), (0, 2))
+        backend.send_messages.assert_not_called()
+        backend.close.assert_called_once()
+        for email in OutboundEmail.objects.all():
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            self.assertIn('Connection refused', email.last_error)
+
+    def test_send_outbox_loop_survives_an_outage(self):
+        enqueue_email("Later", "Body", ['to@example.com'])
+        sleep = mock.patch('store.management.commands.send_outbox.time.sleep', side_effect=[None, KeyboardInterrupt])
+        with mock.patch('store.outbox.get_connection') as get_connection, sleep:
+            get_connection.return_value.open.side_effect = OSError('SMTP down')
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('send_outbox', '--loop', stdout=StringIO())
+        self.assertEqual(OutboundEmail.objects.get().attempts, 1)
+
+class CheckoutServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Pens', slug='pens')
+
+    def make_products(self, count, stock=10):
+        return [
+            Product.objects.create(
+                category=self.category, name=f"Pen {i}", slug=f"pen-{i}",
+                price=Decimal('100.00'), discount_percentage=10, stock=stock,
+            )
+            for i in range(count)
+        ]
+
+    def fill_cart(self, products, quantity=2):
+        CartItem.objects.filter(cart=self.cart).delete()
+        for product in products:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def test_places_order_and_decrements_stock(self):
+        products = self.make_products(3)
+        self.fill_cart(products)
+
+        order = place_order(self.user, SHIPPING)
+
+        self.assertEqual(order.order_items.count(), 3)
+        self.assertEqual(order.total_price, Decimal('640.00'))  # 3 x 2 x 90 + 100 delivery
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('stock', flat=True)), [8, 8, 8]
+        )
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_query_count_does_not_grow_with_cart(self):
+        products = self.make_products(6)
+
+        self.fill_cart(products[:1])
+        with CaptureQueriesContext(connection) as small:
+            place_order(self.user, SHIPPING)
+
+        self.fill_cart(products[1:])
+        with CaptureQueriesContext(connection) as large:
+            place_order(self.user, SHIPPING)
+
+        self.assertEqual(len(small), len(large))
+
+    def test_sale_touches_products_and_catalog_version(self):
+        products = self.make_products(2)
+        self.fill_cart(products[:1])
+        before = products[0].updated_at
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.user, SHIPPING)
+        self.assertGreater(Product.objects.get(pk=products[0].pk).updated_at, before)
+        self.assertEqual(Product.objects.get(pk=products[1].pk).updated_at, products[1].updated_at)
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_oversold_line_rejects_whole_order(self):
+        plenty, scarce = self.make_products(2)
+        Product.objects.filter(pk=scarce.pk).update(stock=1)
+        self.fill_cart([plenty, scarce], quantity=2)
+
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, SHIPPING)
+
+        self.assertEqual([(p.pk, req, avail) for p, req, avail in ctx.exception.lines],
+                         [(scarce.pk, 2, 1)])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(Product.objects.get(pk=plenty.pk).stock, 10)
+
+    def test_checkout_view_reports_oversold_lines(self):
+        product, = self.make_products(1, stock=1)
+        self.fill_cart([product], quantity=3)
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('store:checkout'), SHIPPING)
+
+        self.assertRedirects(response, reverse('store:cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        category = Category.objects.create(name='Pens', slug='pens')
+        product = Product.objects.create(
+            category=category, name='Pen', slug='pen', price=Decimal('10.00'), stock=5,
+        )
+        buyers = []
+        for i in range(8):
+            user = User.objects.create_user(f"buyer{i}", password='pass12345')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            buyers.append(user)
+
+        barrier = threading.Barrier(len(buyers))
+        outcomes = []
+
+        def buy(user):
+            barrier.wait()
+            try:
+                # SQLite serialises writers and reports "locked" instead of
+                # waiting, so retry until this checkout gets its turn.
+                for _ in range(200):
+                    try:
+                        place_order(user, SHIPPING)
+                        outcomes.append('ok')
+                        return
+                    except OutOfStock:
+                        outcomes.append('out')
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        sold = OrderItem.objects.filter(product=product).count()
+        self.assertEqual(sold, outcomes.count('ok'))
+        self.assertEqual(product.stock, 5 - sold)
+        self.assertEqual(sold, 5)
+        self.assertEqual(outcomes.count('out'), 3)
+
+
+class AccountTests(TestCase):
+    SIGNUP = {
+        'first_name': 'Ali', 'last_name': 'Khan', 'username': 'ali', 'email': 'ali@EXAMPLE.com',
+        'password': 'pass12345', 'phone_number': '03001234567', 'address_line1': 'House 1',
+        'address_line2': '', 'city': 'Lahore', 'postal_code': '54000', 'country': 'Pakistan',
+    }
+
+    def writes(self, queries):
+        return [q['sql'].split('(')[0].strip() for q in queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+
+    def test_signup_view_inserts_each_row_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('store:signup'), self.SIGNUP)
+        self.assertRedirects(response, reverse('store:login'), fetch_redirect_response=False)
+        self.assertEqual(self.writes(queries), ['INSERT INTO "auth_user"', 'INSERT INTO "store_profile"'])
+
+        user = User.objects.select_related('profile').get()
+        self.assertEqual((user.first_name, user.email), ('Ali', 'ali@example.com'))
+        self.assertEqual((user.profile.city, user.profile.phone_number), ('Lahore', '03001234567'))
+        self.assertTrue(user.check_password('pass12345'))
+
+    def test_signup_serializer_issues_token(self):
+        serializer = SignupSerializer(data=self.SIGNUP)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            user = serializer.save()
+        self.assertEqual(
+            self.writes(queries),
+            ['INSERT INTO "auth_user"', 'INSERT INTO "store_profile"', 'INSERT INTO "store_apitoken"'],
+        )
+        self.assertEqual(user.profile.postal_code, '54000')
+        self.assertEqual(serializer.data['token'], user.api_key)
+        self.assertEqual(authentication.authenticate_key(user.api_key), user)
+
+    def test_create_user_still_gets_a_profile(self):
+        user = User.objects.create_user('sana')
+        self.assertEqual(Profile.objects.get(user=user).country, 'Pakistan')
+
+    def test_provision_accounts_in_batches(self):
+        User.objects.create_user('taken')
+        rows = [
+            {'username': f'buyer{i}', 'email': f'buyer{i}@Example.com', 'city': 'Karachi'}
+            for i in range(7)
+        ]
+        rows[2]['password'] = 'secret-pass'
+        rows += [{'username': 'taken', 'email': 'x@example.com'}, {'username': 'buyer0', 'email': 'y@example.com'}]
+        keys = []
+        with CaptureQueriesContext(connection) as queries:
+            created, skipped = provision_accounts(rows, batch_size=4, workers=2, tokens=lambda *row: keys.append(row))
+        self.assertEqual((created, sorted(skipped)), (7, ['buyer0', 'taken']))
+        inserts = [sql for sql in self.writes(queries) if sql.startswith('INSERT')]
+        # Three batches, the last of which has nothing new to insert.
+        self.assertEqual(len(inserts), 2 * 3)
+
+        self.assertEqual(Profile.objects.filter(city='Karachi').count(), 7)
+        self.assertEqual(ApiToken.objects.count(), 7)
+        username, key = keys[3]
+        self.assertEqual(authentication.authenticate_key(key).username, username)
+        self.assertTrue(User.objects.get(username='buyer2').check_password('secret-pass'))
+        self.assertFalse(User.objects.get(username='buyer3').has_usable_password())
+        self.assertEqual(User.objects.get(username='buyer3').email, 'buyer3@example.com')
+
+    def test_provision_command_rejects_bad_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write('username,email,first_name,city\nhira,hira@example.com,Hira,Multan\nbad name,x@example.com,,\nomar,not-an-email,,\n')
+        self.addCleanup(os.unlink, source.name)
+        out, err = StringIO(), StringIO()
+        call_command('provision_accounts', source.name, stdout=out, stderr=err)
+        self.assertIn('Created 1 account(s)', out.getvalue())
+        self.assertIn('0 skipped, 2 rejected', out.getvalue())
+        self.assertIn('line 3:', err.getvalue())
+        self.assertEqual(User.objects.get().profile.city, 'Multan')
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._local.clear()
+        self.user = User.objects.create_user('api-client', password='pass12345')
+        self.key = authentication.issue_token(self.user)
+        self.url = reverse('store:api-category-list')
+
+    def get(self, key=None):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f"Token {key or self.key}")
+
+    def authenticated(self):
+        return authentication.authenticate_key(self.key) is not None and self.get().status_code == 200
+
+    def test_only_the_digest_is_stored(self):
+        token = ApiToken.objects.get()
+        self.assertEqual(token.digest, hashlib.sha256(self.key.encode()).hexdigest())
+        self.assertNotIn(self.key, token.digest)
+
+    def test_warm_request_authenticates_without_queries(self):
+        self.assertEqual(self.get().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            user = authentication.authenticate_key(self.key)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual((user.pk, user.username), (self.user.pk, 'api-client'))
+
+        authentication._local.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(authentication.authenticate_key(self.key), self.user)
+        self.assertEqual(len(queries), 0)
+
+    def test_cached_entries_hold_no_password(self):
+        self.assertEqual(self.get().status_code, 200)
+        digest = authentication.hash_key(self.key)
+        for entry in (cache.get(authentication._entry_key(digest)), authentication._local.get(digest)):
+            self.assertNotIn(self.user.password, entry[2])
+            self.assertEqual(len(entry[2]), len(authentication.USER_FIELDS))
+        user = authentication.authenticate_key(self.key)
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_unknown_key_is_refused(self):
+        self.assertEqual(self.get('0' * 40).status_code, 401)
+        self.assertIsNone(authentication.authenticate_key('0' * 40))
+
+    def test_login_issues_a_new_token_and_keeps_the_newest(self):
+        keys = []
+        for _ in range(authentication.MAX_TOKENS_PER_USER + 1):
+            serializer = LoginSerializer(data={'username': 'api-client', 'password': 'pass12345'})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+            keys.append(serializer.validated_data['token'])
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(ApiToken.objects.count(), authentication.MAX_TOKENS_PER_USER)
+        # setUp's token and the first login's are the two oldest.
+        self.assertIsNone(authentication.authenticate_key(self.key))
+        self.assertIsNone(authentication.authenticate_key(keys[0]))
+        self.assertIsNotNone(authentication.authenticate_key(keys[1]))
+
+    def test_deleted_token_is_refused_on_the_next_request(self):
+        self.assertTrue(self.authenticated())
+        with self.captureOnCommitCallbacks(execute=True):
+            ApiToken.objects.all().delete()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_deactivated_user_is_refused_on_the_next_request(self):
+        self.assertTrue(self.authenticated())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_last_login_does_not_invalidate(self):
+        self.assertTrue(self.authenticated())
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+    def test_migrate_api_tokens_keeps_old_keys_working(self):
+        other = User.objects.create_user('legacy')
+        legacy = Token.objects.create(user=other)
+        call_command('migrate_api_tokens', stdout=StringIO())
+        call_command('migrate_api_tokens', '--delete', stdout=StringIO())
+        self.assertFalse(Token.objects.exists())
+        self.assertEqual(ApiToken.objects.get(user=other).created, legacy.created)
+        self.assertEqual(self.get(legacy.key).status_code, 200)
+
+
+class OrderIdTests(TestCase):
+    def test_ids_are_unique_and_reversible(self):
+        ids = [encode_order_id(pk) for pk in range(1, 5001)]
+        self.assertEqual(len(set(ids)), len(ids))
+        for pk, order_id in enumerate(ids, start=1):
+            self.assertEqual(len(order_id), 8)
+            self.assertTrue(all(c in ALPHABET for c in order_id))
+            self.assertEqual(decode_order_id(order_id), pk)
+
+    def test_consecutive_ids_do_not_share_a_prefix(self):
+        self.assertNotEqual(encode_order_id(1)[:4], encode_order_id(2)[:4])
+
+    def test_order_gets_pk_derived_id_without_probing(self):
+        with CaptureQueriesContext(connection) as queries:
+            order = Order.objects.create(total_price=0, **SHIPPING)
+        self.assertEqual(order.order_id, encode_order_id(order.pk))
+        self.assertFalse(any(q['sql'].startswith('SELECT') for q in queries))
+        order.refresh_from_db()
+        self.assertEqual(order.order_id, encode_order_id(order.pk))
+
+    def test_order_id_is_written_to_the_routed_database(self):
+        write_router = mock.Mock(spec=['db_for_write'])
+        write_router.db_for_write.return_value = 'default'
+        order = Order(total_price=0, **SHIPPING)
+        with override_settings(DATABASE_ROUTERS=[write_router]):
+            order.save()
+        write_router.db_for_write.assert_any_call(Order, instance=order)
+        order.refresh_from_db()
+        self.assertEqual(order.order_id, encode_order_id(order.pk))
+
+    def test_migrate_order_ids_keeps_legacy_links_working(self):
+        user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        order = Order.objects.create(user=user, order_id='LEGACY01', total_price=0, **SHIPPING)
+
+        call_command('migrate_order_ids', stdout=StringIO())
+
+        order.refresh_from_db()
+        self.assertEqual(order.legacy_order_id, 'LEGACY01')
+        self.assertEqual(order.order_id, encode_order_id(order.pk))
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('store:order_confirmation', args=['LEGACY01']))
+        self.assertRedirects(response, reverse('store:order_confirmation', args=[order.order_id]))
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        self.category = Category.objects.create(name='Pens', slug='pens')
+        self.pen = Product.objects.create(
+            category=self.category, name='Pen', slug='pen',
+            price=Decimal('55.00'), discount_percentage=15, stock=10,
+        )
+        self.cart = Cart.objects.create(user=self.user)
+        self.item = CartItem.objects.create(cart=self.cart, product=self.pen, quantity=3)
+        self.client.force_login(self.user)
+
+    def cart_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [q for q in queries if 'store_cart' in q['sql']]
+
+    def test_page_view_reads_cart_at_most_once(self):
+        response, queries = self.cart_queries(reverse('store:home'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.context['cart_count'], 3)
+
+        response, queries = self.cart_queries(reverse('store:category_detail', args=['pens']))
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['cart_count'], 3)
+
+    def test_cart_item_changes_invalidate_summary(self):
+        self.client.get(reverse('store:home'))
+
+        self.item.quantity = 5
+        self.item.save()
+        response, _ = self.cart_queries(reverse('store:about'))
+        self.assertEqual(response.context['cart_count'], 5)
+
+        self.item.delete()
+        response, _ = self.cart_queries(reverse('store:about'))
+        self.assertEqual(response.context['cart_count'], 0)
+
+    def test_price_changes_refresh_cached_subtotals(self):
+        def subtotal():
+            request = RequestFactory().get('/')
+            request.user = self.user
+            return get_cart_summary(request)['subtotal']
+
+        self.assertEqual(subtotal(), Decimal('140.25'))
+        self.pen.discount_percentage = 0
+        self.pen.save()
+        self.assertEqual(subtotal(), Decimal('165.00'))
+        Product.objects.filter(pk=self.pen.pk).update(price=Decimal('60.00'))
+        bump_price_version()  # as the admin and import paths do after update()
+        self.assertEqual(subtotal(), Decimal('180.00'))
+
+    def test_other_catalog_edits_keep_cached_summaries(self):
+        self.client.get(reverse('store:home'))
+        version = get_price_version()
+        pen = Product.objects.get(pk=self.pen.pk)
+        pen.description = 'Smooth'
+        pen.stock = 3
+        pen.save()
+        Announcement.objects.create(message='Sale', active=True)
+        self.category.save()
+        self.assertEqual(get_price_version(), version)
+        _, queries = self.cart_queries(reverse('store:about'))
+        self.assertEqual(queries, [])
+
+        pen.price = Decimal('55.00')  # unchanged
+        pen.save(update_fields=['price'])
+        self.assertEqual(get_price_version(), version)
+        pen.available = False
+        pen.save()
+        self.assertNotEqual(get_price_version(), version)
+
+    def test_subtotal_matches_python_pricing(self):
+        response = self.client.get(reverse('store:cart'))
+        self.assertEqual(response.context['subtotal'], Decimal('140.25'))  # 3 x (55 - 15%)
+
+        self.assertEqual(compute_cart_summary(self.user.pk), (self.cart.pk, {
+            'count': 3, 'subtotal': Decimal('140.25'),
+        }))
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Pens', slug='pens')
+        self.pen = Product.objects.create(
+            category=self.category, name='Pen', slug='pen', price=Decimal('50.00'), stock=10,
+        )
+        self.pencil = Product.objects.create(
+            category=self.category, name='Pencil', slug='pencil', price=Decimal('20.00'), stock=10,
+        )
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+
+    def writes(self, queries):
+        return [q['sql'] for q in queries if not q['sql'].lstrip().upper().startswith('SELECT')]
+
+    def test_guest_cart_lives_in_a_cookie_without_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]))
+            self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]))
+            self.client.get(reverse('store:add_to_cart', args=[self.pencil.pk]))
+            response = self.client.get(reverse('store:cart'))
+            self.client.get(reverse('store:home'))
+        self.assertEqual(self.writes(queries), [])
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(response.context['cart_count'], 3)
+        self.assertEqual(response.context['subtotal'], Decimal('120.00'))
+        self.assertEqual([item.product for item in response.context['cart_items']], [self.pen, self.pencil])
+
+        self.client.post(reverse('store:update_cart_item', args=[self.pen.pk]), {'quantity': 5})
+        self.client.get(reverse('store:remove_from_cart', args=[self.pencil.pk]))
+        self.assertEqual(self.client.get(reverse('store:cart')).context['cart_count'], 5)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies['cart'] = f'{self.pen.pk}:3'
+        self.assertEqual(self.client.get(reverse('store:cart')).context['cart_count'], 0)
+
+    def test_guest_cart_is_merged_at_login(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.pen, quantity=1)
+        self.client.force_login(self.user)
+        self.client.get(reverse('store:home'))  # caches the summary
+        self.client.logout()
+
+        self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]))
+        self.client.get(reverse('store:add_to_cart', args=[self.pencil.pk]))
+        response = self.client.post(reverse('login'), {'username': 'ali', 'password': 'pass12345'})
+        self.assertEqual(response.cookies['cart'].value, '')
+
+        self.assertEqual(
+            dict(cart.items.values_list('product__slug', 'quantity')), {'pen': 2, 'pencil': 1},
+        )
+        self.assertEqual(self.client.get(reverse('store:home')).context['cart_count'], 3)
+
+    def test_store_login_view_merges_too(self):
+        self.client.get(reverse('store:add_to_cart', args=[self.pencil.pk]))
+        self.client.post(reverse('store:login'), {'username': 'ali', 'password': 'pass12345'})
+        self.assertEqual(self.user.cart.items.get().product, self.pencil)
+
+    def test_merge_omits_the_conflict_target_where_unsupported(self):
+        # MySQL's ON DUPLICATE KEY UPDATE takes no target, and Django
+        # refuses unique_fields there.
+        self.client.get(reverse('store:add_to_cart', args=[self.pencil.pk]))
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(CartItem.objects, 'bulk_create') as bulk_create:
+            self.client.post(reverse('store:login'), {'username': 'ali', 'password': 'pass12345'})
+        kwargs = bulk_create.call_args.kwargs
+        self.assertNotIn('unique_fields', kwargs)
+        self.assertEqual((kwargs['update_conflicts'], kwargs['update_fields']), (True, ['quantity']))
+
+    def test_merge_and_new_lines_take_the_same_locks(self):
+        # SQLite ignores FOR UPDATE, so record what is locked instead.
+        select_for_update = QuerySet.select_for_update
+        locked = []
+
+        def record(queryset, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, **kwargs)
+
+        self.client.get(reverse('store:add_to_cart', args=[self.pencil.pk]))
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=record):
+            self.client.post(reverse('login'), {'username': 'ali', 'password': 'pass12345'})
+            self.assertEqual(locked, [Cart, CartItem])
+            locked.clear()
+            self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]))
+            self.assertEqual(locked, [Cart])
+            locked.clear()
+            self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]))
+            self.assertEqual(locked, [])
+        self.assertEqual(
+            dict(self.user.cart.items.values_list('product__slug', 'quantity')), {'pen': 2, 'pencil': 1},
+        )
+
+    def test_signed_in_reads_do_not_create_a_cart(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            for url in (reverse('store:home'), reverse('store:category_detail', args=['pens']),
+                        reverse('store:cart')):
+                self.client.get(url)
+        self.assertEqual([sql for sql in self.writes(queries) if 'store_' in sql], [])
+        self.assertFalse(Cart.objects.exists())
+
+
+class CartMutationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Pens', slug='pens')
+        self.pen = Product.objects.create(
+            category=self.category, name='Pen', slug='pen',
+            price=Decimal('100.00'), discount_percentage=10, stock=10,
+        )
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        self.client.force_login(self.user)
+
+    def post_json(self, name, data=None):
+        return self.client.post(
+            reverse(name, args=[self.pen.pk]), data or {}, headers={'Accept': 'application/json'},
+        )
+
+    def test_adding_to_an_existing_line_is_one_update(self):
+        self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]))
+        cart_sql = [q['sql'] for q in queries if 'store_cart' in q['sql']]
+        self.assertEqual(len(cart_sql), 1)
+        self.assertTrue(cart_sql[0].startswith('UPDATE "store_cartitem"'))
+        self.assertIn('"quantity" + 1', cart_sql[0])
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_json_endpoints_return_line_and_cart_totals(self):
+        self.client.get(reverse('store:home'))  # caches an empty summary
+        response = self.post_json('store:add_to_cart')
+        self.assertEqual(response.json(), {
+            'product_id': self.pen.pk, 'quantity': 1, 'line_total': '90.00', 'cart_count': 1,
+            'subtotal': '90.00', 'delivery_charge': '100.00', 'grand_total': '190.00',
+        })
+
+        response = self.post_json('store:update_cart_item', {'quantity': 12})
+        self.assertEqual(response.json()['line_total'], '1080.00')
+        self.assertEqual(response.json()['delivery_charge'], '0.00')
+        self.assertEqual(self.client.get(reverse('store:home')).context['cart_count'], 12)
+
+        response = self.post_json('store:update_cart_item', {'quantity': 0})
+        self.assertEqual((response.json()['quantity'], response.json()['cart_count']), (0, 0))
+        self.assertEqual(self.post_json('store:remove_from_cart').status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('store:add_to_cart', args=[self.pen.pk]),
+                            headers={'Accept': 'application/json'}).status_code,
+            405,
+        )
+
+    def test_guest_json_add_sets_the_cookie(self):
+        self.client.logout()
+        response = self.post_json('store:add_to_cart')
+        self.assertEqual(response.json()['cart_count'], 1)
+        self.assertIn('cart', response.cookies)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Pens', slug='pens')
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        prices = [('99.99', 15), ('55.00', 15), ('100.00', 0), ('20.00', 50), ('75.50', 10)]
+        self.products = [
+            Product.objects.create(
+                category=self.category, name=f'Pen {i}', slug=f'pen-{i}',
+                price=Decimal(price), discount_percentage=discount, stock=10,
+            )
+            for i, (price, discount) in enumerate(prices)
+        ]
+
+    def test_sql_prices_match_python_prices(self):
+        annotated = with_final_price(Product.objects.order_by('id'))
+        self.assertEqual(
+            [p.final_price for p in annotated],
+            [p.get_final_price() for p in self.products],
+        )
+        self.assertEqual(self.products[0].get_final_price(), Decimal('84.99'))
+
+    def test_cart_page_summary_and_order_agree(self):
+        cart = Cart.objects.create(user=self.user)
+        for product, quantity in zip(self.products, (3, 1, 2, 1, 4)):
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        expected = Decimal('254.97') + Decimal('46.75') + Decimal('200.00') + Decimal('10.00') + Decimal('271.80')
+
+        self.assertEqual(compute_cart_summary(self.user.pk)[1]['subtotal'], expected)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('store:cart'))
+        self.assertEqual(len([q for q in queries if 'store_cartitem' in q['sql']]), 1)
+        self.assertEqual(response.context['subtotal'], expected)
+        self.assertEqual(response.context['grand_total'], expected + 100)
+
+        order = place_order(self.user, SHIPPING)
+        self.assertEqual(order.total_price, expected + 100)
+        self.assertEqual(OrderItem.objects.get(order=order, product=self.products[0]).discount_price, Decimal('84.99'))
+
+    def test_delivery_rules_are_configurable(self):
+        self.assertEqual(delivery_charge_for(Decimal('999.99')), Decimal('100.00'))
+        self.assertEqual(delivery_charge_for(Decimal('1000')), Decimal('0.00'))
+        with override_settings(DELIVERY_RULES=[(0, 250), (500, 120), (2000, 0)]):
+            self.assertEqual(delivery_charge_for(Decimal('100')), Decimal('250.00'))
+            self.assertEqual(delivery_charge_for(Decimal('700')), Decimal('120.00'))
+            self.assertEqual(delivery_charge_for(Decimal('2500')), Decimal('0.00'))
+
+    def test_category_listing_sorts_and_filters_by_final_price(self):
+        url = reverse('store:category_detail', args=['pens'])
+        response = self.client.get(url, {'sort': 'price', 'max_price': '90'})
+        self.assertEqual(
+            [p.slug for p in response.context['products']], ['pen-3', 'pen-1', 'pen-4', 'pen-0'],
+        )
+
+        with mock.patch('store.pagination.PAGE_SIZE', 2):
+            first = self.client.get(url, {'sort': '-price', 'min_price': '40'}).context['products']
+            second = self.client.get(
+                url, {'sort': '-price', 'min_price': '40', 'after': first.next_cursor, 'partial': 1},
+            ).context['products']
+        self.assertEqual([p.slug for p in first], ['pen-2', 'pen-0'])
+        self.assertEqual([p.slug for p in second], ['pen-4', 'pen-1'])
+        self.assertIsNone(second.next_cursor)
+
+
+class OrderPagesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        category = Category.objects.create(name='Pens', slug='pens')
+        self.products = [
+            Product.objects.create(
+                category=category, name=f'Pen {i}', slug=f'pen-{i}', price=Decimal('40.00'),
+                discount_percentage=25 if i == 0 else 0, stock=10, image=f'products/pen-{i}.jpg',
+            )
+            for i in range(3)
+        ]
+        cart = Cart.objects.create(user=self.user)
+        for i, product in enumerate(self.products):
+            CartItem.objects.create(cart=cart, product=product, quantity=i + 1)
+        self.order = place_order(self.user, SHIPPING)
+        self.client.force_login(self.user)
+
+    def order_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        # The cart badge's summary query is the only other catalog query.
+        return response, [q['sql'] for q in queries if 'store_cart' not in q['sql'] and 'store_' in q['sql']]
+
+    def test_lines_snapshot_the_product(self):
+        item = OrderItem.objects.get(order=self.order, product=self.products[0])
+        self.assertEqual(
+            (item.product_name, item.product_slug, item.product_image),
+            ('Pen 0', 'pen-0', 'products/pen-0.jpg'),
+        )
+        self.products[0].delete()
+        item.refresh_from_db()
+        self.assertIsNone(item.product)
+        self.assertEqual(str(item), '1 x Pen 0')
+
+    def test_confirmation_loads_order_and_lines_in_two_queries(self):
+        Product.objects.filter(pk=self.products[1].pk).update(name='Renamed')
+        response, queries = self.order_queries(
+            reverse('store:order_confirmation', args=[self.order.order_id])
+        )
+        self.assertEqual(len(queries), 2)
+        self.assertContains(response, 'Pen 1 × 2')
+        self.assertNotContains(response, 'Renamed')
+
+    def test_history_annotates_item_counts_and_totals(self):
+        response, queries = self.order_queries(reverse('store:order_history'))
+        self.assertEqual(len(queries), 1)
+        order = response.context['orders'].items[0]
+        self.assertEqual(order.item_count, 6)
+        self.assertEqual(order.items_total, Decimal('30.00') + Decimal('80.00') + Decimal('120.00'))
+
+    def test_backfill_copies_product_details_into_old_lines(self):
+        OrderItem.objects.update(product_name='', product_slug='', product_image='')
+        self.products[2].delete()
+        call_command('backfill_order_snapshots', batch_size=2, stdout=StringIO())
+        self.assertEqual(
+            sorted(OrderItem.objects.values_list('product_name', 'product_slug')),
+            [('Deleted Product', ''), ('Pen 0', 'pen-0'), ('Pen 1', 'pen-1')],
+        )
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        category = Category.objects.create(name='Pens', slug='pens')
+        product = Product.objects.create(category=category, name='Gel Pen', slug='gel-pen', price=Decimal('40.00'))
+        start = timezone.now() - timedelta(days=10)
+        self.orders = []
+        for i in range(5):
+            order = Order.objects.create(
+                user=self.user, total_price=Decimal('80.00'), status='completed' if i % 2 else 'pending',
+                **{**SHIPPING, 'complete_address': 'House 1,\nStreet "2"'},
+            )
+            # auto_now_add ignores a passed created_at.
+            Order.objects.filter(pk=order.pk).update(created_at=start + timedelta(days=i))
+            if i != 4:
+                for quantity in (1, 2):
+                    OrderItem.snapshot(product, order=order, quantity=quantity, price=Decimal('40.00')).save()
+            self.orders.append(order)
+        self.start = start
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_orders', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_has_a_row_per_line(self):
+        rows = list(csv.reader(StringIO(self.export('--chunk-size', '2'))))
+        self.assertEqual(rows[0][:2], ['order_id', 'created_at'])
+        self.assertEqual(len(rows), 1 + 4 * 2 + 1)
+        self.assertEqual([row[0] for row in rows[1:3]], [self.orders[0].order_id] * 2)
+        self.assertEqual(rows[1][6], 'House 1,\nStreet "2"')
+        self.assertEqual(rows[-1][0], self.orders[4].order_id)
+        self.assertEqual(rows[-1][-5:], [''] * 5)
+
+    def test_jsonl_nests_lines_and_filters(self):
+        since = (self.start + timedelta(days=1)).isoformat()
+        lines = self.export('--format', 'jsonl', '--status', 'completed', '--since', since, '--chunk-size', '1')
+        records = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual([r['order_id'] for r in records], [self.orders[1].order_id, self.orders[3].order_id])
+        self.assertEqual(
+            records[0]['items'],
+            [
+                {'product_name': 'Gel Pen', 'product_slug': 'gel-pen', 'quantity': q, 'price': '40.00', 'discount_price': None}
+                for q in (1, 2)
+            ],
+        )
+        self.assertEqual(records[0]['total_price'], '80.00')
+
+    def test_export_reads_a_page_at_a_time(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.export('--chunk-size', '2')
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT')]
+        # Three pages of orders, each a keyset query and a joined read, and
+        # the empty keyset query that ends the walk.
+        self.assertEqual(len(selects), 7)
+        self.assertTrue(all('LIMIT 2' in sql for sql in selects[::2]))
+
+    def test_admin_action_streams(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('admin:store_order_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [self.orders[0].pk, self.orders[4].pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1 + 2 + 1)
+
+
+class SnapshotTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        category = Category.objects.create(name='Pens', slug='pens')
+        self.products = [
+            Product.objects.create(
+                category=category, name=f'Pen {i}', slug=f'pen-{i}', price=Decimal('12.50'), stock=10,
+            )
+            for i in range(5)
+        ]
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=2)
+        place_order(self.user, SHIPPING)
+        CartItem.objects.create(cart=cart, product=self.products[1], quantity=1)
+
+    def dump(self, *args):
+        call_command('dump_store', self.directory.name, '--chunk-size', '2', *args, stdout=StringIO())
+
+    def load(self, *args):
+        call_command('load_store', self.directory.name, *args, stdout=StringIO())
+
+    def test_round_trip(self):
+        self.dump('--workers', '4')
+        manifest = json.loads(Path(self.directory.name, 'manifest.json').read_text())
+        self.assertNotIn('django_session', manifest['tables'])
+        self.assertNotIn('django_admin_log', manifest['tables'])
+        self.assertEqual(manifest['tables']['store_product']['rows'], 5)
+        self.assertEqual(len(manifest['tables']['store_product']['shards']), 3)
+
+        order = Order.objects.get()
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        self.load('--batch-size', '2')
+
+        restored = Order.objects.get()
+        self.assertEqual(
+            (restored.pk, restored.order_id, restored.created_at, restored.total_price, restored.user.username),
+            (order.pk, order.order_id, order.created_at, order.total_price, 'ali'),
+        )
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertEqual(OrderItem.objects.get().product, self.products[0])
+        self.assertTrue(User.objects.get().check_password('pass12345'))
+
+    def test_include_and_exclude(self):
+        self.dump('--workers', '1', '--include', 'store', '--exclude', 'store_orderitem')
+        tables = json.loads(Path(self.directory.name, 'manifest.json').read_text())['tables']
+        self.assertIn('store_order', tables)
+        self.assertNotIn('store_orderitem', tables)
+        self.assertNotIn('auth_user', tables)
+        with self.assertRaises(CommandError):
+            self.dump('--force', '--include', 'no_such_table')
+
+    def test_broken_foreign_keys_roll_back(self):
+        self.dump('--include', 'store_cartitem')
+        self.products[1].delete()
+        with self.assertRaises(IntegrityError):
+            self.load()
+        self.assertEqual(CartItem.objects.count(), 0)
+
+    def test_tables_pointing_at_loaded_ones_are_checked(self):
+        self.dump('--include', 'store_product')
+        # Not in the snapshot, so replacing the table orphans the line.
+        # SQLite still enforces the key at commit; MySQL relies on the check.
+        pencil = Product.objects.create(
+            category=Category.objects.get(), name='Pencil', slug='pencil', price=Decimal('5.00'),
+        )
+        CartItem.objects.create(cart=self.user.cart, product=pencil, quantity=1)
+        check_constraints = connection.check_constraints
+        with mock.patch.object(connection, 'check_constraints', wraps=check_constraints) as check, \
+                self.assertRaises(IntegrityError):
+            self.load()
+        self.assertEqual(
+            check.call_args.kwargs['table_names'],
+            ['store_cartitem', 'store_orderitem', 'store_product', 'store_productimage', 'store_productsearchterm'],
+        )
+        self.assertTrue(Product.objects.filter(pk=pencil.pk).exists())
+
+
+class AdminPerformanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_login(self.admin)
+        self.categories = [Category.objects.create(name=f'Cat {i}', slug=f'cat-{i}') for i in range(5)]
+
+    def add_products(self, count):
+        start = Product.objects.count()
+        Product.objects.bulk_create([
+            Product(category=self.categories[i % 5], name=f'Pen {i}', slug=f'pen-{i}', price=Decimal('10.00'))
+            for i in range(start, start + count)
+        ])
+
+    def add_orders(self, count):
+        return Order.objects.bulk_create([
+            Order(user=self.admin, order_id=f'AD{i:06d}', total_price=Decimal('100.00'),
+                  **{k: v for k, v in SHIPPING.items()})
+            for i in range(count)
+        ])
+
+    def changelist_queries(self, name, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:store_{name}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries]
+
+    def test_product_changelist_joins_categories(self):
+        def page_queries():
+            return [sql for sql in self.changelist_queries('product') if 'store_cart' not in sql]
+
+        self.add_products(5)
+        few = page_queries()
+        self.add_products(45)
+        many = page_queries()
+        self.assertEqual(len(many), len(few))
+        self.assertTrue(any('JOIN "store_category"' in sql for sql in many))
+
+    def test_large_tables_are_not_counted_exactly(self):
+        self.add_orders(3)
+        with mock.patch('store.pagination.estimated_row_count', return_value=5_000_000):
+            queries = self.changelist_queries('order')
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql.upper() and 'store_order' in sql])
+
+        queries = self.changelist_queries('order', status='pending')
+        counts = [sql for sql in queries if 'COUNT(' in sql.upper() and 'store_order' in sql]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT 10000', counts[0])
+
+    def test_bulk_status_change_is_one_update(self):
+        orders = self.add_orders(4)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('admin:store_order_changelist'), {
+                'action': 'mark_completed',
+                '_selected_action': [order.pk for order in orders[:3]],
+            })
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "store_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            sorted(Order.objects.values_list('status', flat=True)),
+            ['completed', 'completed', 'completed', 'pending'],
+        )
+
+    def test_product_availability_action_invalidates_catalog(self):
+        self.add_products(2)
+        version = get_catalog_version()
+        self.client.post(reverse('admin:store_product_changelist'), {
+            'action': 'make_unavailable',
+            '_selected_action': list(Product.objects.values_list('pk', flat=True)),
+        })
+        self.assertFalse(Product.objects.filter(available=True).exists())
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_inlines_use_autocomplete_for_products(self):
+        self.add_products(30)
+        order = self.add_orders(1)[0]
+        OrderItem.snapshot(Product.objects.first(), order=order, price=Decimal('10.00')).save()
+        response = self.client.get(reverse('admin:store_order_change', args=[order.pk]))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, '>Pen 17<')
+
+
+    def test_product_autocomplete_matches_partial_words(self):
+        for name in ('Gel Pen', 'Pencil Box', 'Sketchbook'):
+            Product.objects.create(category=self.categories[0], name=name, slug=slugify(name), price=Decimal('10.00'))
+
+        def autocomplete(term):
+            response = self.client.get(reverse('admin:autocomplete'), {
+                'term': term, 'app_label': 'store', 'model_name': 'orderitem', 'field_name': 'product',
+            })
+            return sorted(result['text'] for result in response.json()['results'])
+
+        self.assertEqual(autocomplete('pe'), ['Gel Pen', 'Pencil Box'])
+        self.assertEqual(autocomplete('pencil bo'), ['Pencil Box'])
+        self.assertEqual(autocomplete('sketchbook'), ['Sketchbook'])
+        # The changelist search still matches whole words only.
+        response = self.client.get(reverse('admin:store_product_changelist'), {'q': 'pe'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Pens', slug='pens')
+        self.pen = Product.objects.create(
+            category=self.category, name='Blue Pen', slug='blue-pen', price=Decimal('50.00'),
+        )
+        Announcement.objects.create(message='Free delivery over Rs 1000')
+
+    def assert_cached(self, url, text):
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, text)
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        self.assert_cached(reverse('store:home'), 'Pens')
+        self.assert_cached(reverse('store:category_detail', args=['pens']), 'Blue Pen')
+        self.assert_cached(reverse('store:product_detail', args=['blue-pen']), 'Blue Pen')
+
+    def test_page_cache_keys_on_the_views_own_parameters(self):
+        url = reverse('store:category_detail', args=['pens'])
+        self.client.get(url)
+        self.client.get(url, {'sort': 'price', 'min_price': '10.0'})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'min_price': '10', 'sort': 'price'})
+            self.client.get(url, {'sort': 'newest'})
+            self.client.get(url, {'sort': 'junk'})
+
+        # Unknown parameters neither read nor store a page entry.
+        with mock.patch('store.catalog_cache.cache', wraps=cache) as spy:
+            response = self.client.get(url, {'utm_source': 'mail'})
+        self.assertContains(response, 'Blue Pen')
+        self.assertFalse([call for call in spy.mock_calls if ':page:' in str(call.args[:1])])
+
+    def test_catalog_edits_invalidate_cached_pages(self):
+        url = reverse('store:category_detail', args=['pens'])
+        self.client.get(url)
+
+        self.pen.name = 'Red Pen'
+        self.pen.save()
+        self.assertContains(self.client.get(url), 'Red Pen')
+
+        self.pen.delete()
+        self.assertNotContains(self.client.get(url), 'Red Pen')
+
+    def test_authenticated_users_get_cached_fragments_and_live_cart_badge(self):
+        user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        self.client.force_login(user)
+        url = reverse('store:category_detail', args=['pens'])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), 2)  # session and user; the cart summary is cached
+        self.assertContains(response, 'Blue Pen')
+
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.pen, quantity=4)
+        self.assertEqual(self.client.get(url).context['cart_count'], 4)
+
+    def test_works_with_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}):
+                self.assert_cached(reverse('store:home'), 'Pens')
+                Category.objects.create(name='Paper', slug='paper')
+                self.assertContains(self.client.get(reverse('store:home')), 'Paper')
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.category = Category.objects.create(name='Pens', slug='pens')
+        Product.objects.create(
+            category=self.category, name='Blue Pen', slug='blue-pen', price=Decimal('50.00'),
+        )
+
+    def test_server_timing_header_reports_queries_templates_and_cache(self):
+        url = reverse('store:category_detail', args=['pens'])
+        with CaptureQueriesContext(connection) as queries:
+            cold = self.client.get(url)
+        self.assertIn(f'desc="{len(queries)} queries"', cold['Server-Timing'])
+        self.assertIn('tpl;dur=', cold['Server-Timing'])
+        self.assertNotIn(' 0 misses', cold['Server-Timing'])
+
+        warm = self.client.get(url)
+        self.assertIn('db;dur=0.0;desc="0 queries"', warm['Server-Timing'])
+        self.assertIn('cache;desc="1 hits, 0 misses"', warm['Server-Timing'])
+
+    def test_metrics_endpoint_exposes_per_view_histograms(self):
+        self.client.get(reverse('store:home'))
+        self.client.get(reverse('store:home'))
+        url = reverse('metrics')
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(
+                self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403,
+            )
+            response = self.client.get(url, headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE scribi_request_duration_seconds histogram', body)
+        self.assertIn('scribi_request_duration_seconds_count{view="store:home"} 2', body)
+        self.assertIn('scribi_request_duration_seconds_bucket{view="store:home",le="+Inf"} 2', body)
+        self.assertIn('scribi_responses_total{view="store:home",status="2xx"} 2', body)
+        self.assertIn('scribi_cache_hits_total{view="store:home"} 1', body)
+
+        staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_can_be_disabled(self):
+        self.assertFalse(self.client.get(reverse('store:home')).has_header('Server-Timing'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Pens', slug='pens')
+        Product.objects.bulk_create([
+            Product(category=self.category, name=f"Pen {i}", slug=f"pen-{i}", price=Decimal('10.00'))
+            for i in range(7)
+        ])
+        # Ties on created_at must still page deterministically by id.
+        Product.objects.update(created_at=timezone.now())
+
+    def test_walks_every_row_once_without_offset(self):
+        seen, cursor = [], None
+        while True:
+            page = KeysetPage(Product.objects.all(), cursor, page_size=3)
+            with CaptureQueriesContext(connection) as queries:
+                seen.extend(p.pk for p in page)
+            self.assertNotIn('OFFSET', queries[0]['sql'])
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(Product.objects.values_list('pk', flat=True), reverse=True))
+
+    def test_category_fragment_continues_the_grid(self):
+        url = reverse('store:category_detail', args=['pens'])
+        with mock.patch('store.pagination.PAGE_SIZE', 4):
+            first = self.client.get(url)
+            cursor = first.context['products'].next_cursor
+            fragment = self.client.get(url, {'after': cursor, 'partial': 1})
+
+        self.assertContains(first, '7 items')
+        self.assertContains(first, 'data-infinite-scroll')
+        self.assertContains(fragment, 'data-append-to="#product-grid"')
+        self.assertNotContains(fragment, '<html')
+        self.assertEqual(len(fragment.context['products']), 3)
+        self.assertIsNone(fragment.context['products'].next_cursor)
+
+    def test_later_pages_reuse_the_product_count(self):
+        url = reverse('store:category_detail', args=['pens'])
+        with mock.patch('store.pagination.PAGE_SIZE', 4):
+            cursor = self.client.get(url).context['products'].next_cursor
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'after': cursor})
+        self.assertContains(response, '7 items')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+    def test_bad_cursor_is_404(self):
+        response = self.client.get(reverse('store:category_detail', args=['pens']), {'after': '!!'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_order_history_pages(self):
+        user = User.objects.create_user('ali', 'ali@example.com', 'pass12345')
+        for _ in range(3):
+            Order.objects.create(user=user, total_price=0, **SHIPPING)
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('store:order_history'), {'partial': 1})
+
+        self.assertContains(response, 'data-append-to="#order-rows"')
+        self.assertEqual(len(response.context['orders']), 3)
+
+
+class QueryPlanCheckTests(TestCase):
+    def test_view_queries_use_indexes_on_large_tables(self):
+        out = StringIO()
+        call_command('check_query_plans', seed=1200, min_rows=1000, stdout=out)
+        self.assertIn('No view query full-scans', out.getvalue())
+        self.assertFalse(Product.objects.exists())
+
+    def test_reports_full_scans(self):
+        # The home page lists every category, which is a scan of that table.
+        with self.assertRaises(CommandError):
+            call_command('check_query_plans', seed=5, min_rows=1, stdout=StringIO(), stderr=StringIO())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.pens = Category.objects.create(name='Pens', slug='pens')
+        self.paper = Category.objects.create(name='Paper', slug='paper')
+        self.gel = Product.objects.create(
+            category=self.pens, name='Blue Gel Pen', slug='blue-gel-pen', price=Decimal('50.00'),
+            description='Smooth gel ink.',
+        )
+        self.marker = Product.objects.create(
+            category=self.pens, name='Permanent Marker', slug='marker', price=Decimal('80.00'),
+            description='Blue ink that lasts.',
+        )
+        self.notebook = Product.objects.create(
+            category=self.paper, name='Ruled Notebook', slug='notebook', price=Decimal('120.00'),
+            description='Pairs well with any pen.',
+        )
+
+    def test_tokenize_folds_case_accents_plurals_and_stopwords(self):
+        self.assertEqual(tokenize('The Crème PENS and Boxes'), ['creme', 'pen', 'box'])
+
+    def test_ranks_name_matches_above_description_matches(self):
+        self.assertEqual(search_products('blue pen'), [self.gel, self.marker, self.notebook])
+        self.assertEqual(search_products('notebooks'), [self.notebook])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.gel.name = 'Fountain Pen'
+        self.gel.save()
+        self.assertEqual(search_products('fountain'), [self.gel])
+        self.assertNotIn(self.gel, search_products('blue'))
+
+        self.paper.name = 'Journals'
+        self.paper.save()
+        self.assertEqual(search_products('journal'), [self.notebook])
+
+        self.notebook.delete()
+        self.assertEqual(search_products('journal'), [])
+
+    def test_unavailable_products_are_hidden_from_storefront(self):
+        Product.objects.filter(pk=self.marker.pk).update(available=False)
+        self.assertEqual(search_products('marker'), [])
+
+    def test_admin_search_requires_every_term(self):
+        matches = filter_by_search(Product.objects.all(), 'blue ink')
+        self.assertEqual(set(matches), {self.gel, self.marker})
+        self.assertEqual(list(filter_by_search(Product.objects.all(), 'blue notebook')), [])
+
+    def test_rebuild_and_view(self):
+        ProductSearchTerm.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.client.get(reverse('store:search'), {'q': 'pen'})
+        self.assertContains(response, 'Blue Gel Pen')
+        self.assertEqual(response.context['products'][0], self.gel)
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pens = Category.objects.create(name='Pens', slug='pens')
+        self.paper = Category.objects.create(name='Paper', slug='paper')
+        self.pen = Product.objects.create(
+            category=self.pens, name='Gel Pen', slug='gel-pen', price=Decimal('100.00'),
+            discount_percentage=10,
+        )
+        self.notebook = Product.objects.create(
+            category=self.paper, name='Notebook', slug='notebook', price=Decimal('200.00'),
+        )
+        for i in range(3):
+            self.pen.images.create(image=f'products/gel-{i}.jpg', alt_text=f'Gel {i}')
+        self.url = reverse('store:api-product-list')
+
+    def test_list_and_detail(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['slug'] for row in response.json()['results']], ['notebook', 'gel-pen'])
+
+        detail = self.client.get(reverse('store:api-product-detail', args=['gel-pen'])).json()
+        self.assertEqual(detail['category'], 'pens')
+        self.assertEqual(detail['final_price'], '90.00')
+        self.assertEqual(len(detail['images']), 3)
+
+    def test_category_filter_and_sparse_fields(self):
+        response = self.client.get(self.url, {'category': 'pens', 'fields': 'slug,final_price'})
+        self.assertEqual(response.json()['results'], [{'slug': 'gel-pen', 'final_price': '90.00'}])
+
+    def test_images_are_prefetched_in_one_query(self):
+        for i in range(5):
+            product = Product.objects.create(
+                category=self.pens, name=f'Pen {i}', slug=f'pen-{i}', price=Decimal('10.00'),
+            )
+            product.images.create(image=f'products/pen-{i}.jpg')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        image_queries = [q for q in queries if 'store_productimage' in q['sql']]
+        self.assertEqual(len(image_queries), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'slug, images'})
+        self.assertEqual(len(response.json()['results'][0]['images']), 1)
+        self.assertEqual(len([q for q in queries if 'store_productimage' in q['sql']]), 1)
+
+    def test_cursor_pagination(self):
+        response = self.client.get(self.url, {'page_size': 1}).json()
+        self.assertEqual(response['results'][0]['slug'], 'notebook')
+        following = self.client.get(response['next']).json()
+        self.assertEqual(following['results'][0]['slug'], 'gel-pen')
+        self.assertIsNone(following['next'])
+
+    def test_conditional_get(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # The aggregate behind the validators is cached for the catalog version.
+        self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+        self.pen.price = Decimal('120.00')
+        self.pen.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_sale_changes_list_and_detail_etags(self):
+        self.pen.stock = 1
+        self.pen.save()
+        detail_url = reverse('store:api-product-detail', args=['gel-pen'])
+        etags = {url: self.client.get(url)['ETag'] for url in (self.url, detail_url)}
+
+        user = User.objects.create_user('buyer')
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.pen, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user, SHIPPING)
+
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(detail_url).json()['stock'], 0)
+
+    def test_categories_and_announcements(self):
+        Announcement.objects.create(message='Free delivery', active=True)
+        Announcement.objects.create(message='Old news', active=False)
+        categories = self.client.get(reverse('store:api-category-list')).json()['results']
+        self.assertEqual([c['slug'] for c in categories], ['pens', 'paper'])
+        announcements = self.client.get(reverse('store:api-announcement-list')).json()['results']
+        self.assertEqual([a['message'] for a in announcements], ['Free delivery'])
+
+
+def make_image(name, size, fmt='JPEG', mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.source = tempfile.TemporaryDirectory()
+        storage_settings = override_settings(
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            MEDIA_ROOT=self.media.name,
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        self.addCleanup(self.media.cleanup)
+        self.addCleanup(self.source.cleanup)
+        for name, size in (('gel.jpg', (40, 30)), ('gel-side.jpg', (30, 30)), ('gel-top.jpg', (20, 30))):
+            Path(self.source.name, name).write_bytes(make_image(name, size).read())
+
+    def write(self, name, text):
+        path = Path(self.source.name, name)
+        path.write_text(text)
+        return str(path)
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    CSV = (
+        'name,category,price,discount_percentage,stock,image,gallery\n'
+        'Gel Pen,Pens,40,10,5,gel.jpg,gel-side.jpg|gel-top.jpg\n'
+        'Ballpoint,Pens,20.5,,3,,\n'
+        'Sketchbook,Art Supplies,300,0,1,,\n'
+    )
+
+    def test_import_creates_catalog_and_images(self):
+        version = get_catalog_version()
+        out, err = self.run_import(self.write('catalog.csv', self.CSV), '--batch-size', '2')
+        self.assertEqual(err, '')
+        self.assertIn('products: 3 created, 0 updated, 0 unchanged', out)
+        self.assertIn('images: 3 uploaded', out)
+        self.assertEqual(set(Category.objects.values_list('slug', flat=True)), {'pens', 'art-supplies'})
+
+        pen = Product.objects.get(slug='gel-pen')
+        self.assertEqual((pen.price, pen.discount_percentage, pen.stock), (Decimal('40.00'), 10, 5))
+        self.assertTrue(pen.image.name.startswith('products/gel-pen-'))
+        self.assertTrue(default_storage.exists(pen.image.name))
+        self.assertEqual(pen.images.count(), 2)
+        self.assertEqual(ImageVariantSet.objects.count(), 3)
+        self.assertEqual(list(search_products('ballpoint')), [Product.objects.get(slug='ballpoint')])
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_reimporting_an_unchanged_file_writes_nothing(self):
+        path = self.write('catalog.csv', self.CSV)
+        self.run_import(path)
+        version = get_catalog_version()
+        with CaptureQueriesContext(connection) as queries:
+            out, _ = self.run_import(path)
+        writes = [q['sql'] for q in queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(writes, [])
+        self.assertIn('products: 0 created, 0 updated, 3 unchanged', out)
+        self.assertIn('images: 0 uploaded', out)
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(len(os.listdir(Path(self.media.name, 'products', 'gallery'))), 2)
+
+    def test_changes_bad_rows_and_galleries(self):
+        self.run_import(self.write('catalog.csv', self.CSV))
+        pen = Product.objects.get(slug='gel-pen')
+        lines = (
+            '{"name": "Gel Pen", "category": "Pens", "price": "35.00", "discount_percentage": 10, '
+            '"stock": 5, "image": "gel.jpg", "gallery": ["gel-top.jpg"]}\n'
+            '{"name": "Broken", "category": "Pens", "price": "free"}\n'
+            'not json\n'
+            '{"name": "Eraser", "category": "Pens", "price": 5, "image": "missing.jpg"}\n'
+        )
+        out, err = self.run_import(self.write('catalog.jsonl', lines))
+        self.assertIn('line 2: price is not a number', err)
+        self.assertIn('line 3: invalid JSON', err)
+        self.assertIn('missing.jpg', err)
+        self.assertIn('products: 1 created, 1 updated, 0 unchanged', out)
+
+        updated = Product.objects.get(pk=pen.pk)
+        self.assertEqual(updated.price, Decimal('35.00'))
+        self.assertEqual(updated.image.name, pen.image.name)
+        top = hashlib.sha256(Path(self.source.name, 'gel-top.jpg').read_bytes()).hexdigest()[:16]
+        self.assertEqual(
+            [image.image.name for image in updated.images.all()],
+            [f'products/gallery/gel-pen-{top}.jpg'],
+        )
+        self.assertFalse(Product.objects.get(slug='eraser').image)
+
+
+    def test_category_name_clash_skips_its_rows(self):
+        Category.objects.create(name='Pens', slug='writing')
+        out, err = self.run_import(self.write('catalog.csv', self.CSV))
+        self.assertIn("category pens: the name 'Pens' belongs to category writing", err)
+        self.assertIn('2 skipped', out)
+        self.assertEqual(set(Product.objects.values_list('slug', flat=True)), {'sketchbook'})
+
+    def test_storage_errors_fail_the_row_not_the_import(self):
+        from botocore.exceptions import EndpointConnectionError
+        error = EndpointConnectionError(endpoint_url='https://bucket.s3.amazonaws.com')
+        with mock.patch.object(default_storage, 'save', side_effect=error):
+            out, err = self.run_import(self.write('catalog.csv', self.CSV))
+        self.assertIn('gel-pen: Could not connect to the endpoint URL', err)
+        self.assertIn('3 failed', out)
+        self.assertIn('products: 3 created', out)
+        self.assertFalse(Product.objects.get(slug='gel-pen').image)
+
+    def test_upserts_omit_the_conflict_target_where_unsupported(self):
+        upserts = []
+        bulk_create = QuerySet.bulk_create
+
+        def record(queryset, objs, **kwargs):
+            if kwargs.get('update_conflicts'):
+                upserts.append((queryset.model, dict(kwargs)))
+                # SQLite needs the target that MySQL goes without.
+                kwargs['unique_fields'] = ['slug']
+                with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', True):
+                    return bulk_create(queryset, objs, **kwargs)
+            return bulk_create(queryset, objs, **kwargs)
+
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(QuerySet, 'bulk_create', autospec=True, side_effect=record):
+            self.run_import(self.write('catalog.csv', 'name,category,price\nGel Pen,Pens,40\n'))
+        self.assertEqual([model for model, _ in upserts], [Category, Product])
+        self.assertFalse(any('unique_fields' in kwargs for _, kwargs in upserts))
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        storage_settings = override_settings(
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            MEDIA_ROOT=self.media.name,
+            MEDIA_URL='/media/',
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        self.addCleanup(self.media.cleanup)
+        self.category = Category.objects.create(name='Pens', slug='pens')
+
+    def render(self, image):
+        return Template('{% load store_images %}{% picture image sizes="50vw" alt="Pen" %}').render(
+            Context({'image': image})
+        )
+
+    def test_upload_is_queued_and_processed(self):
+        product = Product.objects.create(
+            category=self.category, name='Pen', slug='pen', price=Decimal('10.00'),
+            image=make_image('pen.jpg', (1200, 800)),
+        )
+        row = ImageVariantSet.objects.get(source=product.image.name)
+        self.assertEqual(row.status, 'pending')
+        self.assertEqual(self.render(product.image), f'<img src="/media/{product.image.name}" alt="Pen">')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_image_variants(), (1, 0))
+        row.refresh_from_db()
+        self.assertEqual(row.status, 'ready')
+        self.assertEqual([w for w, _ in row.variants['webp']], [160, 320, 640, 1024])
+        width, name = row.variants['jpeg'][-1]
+        with default_storage.open(name) as fh, Image.open(fh) as variant:
+            self.assertEqual((variant.format, variant.size), ('JPEG', (1024, 683)))
+        with default_storage.open(row.variants['webp'][0][1]) as fh, Image.open(fh) as variant:
+            self.assertEqual((variant.format, variant.size), ('WEBP', (160, 107)))
+
+        html = self.render(product.image)
+        self.assertIn('<source type="image/webp" srcset="/media/variants/products/pen-160w.webp 160w', html)
+        self.assertIn('1024w" sizes="50vw">', html)
+        self.assertIn('pen-640w.jpg 640w', html)
+
+    def test_small_and_transparent_images(self):
+        small = ProductImage.objects.create(
+            product=Product.objects.create(category=self.category, name='Pen', slug='pen', price=1),
+            image=make_image('tiny.png', (120, 90), 'PNG', 'RGBA'),
+        )
+        self.category.image = make_image('logo.png', (400, 400), 'PNG', 'RGBA')
+        self.category.save()
+        self.assertEqual(process_image_variants(), (2, 0))
+
+        self.assertEqual(ImageVariantSet.objects.get(source=small.image.name).variants, {'webp': [], 'jpeg': []})
+        self.assertNotIn('srcset', self.render(small.image))
+        variants = ImageVariantSet.objects.get(source=self.category.image.name).variants
+        with default_storage.open(variants['webp'][-1][1]) as fh, Image.open(fh) as webp:
+            self.assertEqual(webp.mode, 'RGBA')
+        with default_storage.open(variants['jpeg'][-1][1]) as fh, Image.open(fh) as jpeg:
+            self.assertEqual(jpeg.mode, 'RGB')
+
+    def test_unreadable_image_is_retried_then_failed(self):
+        self.category.image = SimpleUploadedFile('broken.jpg', b'not an image')
+        self.category.save()
+        self.assertEqual(process_image_variants(max_attempts=2), (0, 1))
+        row = ImageVariantSet.objects.get()
+        self.assertEqual((row.status, row.attempts), ('pending', 1))
+        self.assertIn('UnidentifiedImageError', row.last_error)
+
+        ImageVariantSet.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_image_variants(max_attempts=2), (0, 1))
+        self.assertEqual(ImageVariantSet.objects.get().status, 'failed')
+
+    def test_backfill_and_storefront_markup(self):
+        product = Product.objects.create(
+            category=self.category, name='Pen', slug='pen', price=Decimal('10.00'),
+            image=make_image('pen.jpg', (800, 800)),
+        )
+        ImageVariantSet.objects.all().delete()
+        call_command('process_image_variants', '--backfill', stdout=StringIO())
+        self.assertEqual(ImageVariantSet.objects.get().status, 'ready')
+
+        response = self.client.get(reverse('store:category_detail', args=['pens']))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'pen-320w.jpg 320w')
+        response = self.client.get(reverse('store:product_detail', args=[product.slug]))
+        self.assertContains(response, 'id="main-img"')
+        self.assertContains(response, 'pen-640w.webp 640w')
+
+    def test_rows_are_leased_while_rendering(self):
+        self.category.image = make_image('logo.png', (400, 400), 'PNG')
+        self.category.save()
+        real_render = images.render_variants
+
+        def render(source, storage=None):
+            # Claimed and committed before rendering, so no other worker
+            # picks the row up meanwhile.
+            row = ImageVariantSet.objects.get(source=source)
+            self.assertEqual(row.attempts, 1)
+            self.assertGreater(row.next_attempt_at, timezone.now())
+            self.assertEqual(process_image_variants(), (0, 0))
+            return real_render(source, storage=storage)
+
+        with mock.patch.object(images, 'render_variants', render):
+            self.assertEqual(process_image_variants(), (1, 0))
+        self.assertEqual(ImageVariantSet.objects.get().status, 'ready')
+
+    def test_expired_lease_does_not_overwrite_newer_attempt(self):
+        self.category.image = make_image('logo.png', (400, 400), 'PNG')
+        self.category.save()
+
+        def render(source, storage=None):
+            # Another worker re-claims the row after the lease ran out.
+            ImageVariantSet.objects.update(attempts=F('attempts') + 1)
+            return {'webp': [], 'jpeg': []}
+
+        with mock.patch.object(images, 'render_variants', render):
+            self.assertEqual(process_image_variants(), (1, 0))
+        row = ImageVariantSet.objects.get()
+        self.assertEqual((row.status, row.attempts), ('pending', 2))
+
+    def test_command_bumps_catalog_version_once(self):
+        for name in ('a.png', 'b.png', 'c.png'):
+            Category.objects.create(name=name, slug=slugify(name), image=make_image(name, (200, 200), 'PNG'))
+        version = get_catalog_version()
+        with mock.patch('store.management.commands.process_image_variants.bump_catalog_version') as bump:
+            call_command('process_image_variants', '--batch-size=1', stdout=StringIO())
+        bump.assert_called_once_with()
+        self.assertEqual(ImageVariantSet.objects.filter(status='ready').count(), 3)
+        self.assertEqual(get_catalog_version(), version)
+
+    def test_saves_without_a_new_image_queue_nothing(self):
+        Product.objects.create(
+            category=self.category, name='Pen', slug='pen', price=Decimal('10.00'),
+            image=make_image('pen.jpg', (300, 300)),
+        )
+        product = Product.objects.get()
+        with CaptureQueriesContext(connection) as queries:
+            product.price = Decimal('12.00')
+            product.save()
+            self.category.description = 'Writing'
+            self.category.save()
+        self.assertFalse([q for q in queries if 'store_imagevariantset' in q['sql']])
+
+        product.image = make_image('pen-2.jpg', (300, 300))
+        product.save()
+        self.assertEqual(ImageVariantSet.objects.count(), 2)
+
+    def test_pending_lookups_are_cached_briefly(self):
+        product = Product.objects.create(
+            category=self.category, name='Pen', slug='pen', price=Decimal('10.00'),
+            image=make_image('pen.jpg', (300, 300)),
+        )
+        with mock.patch('store.images.cache') as images_cache:
+            images_cache.get.return_value = None
+            self.assertEqual(get_variants(product.image.name), {})
+        images_cache.set.assert_called_once_with(mock.ANY, {}, PENDING_CACHE_TIMEOUT)
+
+class MediaStorageTests(TestCase):
+    def test_instances_share_connections_and_memoise_urls(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            media, other, static = MediaStorage(), MediaStorage(), StaticStorage()
+        self.assertEqual(output.getvalue(), '')
+        self.assertIs(media.connection, other.connection)
+        self.assertIs(media.connection, static.connection)
+
+        url = media.url('products/blue pen.jpg')
+        self.assertTrue(url.endswith('/media/products/blue%20pen.jpg'))
+        self.assertEqual(media.url('products/blue pen.jpg'), url)
+        self.assertEqual(media._public_url.cache_info().hits, 1)
+        self.assertIn('?ResponseContentDisposition=attachment', media.url(
+            'products/blue pen.jpg', parameters={'ResponseContentDisposition': 'attachment'},
+        ))
+        self.assertEqual(media.transfer_config.max_request_concurrency, 4)
+
+
+STAND_IN_BUCKET = {}
+
+
+class InMemoryStaticStorage(StaticStorage):
+    """
+    StaticStorage with the S3 bucket replaced by ``STAND_IN_BUCKET``.
+    """
+    uploads = []
+
+    def list_remote(self):
+        for name, (data, params, modified) in STAND_IN_BUCKET.items():
+            yield name, hashlib.md5(data).hexdigest(), modified
+
+    def upload(self, name, content):
+        STAND_IN_BUCKET[name] = (content.read(), self.get_object_parameters(name), timezone.now())
+        self.uploads.append(name)
+        return name
+
+    def delete_remote(self, names):
+        for name in names:
+            del STAND_IN_BUCKET[name]
+
+    def _open(self, name, mode='rb'):
+        self.wait(name)
+        return ContentFile(STAND_IN_BUCKET[name][0], name=name)
+
+
+class CollectStaticTests(TestCase):
+    def setUp(self):
+        STAND_IN_BUCKET.clear()
+        source = tempfile.TemporaryDirectory()
+        manifest = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(manifest.cleanup)
+        self.source = Path(source.name)
+        (self.source / 'css').mkdir()
+        (self.source / 'img').mkdir()
+        (self.source / 'css' / 'site.css').write_text('body { background: url("../img/dot.png"); }')
+        (self.source / 'img' / 'dot.png').write_bytes(b'dot-v1')
+        self.static_settings = {
+            'STORAGES': {
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'store.tests.InMemoryStaticStorage'},
+            },
+            'STATIC_ROOT': manifest.name,
+            'STATICFILES_DIRS': [source.name],
+            'STATICFILES_FINDERS': ['django.contrib.staticfiles.finders.FileSystemFinder'],
+        }
+
+    def collect(self):
+        InMemoryStaticStorage.uploads = []
+        with self.settings(**self.static_settings):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            return sorted(InMemoryStaticStorage.uploads), staticfiles_storage.url('css/site.css')
+
+    def test_uploads_only_changed_files_with_immutable_hashed_names(self):
+        uploads, css_url = self.collect()
+        self.assertEqual(len(uploads), 4)
+        self.assertIn(css_url.rsplit('/static/', 1)[1], uploads)
+        for name, (data, params, modified) in STAND_IN_BUCKET.items():
+            if name in ('css/site.css', 'img/dot.png'):
+                self.assertEqual(params['CacheControl'], 'max-age=86400')
+            else:
+                self.assertEqual(params['CacheControl'], 'public, max-age=31536000, immutable')
+
+        self.assertEqual(self.collect(), ([], css_url))
+
+        dot = self.source / 'img' / 'dot.png'
+        dot.write_bytes(b'dot-v2')
+        later = time.time() + 60
+        os.utime(dot, (later, later))
+        uploads, new_css_url = self.collect()
+        self.assertNotEqual(new_css_url, css_url)
+        self.assertEqual(len(uploads), 3)
+        self.assertIn('img/dot.png', uploads)
+        # Hashed files from the previous release stay for pages still using them.
+        self.assertEqual(len(STAND_IN_BUCKET), 6)
+
+
+class BenchmarkViewsTests(TestCase):
+    def test_reports_every_view_and_rolls_back(self):
+        out = StringIO()
+        call_command(
+            'benchmark_views', '--categories', '2', '--products', '6', '--orders', '3',
+            '--iterations', '3', '--warmup', '0', stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['dataset']['products'], 6)
+        self.assertEqual(len(report['views']), 8)
+        for view, result in report['views'].items():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'], view)
+            self.assertGreater(result['queries'], 0, view)
+        self.assertEqual(report['views']['checkout_post']['status'], 302)
+        self.assertGreater(report['views']['order_history']['bytes'], 0)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+
+    def test_seeds_without_ids_from_bulk_insert(self):
+        # As on MySQL, which returns no ids from a multi-row INSERT.
+        no_ids = mock.PropertyMock(return_value=False)
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', no_ids):
+            call_command(
+                'benchmark_views', '--categories', '2', '--products', '4', '--orders', '2',
+                '--iterations', '1', '--warmup', '0', '--views', 'order_history', stdout=StringIO(),
+            )
+
+class SeedStoreTests(TestCase):
+    def seed(self, seed=7):
+        call_command(
+            'seed_store', '--categories', '3', '--products', '40', '--users', '25',
+            '--orders', '60', '--batch-size', '16', '--seed', str(seed), '--search-index',
+            stdout=StringIO(),
+        )
+
+    def snapshot(self):
+        return (
+            list(Product.objects.order_by('pk').values_list('name', 'price', 'created_at')),
+            list(OrderItem.objects.order_by('pk').values_list('order_id', 'product_id', 'quantity')),
+        )
+
+    def test_generates_consistent_rows(self):
+        self.seed()
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(User.objects.filter(profile__isnull=False).count(), 25)
+        self.assertEqual(Order.objects.count(), 60)
+        self.assertTrue(ProductSearchTerm.objects.exists())
+        self.assertGreater(len(set(Order.objects.values_list('created_at', flat=True))), 1)
+        for order in Order.objects.prefetch_related('order_items'):
+            self.assertEqual(decode_order_id(order.order_id), order.pk)
+            lines = sum(item.get_total() for item in order.order_items.all())
+            self.assertEqual(order.total_price, lines + order.delivery_charge)
+        for item in CartItem.objects.select_related('cart'):
+            self.assertIsNotNone(item.cart.user_id)
+        # The pk sequence still works for ordinary inserts afterwards.
+        order = Order.objects.create(total_price=1, **SHIPPING)
+        self.assertEqual(decode_order_id(order.order_id), order.pk)
+
+    def test_sampler_skips_gaps_and_excluded_rows(self):
+        self.seed()
+        Product.objects.filter(pk__in=Product.objects.order_by('pk').values('pk')[5:15]).delete()
+        Product.objects.filter(pk__in=Product.objects.order_by('pk').values('pk')[:5]).update(available=False)
+        sampler = PkSampler(Product.objects.filter(available=True), random.Random(1), PRODUCT_SKEW, fields=('name',))
+        with CaptureQueriesContext(connection) as queries:
+            rows = sampler.sample(500)
+        self.assertEqual(len(rows), 500)
+        allowed = dict(Product.objects.filter(available=True).values_list('pk', 'name'))
+        self.assertTrue(all(allowed[pk] == name for pk, name in rows))
+        # A handful of lookups, not one per row.
+        self.assertLess(len(queries), 10)
+        # Skewed: the most drawn product is far above the uniform share.
+        self.assertGreater(Counter(pk for pk, _ in rows).most_common(1)[0][1], 500 / len(allowed) * 3)
+
+    def test_same_seed_same_rows(self):
+        snapshots = []
+        for seed in (7, 7, 8):
+            with transaction.atomic():
+                self.seed(seed)
+                snapshots.append(self.snapshot())
+                transaction.set_rollback(True)
+        self.assertEqual(snapshots[0], snapshots[1])
+        self.assertNotEqual(snapshots[0], snapshots[2])
@@ -12,11 +12,17 @@
     
 # ]
 # store/urls.py
-from django.urls import path
-from . import views
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+from . import api, views
 
 app_name = 'store'
 
+router = DefaultRouter()
+router.register('categories', api.CategoryViewSet, basename='api-category')
+router.register('products', api.ProductViewSet, basename='api-product')
+router.register('announcements', api.AnnouncementViewSet, basename='api-announcement')
+
 urlpatterns = [
     # Home and authentication
     path('', views.home, name='home'),
@@ -40,4 +46,8 @@ urlpatterns = [
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('search/', views.search, name='search'),
+
+    # Read-only catalog API
+    path('api/', include(router.urls)),
 ]
\ No newline at end of file
@@ -6,15 +6,24 @@ from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+from .accounts import PROFILE_FIELDS, create_account
 from .forms import SignupForm, ShippingForm
-from .models import Profile, Category, Product, Cart, CartItem, Order, OrderItem,Announcement
-from django.core.mail import send_mail, BadHeaderError
-from django.http import HttpResponse
+from .models import Category, Product, Order, OrderItem, Announcement
+from django.core.mail import BadHeaderError
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
 from django.conf import settings
+from django.db.models import Prefetch
+from . import carts
+from .cart_summary import get_cart_summary
+from .catalog_cache import cached_catalog, catalog_page_cache, get_catalog_version
+from .checkout import EmptyCart, OutOfStock, get_cart_lines, place_order
+from .outbox import enqueue_email
+from .pagination import KeysetPage
+from .pricing import CENT, delivery_charge_for, with_final_price, with_item_totals
+from .search import search_products
 
 
 def about(request):
@@ -30,12 +39,11 @@ def contact(request):
         full_message = f"Message from {name} ({sender_email}):\n\n{message}"
 
         try:
-            send_mail(
+            enqueue_email(
                 subject='New Contact Form Message',
                 message=full_message,
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[settings.ADMIN_EMAIL],
-                fail_silently=False,
             )
             messages.success(request, "Your message has been sent successfully.")
         except BadHeaderError:
@@ -47,63 +55,70 @@ def contact(request):
 
     return render(request, 'store/contact.html')
 
+@catalog_page_cache
 def home(request):
     """
     Renders the homepage with categories and featured products.
     """
-    announcement = Announcement.objects.filter(active=True).first()
+    version = get_catalog_version()
+    announcement = cached_catalog(
+        'announcement', lambda: Announcement.objects.filter(active=True).first(), version
+    )
+    # Lazy querysets: only evaluated when the template fragment cache misses.
     categories = Category.objects.all()
     featured_products = Product.objects.filter(available=True)[:4]
-    
-    # Get cart count for authenticated users
-    cart_count = 0
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_count = cart.items.aggregate(total=Sum('quantity'))['total'] or 0
-    
+
     return render(request, 'store/home.html', {
         'announcement': announcement,
         'categories': categories,
         'featured': featured_products,
-        'cart_count': cart_count,
+        'cart_count': get_cart_summary(request)['count'],
+        'catalog_version': version,
     })
 
+@catalog_page_cache
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, available=True)
+    version = get_catalog_version()
+    product = cached_catalog(
+        f"product:{slug}",
+        lambda: Product.objects.select_related('category').filter(slug=slug, available=True).first(),
+        version,
+    )
+    if product is None:
+        raise Http404("No Product matches the given query.")
     images = product.images.all()
     return render(request, 'store/product_detail.html', {
         'product': product,
         'images': images,
+        'catalog_version': version,
     })
+def search(request):
+    """
+    Lists products matching the ?q= query, best match first.
+    """
+    query = request.GET.get('q', '').strip()
+    products = search_products(query) if query else []
+    return render(request, 'store/search.html', {
+        'query': query,
+        'products': products,
+    })
+
 def signup(request):
     """
     Handles user signup with custom SignupForm.
-    Creates both User and Profile objects.
+    Creates the User and its Profile with one INSERT each.
     """
     if request.method == 'POST':
         form = SignupForm(request.POST)
         if form.is_valid():
             try:
-                # Create the user with first and last name
-                user = User.objects.create_user(
-                    username=form.cleaned_data['username'],
-                    email=form.cleaned_data['email'],
-                    password=form.cleaned_data['password'],
+                data = form.cleaned_data
+                user = create_account(
+                    data['username'], data['email'], data['password'],
+                    first_name=data['first_name'], last_name=data['last_name'],
+                    **{field: data.get(field, '') for field in PROFILE_FIELDS},
                 )
-                user.first_name = form.cleaned_data['first_name']
-                user.last_name = form.cleaned_data['last_name']
-                user.save()
-                
-                # Update profile
-                profile = user.profile
-                profile.phone_number = form.cleaned_data['phone_number']
-                profile.address_line1 = form.cleaned_data['address_line1']
-                profile.address_line2 = form.cleaned_data.get('address_line2', '')
-                profile.city = form.cleaned_data['city']
-                profile.postal_code = form.cleaned_data['postal_code']
-                profile.country = form.cleaned_data['country']
-                profile.save()
-                
+
                 messages.success(
                     request,
                     f"Account created for {user.username}! You can now log in."
@@ -149,89 +164,120 @@ def logout_view(request):
     # If GET request, redirect to home
     return redirect('store:home')
 
-@login_required
+def wants_json(request):
+    """
+    True for fetch() calls from the storefront, which send
+    ``Accept: application/json``.
+    """
+    return 'application/json' in request.headers.get('Accept', '')
+
+def cart_line_json(request, product, status=200, error=None):
+    """
+    The state of one cart line and the cart totals after a mutation.
+    """
+    quantity = carts.line_quantity(request, product)
+    summary = get_cart_summary(request)
+    subtotal = summary['subtotal']
+    delivery_charge = delivery_charge_for(subtotal)
+    data = {
+        'product_id': product.pk,
+        'quantity': quantity,
+        'line_total': str((product.final_price * quantity).quantize(CENT)),
+        'cart_count': summary['count'],
+        'subtotal': str(subtotal),
+        'delivery_charge': str(delivery_charge),
+        'grand_total': str(subtotal + delivery_charge),
+    }
+    if error:
+        data['error'] = error
+    return JsonResponse(data, status=status)
+
 def add_to_cart(request, product_id):
     """
-    Adds a product to the user's cart.
+    Adds a product to the cart; guests get a cookie cart. Answers fetch()
+    POSTs with JSON instead of redirecting.
     """
-    product = get_object_or_404(Product, id=product_id, available=True)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': 1}
-    )
-    
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
-        messages.success(request, f"Updated {product.name} quantity in cart!")
+    as_json = wants_json(request)
+    if as_json and request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    product = get_object_or_404(with_final_price(Product.objects.all()), id=product_id, available=True)
+    try:
+        created = carts.add_item(request, product)
+    except carts.CartFull:
+        error = "Your cart is full. Log in to add more products."
+        if as_json:
+            return cart_line_json(request, product, status=409, error=error)
+        messages.error(request, error)
     else:
-        messages.success(request, f"Added {product.name} to cart!")
-    
+        if as_json:
+            return cart_line_json(request, product)
+        if created:
+            messages.success(request, f"Added {product.name} to cart!")
+        else:
+            messages.success(request, f"Updated {product.name} quantity in cart!")
+
     return redirect(request.META.get('HTTP_REFERER', reverse('store:home')))
 
-@login_required
 def remove_from_cart(request, product_id):
     """
-    Removes a product from the user's cart.
+    Removes a product from the cart.
     """
-    product = get_object_or_404(Product, id=product_id)
-    cart = get_object_or_404(Cart, user=request.user)
-    
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product=product)
-        cart_item.delete()
+    as_json = wants_json(request)
+    if as_json and request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    product = get_object_or_404(with_final_price(Product.objects.all()), id=product_id)
+    removed = carts.remove_item(request, product)
+    if as_json:
+        if removed:
+            return cart_line_json(request, product)
+        return cart_line_json(request, product, status=404, error="Item not found in cart!")
+    if removed:
         messages.success(request, f"Removed {product.name} from cart!")
-    except CartItem.DoesNotExist:
+    else:
         messages.error(request, "Item not found in cart!")
-    
+
     return redirect('store:cart')
 
-@login_required
 def update_cart_item(request, product_id):
     """
-    Updates the quantity of a product in the cart.
+    Updates the quantity of a product in the cart; a quantity of 0 or less
+    removes it.
     """
     if request.method == 'POST':
-        product = get_object_or_404(Product, id=product_id)
-        cart = get_object_or_404(Cart, user=request.user)
-        quantity = int(request.POST.get('quantity', 1))
-        
+        as_json = wants_json(request)
+        product = get_object_or_404(with_final_price(Product.objects.all()), id=product_id)
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except ValueError:
+            quantity = 1
+
         if quantity <= 0:
+            if as_json:
+                return remove_from_cart(request, product_id)
             return redirect('store:remove_from_cart', product_id=product_id)
-        
-        try:
-            cart_item = CartItem.objects.get(cart=cart, product=product)
-            cart_item.quantity = quantity
-            cart_item.save()
+
+        updated = carts.set_quantity(request, product, quantity)
+        if as_json:
+            if updated:
+                return cart_line_json(request, product)
+            return cart_line_json(request, product, status=404, error="Item not found in cart!")
+        if updated:
             messages.success(request, f"Updated {product.name} quantity!")
-        except CartItem.DoesNotExist:
+        else:
             messages.error(request, "Item not found in cart!")
     
     return redirect('store:cart')
 
-@login_required
 def cart(request):
     """
-    Displays the user's cart contents and total price.
+    Displays the cart contents and total price.
     """
-    try:
-        cart = Cart.objects.get(user=request.user)
-        cart_items = cart.items.select_related('product').all()
-    except Cart.DoesNotExist:
-        cart_items = []
-
-    for item in cart_items:
-        final_price = item.product.get_final_price()
-        item.total_price = final_price * item.quantity
-
-    subtotal = sum(item.total_price for item in cart_items)
-    cart_count = sum(item.quantity for item in cart_items)
+    cart_items = carts.get_cart_lines(request)
+    summary = get_cart_summary(request, cart_items)
+    subtotal = summary['subtotal']
 
     # Delivery charge logic
-    delivery_charge = 0 if subtotal >= 1000 else 100
+    delivery_charge = delivery_charge_for(subtotal)
     grand_total = subtotal + delivery_charge
 
     return render(request, 'store/cart.html', {
@@ -239,27 +285,93 @@ def cart(request):
         'subtotal': subtotal,
         'delivery_charge': delivery_charge,
         'grand_total': grand_total,
-        'cart_count': cart_count,
+        'cart_count': summary['count'],
     })
 
 
+# ?sort= values for product listings -> KeysetPage key
+LISTING_SORTS = {
+    'newest': '-created_at',
+    'price': 'final_price',
+    '-price': '-final_price',
+}
+
+def parse_price(value):
+    try:
+        value = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    return value if value.is_finite() and value >= 0 else None
+
+def price_param(request, name):
+    return parse_price(request.GET.get(name, ''))
+
+def price_cache_value(value):
+    value = parse_price(value)
+    return None if value is None else f"{value.normalize():f}"
+
+# Query parameters category_detail reads, normalized for the page cache key.
+LISTING_PARAMS = {
+    'sort': lambda value: value if value in LISTING_SORTS and value != 'newest' else None,
+    'min_price': price_cache_value,
+    'max_price': price_cache_value,
+    'after': lambda value: value or None,
+    'partial': lambda value: '1' if value else None,
+}
+
+@catalog_page_cache(params=LISTING_PARAMS)
 def category_detail(request, slug):
     """
-    Displays products in a specific category.
+    Displays products in a specific category, sorted by ``?sort=`` and
+    filtered by ``?min_price=``/``?max_price=`` on the final price in SQL.
     """
-    category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category, available=True)
-    
-    # Get cart count for authenticated users
-    cart_count = 0
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_count = cart.items.aggregate(total=Sum('quantity'))['total'] or 0
-    
+    version = get_catalog_version()
+    category = cached_catalog(
+        f"category:{slug}", lambda: Category.objects.filter(slug=slug).first(), version
+    )
+    if category is None:
+        raise Http404("No Category matches the given query.")
+    sort = request.GET.get('sort')
+    if sort not in LISTING_SORTS:
+        sort = 'newest'
+    min_price, max_price = price_param(request, 'min_price'), price_param(request, 'max_price')
+
+    products = with_final_price(Product.objects.filter(category=category, available=True))
+    if min_price is not None:
+        products = products.filter(final_price__gte=min_price)
+    if max_price is not None:
+        products = products.filter(final_price__lte=max_price)
+    page = KeysetPage(products, request.GET.get('after'), key=LISTING_SORTS[sort])
+    listing = {
+        'sort': sort,
+        'min_price': min_price,
+        'max_price': max_price,
+        'listing_query': urlencode({
+            name: value for name, value in
+            (('sort', sort if sort != 'newest' else None), ('min_price', min_price), ('max_price', max_price))
+            if value is not None
+        }),
+    }
+
+    if request.GET.get('partial'):
+        return render(request, 'store/partials/category_page.html', {
+            'category': category,
+            'products': page,
+            'catalog_version': version,
+            **listing,
+        })
+
     return render(request, 'store/category_detail.html', {
         'category': category,
-        'products': products,
-        'cart_count': cart_count,
+        'products': page,
+        # Called only on a fragment cache miss, and shared by every page of
+        # the listing, so following ?after= cursors does not recount.
+        'product_count': lambda: cached_catalog(
+            f"category-count:{category.pk}:{min_price}:{max_price}", products.count, version
+        ),
+        'cart_count': get_cart_summary(request)['count'],
+        'catalog_version': version,
+        **listing,
     })
 
 @login_required
@@ -267,126 +379,35 @@ def checkout(request):
     """
     Handles the checkout process.
     """
-    # Ensure user has a profile
-    if not hasattr(request.user, 'profile'):
-        Profile.objects.create(user=request.user)
-
-    try:
-        cart = Cart.objects.get(user=request.user)
-        cart_items = cart.items.select_related('product').all()
-    except Cart.DoesNotExist:
-        messages.error(request, "Your cart is empty!")
-        return redirect('store:cart')
-
+    cart_items = get_cart_lines(request.user)
     if not cart_items:
         messages.error(request, "Your cart is empty!")
         return redirect('store:cart')
 
-    subtotal = sum(item.product.get_final_price() * item.quantity for item in cart_items)
-    delivery_charge = 0 if subtotal >= 1000 else 100
-    total = subtotal + delivery_charge
-
+    subtotal = get_cart_summary(request, cart_items)['subtotal']
+    total = subtotal + delivery_charge_for(subtotal)
 
     if request.method == 'POST':
         form = ShippingForm(request.POST)
         if form.is_valid():
-            order = Order.objects.create(
-                user=request.user,
-                full_name=form.cleaned_data['full_name'],
-                email=form.cleaned_data['email'],
-                phone_number=form.cleaned_data['phone_number'],
-                complete_address=form.cleaned_data['complete_address'],
-                city=form.cleaned_data['city'],
-                postal_code=form.cleaned_data['postal_code'],
-                country=form.cleaned_data['country'],
-                delivery_charge=delivery_charge,
-                total_price=total,
-            )
-
-            # --- SEND PROFESSIONAL CONFIRMATION EMAILS ---
-            WHATSAPP_NUMBER = "+92 300 1234567"  # ✅ Replace with your real number
-
-            subject_user = f"🧾 Order Confirmation – Order #{order.order_id}"
-
-            message_user = (
-                f"Hello {order.full_name},\n\n"
-                f"Thank you for shopping with Stationery Store!\n\n"
-                f"We’re excited to let you know that we’ve received your order.\n\n"
-                f"🛒 Order Summary:\n"
-                f"Total Amount: Rs {order.total_price:.2f}\n"
-                f"Email: {order.email}\n"
-                f"Phone: {order.phone_number}\n\n"
-                f"📦 Shipping Address:\n"
-                f"{order.complete_address}\n"
-                f"{order.city} – {order.postal_code}\n"
-                f"{order.country}\n\n"
-                f"You will receive another email once your items are shipped.\n"
-                f"If you have any questions, feel free to contact us:\n"
-                f"📧 Email: {settings.DEFAULT_FROM_EMAIL}\n"
-                f"📱 WhatsApp: {WHATSAPP_NUMBER}\n\n"
-                f"Best regards,\n"
-                f"Stationery Store Team\n"
-                f"{request.get_host()}"
-            )
-
-            subject_admin = f"📥 New Order Received – #{order.order_id}"
-
-            message_admin = (
-                f"A new order has been placed!\n\n"
-                f"Order ID: {order.order_id}\n"
-                f"Customer: {order.full_name}\n"
-                f"Email: {order.email}\n"
-                f"Phone: {order.phone_number}\n"
-                f"Total: Rs {order.total_price:.2f}\n\n"
-                f"Shipping Address:\n"
-                f"{order.complete_address}\n"
-                f"{order.city} – {order.postal_code}\n"
-                f"{order.country}\n\n"
-                f"WhatsApp Customer for Confirmation: {WHATSAPP_NUMBER}"
-            )
-
-            send_mail(
-                subject_user,
-                message_user,
-                settings.DEFAULT_FROM_EMAIL,
-                [order.email],
-                fail_silently=False,
-            )
-
-            send_mail(
-                subject_admin,
-                message_admin,
-                settings.DEFAULT_FROM_EMAIL,
-                [settings.ADMIN_EMAIL],
-                fail_silently=False,
-            )
-            # --- END EMAIL CODE ---
-
-            # Create order items
-            for item in cart_items:
-                product = item.product
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=item.quantity,
-                    price=product.price,
-                    discount_price=product.get_final_price() if product.discount_percentage > 0 else None
-                )
-
-
-            # Clear cart
-            cart_items.delete()
+            try:
+                order = place_order(request.user, form.cleaned_data, host=request.get_host())
+            except EmptyCart:
+                messages.error(request, "Your cart is empty!")
+                return redirect('store:cart')
+            except OutOfStock as e:
+                for product, requested, available in e.lines:
+                    messages.error(
+                        request,
+                        f"Only {available} of {product.name} left in stock (you asked for {requested})."
+                    )
+                return redirect('store:cart')
 
             messages.success(request, f"Order {order.order_id} placed successfully!")
             return redirect('store:order_confirmation', order_id=order.order_id)
     else:
         form = ShippingForm()
 
-    # Calculate total price per item for display
-    for item in cart_items:
-        item.total_price = item.product.get_final_price() * item.quantity
-
-
     return render(request, 'store/checkout.html', {
         'cart_items': cart_items,
         'total': total,
@@ -398,8 +419,13 @@ def order_confirmation(request, order_id):
     """
     Displays order confirmation.
     """
-    order = get_object_or_404(Order, order_id=order_id, user=request.user)
-    
+    lines = Prefetch('order_items', queryset=OrderItem.objects.order_by('id'))
+    order = Order.objects.filter(order_id=order_id, user=request.user).prefetch_related(lines).first()
+    if order is None:
+        # Links in emails sent before pk-derived order IDs use the legacy ID.
+        order = get_object_or_404(Order, legacy_order_id=order_id, user=request.user)
+        return redirect('store:order_confirmation', order_id=order.order_id)
+
     # Calculate subtotal
     subtotal = order.total_price - order.delivery_charge
 
@@ -413,8 +439,9 @@ def order_history(request):
     """
     Displays user's order history.
     """
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'store/order_history.html', {
+    orders = KeysetPage(with_item_totals(Order.objects.filter(user=request.user)), request.GET.get('after'))
+    template = 'store/partials/order_history_page.html' if request.GET.get('partial') else 'store/order_history.html'
+    return render(request, template, {
         'orders': orders,
     })
 